@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Benchmark the `hu_episode_ids_file` filter on a synthetic HuggingFace dataset.
+
+Compares the former row-wise `Dataset.filter` (every row decoded into Python) with the
+Arrow `is_in` over the `id` column used by `save_hu_dataset_locally`. The dataset carries a
+binary payload column standing in for the audio, so the row-wise variant pays for
+materializing it like it does with real audio.
+
+Usage:
+  python benchmarks/bench_hf_id_filter.py [--rows 1000000] [--keep 0.1] [--payload-bytes 256]
+"""
+import argparse
+import random
+import time
+
+from datasets import Dataset
+
+from whisper_prep.utils import episode_id_indices
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the HF episode-ID filter")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Dataset rows")
+    parser.add_argument(
+        "--keep", type=float, default=0.1, help="Fraction of ids in the allow-list"
+    )
+    parser.add_argument(
+        "--payload-bytes", type=int, default=256, help="Size of the dummy audio column"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    payload = bytes(args.payload_bytes)
+
+    ds = Dataset.from_generator(
+        lambda: ({"id": f"ep{i:08d}", "audio": payload} for i in range(args.rows))
+    )
+    allowed_ids = {f"ep{i:08d}" for i in range(args.rows) if rng.random() < args.keep}
+    print(f"{len(ds)} rows, {len(allowed_ids)} allowed ids")
+
+    start = time.perf_counter()
+    indices = episode_id_indices(ds, allowed_ids)
+    arrow_filtered = ds.select(indices)
+    arrow_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    row_filtered = ds.filter(
+        lambda example: str(example["id"]) in allowed_ids, load_from_cache_file=False
+    )
+    row_seconds = time.perf_counter() - start
+
+    assert list(arrow_filtered["id"]) == list(row_filtered["id"])
+    print("| method | seconds | rows/s |")
+    print("|---|---|---|")
+    print(f"| Dataset.filter (row-wise) | {row_seconds:.2f} | {len(ds) / row_seconds:,.0f} |")
+    print(f"| Arrow is_in on id | {arrow_seconds:.2f} | {len(ds) / arrow_seconds:,.0f} |")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Time every pipeline stage on a synthetic corpus (see `synthetic_corpus.py`) and report
+machine-readable JSON.
+
+Stages, in pipeline order:
+  generate   `generate_fold` on the sentence corpus
+  netflix    `netflix_normalize_files` on the long-form transcripts
+  segment    `DataProcessor.run` on the long-form `transcripts.tsv`
+  filter     `filter_records` on the segment records
+  hf         `pandas_to_hf_dataset` and `ljson_to_hf_dataset` on the accepted records
+
+`filter` and `hf` read the `segment` output of the same run. Each stage runs in its own
+process, so its CPU time includes the pools it starts (`RUSAGE_CHILDREN` of the runner) and
+its peak RSS is not inherited from earlier stages. Throughput is audio hours per CPU hour
+(the audio the stage covers divided by its CPU time); compare runs of the same corpus and
+machine.
+
+Usage:
+  python benchmarks/bench_pipeline.py out/bench [--hours 1] [--sentences 2000] \
+      [--n-jobs 4] [--stages segment filter] [--output results.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import time
+from pathlib import Path
+
+from synthetic_corpus import write_long_form_corpus, write_sentence_corpus
+
+STAGES = ["generate", "netflix", "segment", "filter", "hf"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages")
+    parser.add_argument("folder", type=Path, help="Work folder (corpus and outputs)")
+    parser.add_argument("--hours", type=float, default=1.0, help="Long-form audio")
+    parser.add_argument("--minutes-per-file", type=float, default=20.0)
+    parser.add_argument("--cues-per-minute", type=float, default=12.0)
+    parser.add_argument("--transcript-format", choices=["srt", "vtt"], default="srt")
+    parser.add_argument("--sentences", type=int, default=2000)
+    parser.add_argument("--speakers", type=int, default=50)
+    parser.add_argument("--n-jobs", type=int, default=4)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, help="Write the JSON here (default stdout)")
+    return parser.parse_args()
+
+
+def _cpu_seconds(usage) -> float:
+    return usage.ru_utime + usage.ru_stime
+
+
+def _stage_main(stage, args, corpus, connection) -> None:
+    from whisper_prep.dataset.convert import (
+        ljson_to_hf_dataset,
+        ljson_to_pandas,
+        pandas_to_hf_dataset,
+    )
+    from whisper_prep.dataset.filter import filter_records
+    from whisper_prep.generation.data_processor import DataProcessor
+    from whisper_prep.generation.generate import generate_fold
+    from whisper_prep.utils import netflix_normalize_files
+
+    out = Path(args.folder, "out")
+    segment_dir = Path(out, "segment")
+    result = {}
+    if stage == "generate":
+        generate_fold(
+            tsv_paths=[corpus["sentences"]["tsv"]],
+            clips_folders=[corpus["sentences"]["clips_dir"]],
+            partials=[1.0],
+            out_folder=Path(out, "generate"),
+            maintain_speaker_chance=0.5,
+            n_samples_per_srt=16,
+            normalize_text=True,
+            overlap_chance=0.5,
+            max_overlap_chance=0.2,
+            max_overlap_duration=0.2,
+            audio_format="mp3",
+            n_jobs=args.n_jobs,
+            seed=args.seed,
+        )
+    elif stage == "netflix":
+        srt_paths = sorted(Path(corpus["long_form"]["transcript_dir"]).iterdir())
+        netflix_normalize_files(
+            srt_paths, cache_dir=Path(out, "netflix_cache"), n_jobs=args.n_jobs
+        )
+    elif stage == "segment":
+        processor = DataProcessor(
+            audio_dir=corpus["long_form"]["audio_dir"],
+            transcript_dir=corpus["long_form"]["transcript_dir"],
+            transcripts_tsv=corpus["long_form"]["tsv"],
+            output=Path(segment_dir, "data.ljson"),
+            dump_dir=Path(segment_dir, "dump"),
+            n_jobs=args.n_jobs,
+            duration_cache=Path(out, "durations.json"),
+        )
+        processor.run()
+    elif stage == "filter":
+        result = filter_records(
+            Path(segment_dir, "data.ljson"), segment_dir, Path(segment_dir, "accepted.ljson")
+        )
+    elif stage == "hf":
+        accepted = Path(segment_dir, "accepted.ljson")
+        begin = time.perf_counter()
+        frame = ljson_to_pandas(accepted)
+        frame["audio"] = frame["audio"].apply(lambda audio: audio["path"])
+        pandas_to_hf_dataset(frame)
+        result["pandas_to_hf_dataset_seconds"] = time.perf_counter() - begin
+        begin = time.perf_counter()
+        ljson_to_hf_dataset(accepted)
+        result["ljson_to_hf_dataset_seconds"] = time.perf_counter() - begin
+
+    connection.send(
+        {
+            "result": result,
+            # KiB on Linux
+            "peak_rss_mb": max(
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+            )
+            / 1024,
+        }
+    )
+
+
+def run_stage(stage, args, corpus) -> dict:
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(
+        target=_stage_main, args=(stage, args, corpus, sender)
+    )
+    cpu_before = _cpu_seconds(resource.getrusage(resource.RUSAGE_CHILDREN))
+    begin = time.perf_counter()
+    process.start()
+    sender.close()
+    try:
+        report = receiver.recv()
+    except EOFError:  # the stage died before reporting
+        report = {}
+    process.join()
+    wall = time.perf_counter() - begin
+    cpu = _cpu_seconds(resource.getrusage(resource.RUSAGE_CHILDREN)) - cpu_before
+    if process.exitcode != 0:
+        raise RuntimeError(f"Stage {stage} failed with exit code {process.exitcode}")
+
+    audio_seconds = corpus[
+        "sentences" if stage == "generate" else "long_form"
+    ]["audio_seconds"]
+    return {
+        "stage": stage,
+        "wall_seconds": wall,
+        "cpu_seconds": cpu,
+        "audio_hours": audio_seconds / 3600,
+        "audio_hours_per_cpu_hour": audio_seconds / cpu if cpu else None,
+        "realtime_factor": audio_seconds / wall,
+        "peak_rss_mb": report.get("peak_rss_mb"),
+        **report.get("result", {}),
+    }
+
+
+def main():
+    args = parse_args()
+    if {"filter", "hf"} & set(args.stages) and "segment" not in args.stages:
+        sys.exit("The filter and hf stages need the segment stage")
+    corpus_dir = Path(args.folder, "corpus")
+    shutil.rmtree(Path(args.folder, "out"), ignore_errors=True)
+    corpus = {
+        "long_form": write_long_form_corpus(
+            Path(corpus_dir, "long_form"),
+            hours=args.hours,
+            minutes_per_file=args.minutes_per_file,
+            cues_per_minute=args.cues_per_minute,
+            transcript_format=args.transcript_format,
+            seed=args.seed,
+        ),
+        "sentences": write_sentence_corpus(
+            Path(corpus_dir, "sentences"),
+            n_sentences=args.sentences,
+            n_speakers=args.speakers,
+            seed=args.seed,
+        ),
+    }
+
+    stages = []
+    for stage in STAGES:
+        if stage in args.stages:
+            stages.append(run_stage(stage, args, corpus))
+            print(f"{stage}: {stages[-1]['wall_seconds']:.1f} s", file=sys.stderr)
+
+    report = {
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "args": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+        "corpus": corpus,
+        "stages": stages,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
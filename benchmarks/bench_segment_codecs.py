@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark the segment codecs (`audio_format`) on synthetic speech-like audio.
+
+Every codec writes the same 30-second, 16 kHz mono segments through
+`DataProcessor._save_segment_audio` (the code path used for `dump/`) and reads them back
+with soundfile, as the HF `Audio` feature does for training loaders. Speeds are multiples
+of real time on one core.
+
+Usage:
+  python benchmarks/bench_segment_codecs.py [--minutes 10] [--formats mp3 flac opus wav]
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+import torch
+
+from whisper_prep.audio.io import AUDIO_FORMATS
+from whisper_prep.generation.data_processor import (
+    DURATION,
+    SAMPLE_RATE,
+    DataProcessor,
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark segment codecs")
+    parser.add_argument("--minutes", type=float, default=10, help="Audio to encode")
+    parser.add_argument(
+        "--formats", nargs="+", default=list(AUDIO_FORMATS), choices=list(AUDIO_FORMATS)
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def synthetic_speech(seconds: float, seed: int) -> np.ndarray:
+    """Harmonic 'voiced' bursts with a drifting pitch, syllable-rate envelope and noise."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    pitch = 120 + 40 * np.sin(2 * np.pi * 0.3 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 12))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) ** 2
+    audio = 0.3 * envelope * voiced + 0.01 * rng.standard_normal(t.size)
+    return (audio / np.abs(audio).max() * 0.9).astype(np.float32)
+
+
+def main():
+    args = parse_args()
+    audio = torch.from_numpy(synthetic_speech(args.minutes * 60, args.seed))
+    seconds = audio.size(0) / SAMPLE_RATE
+    starts = range(0, int(seconds * 1000) - DURATION + 1, DURATION)
+
+    print(f"{len(starts)} segments of {DURATION // 1000} s")
+    print("| codec | encode (x realtime) | decode (x realtime) | MB per hour |")
+    print("|---|---|---|---|")
+    for audio_format in args.formats:
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [str(Path(tmp, f"{start}.{audio_format}")) for start in starts]
+
+            begin = time.perf_counter()
+            for start, path in zip(starts, paths):
+                DataProcessor._save_segment_audio(audio, start, start + DURATION, path)
+            encode_seconds = time.perf_counter() - begin
+
+            begin = time.perf_counter()
+            for path in paths:
+                sf.read(path, dtype="float32")
+            decode_seconds = time.perf_counter() - begin
+
+            encoded_seconds = len(paths) * DURATION / 1000
+            n_bytes = sum(Path(path).stat().st_size for path in paths)
+            print(
+                f"| {audio_format} | {encoded_seconds / encode_seconds:,.0f} "
+                f"| {encoded_seconds / decode_seconds:,.0f} "
+                f"| {n_bytes / encoded_seconds * 3600 / 2**20:,.1f} |"
+            )
+
+
+if __name__ == "__main__":
+    main()
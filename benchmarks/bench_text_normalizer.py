@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark `normalize_text` on Common Voice sentences.
+
+Reads the `sentence` column of one or more Common Voice TSVs (e.g. `validated.tsv`),
+repeats them up to `--sentences`, and reports sentences per second on one core. With
+`--compare-ref`, the `text_normalizer` module of that git revision is benchmarked on the
+same sentences and every output is checked to be identical.
+
+Usage:
+  python benchmarks/bench_text_normalizer.py cv-corpus/de/validated.tsv \
+      [--sentences 1000000] [--compare-ref baseline]
+"""
+import argparse
+import csv
+import itertools
+import subprocess
+import sys
+import time
+import types
+from pathlib import Path
+
+from whisper_prep.generation import text_normalizer
+
+MODULE_PATH = "src/whisper_prep/generation/text_normalizer.py"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the text normalizer")
+    parser.add_argument("tsv", nargs="+", type=Path, help="Common Voice TSV files")
+    parser.add_argument("--sentences", type=int, default=1_000_000)
+    parser.add_argument(
+        "--compare-ref", default=None, help="Git revision to compare against"
+    )
+    return parser.parse_args()
+
+
+def read_sentences(tsv_paths, n_sentences):
+    sentences = []
+    for tsv_path in tsv_paths:
+        with open(tsv_path, encoding="utf-8", newline="") as f:
+            reader = csv.DictReader(f, delimiter="\t", quoting=csv.QUOTE_NONE)
+            sentences.extend(row["sentence"] for row in reader if row.get("sentence"))
+    if not sentences:
+        sys.exit("No sentences found")
+    return list(itertools.islice(itertools.cycle(sentences), n_sentences))
+
+
+def load_module_at(ref):
+    source = subprocess.run(
+        ["git", "show", f"{ref}:{MODULE_PATH}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=Path(__file__).resolve().parent,
+    ).stdout
+    module = types.ModuleType(f"text_normalizer_{ref}")
+    exec(compile(source, f"{ref}:{MODULE_PATH}", "exec"), module.__dict__)
+    return module
+
+
+def run(normalize, sentences):
+    start = time.perf_counter()
+    outputs = [normalize(sentence) for sentence in sentences]
+    return outputs, time.perf_counter() - start
+
+
+def main():
+    args = parse_args()
+    sentences = read_sentences(args.tsv, args.sentences)
+    print(f"{len(sentences)} sentences ({len(set(sentences))} unique)")
+
+    outputs, seconds = run(text_normalizer.normalize_text, sentences)
+    print(f"current: {seconds:.1f} s, {len(sentences) / seconds:,.0f} sentences/s")
+
+    if args.compare_ref:
+        reference = load_module_at(args.compare_ref)
+        expected, ref_seconds = run(reference.normalize_text, sentences)
+        print(
+            f"{args.compare_ref}: {ref_seconds:.1f} s, "
+            f"{len(sentences) / ref_seconds:,.0f} sentences/s "
+            f"({ref_seconds / seconds:.1f}x slower)"
+        )
+        mismatches = sum(a != b for a, b in zip(outputs, expected))
+        print(f"{mismatches} outputs differ")
+        if mismatches:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
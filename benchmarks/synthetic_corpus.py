@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Synthetic corpora of controlled size for the benchmarks, generated offline.
+
+- Long-form: tone/noise audio files with SRT or VTT transcripts of a chosen cue density and
+  a `transcripts.tsv` (input of `transcripts_tsv` / `DataProcessor`).
+- Sentences: short clips of several speakers and a Common Voice style `sentences.tsv`
+  (input of `generate_fold`).
+
+Audio is a sine tone per cue (pitch varies with the cue) over low noise, with silence
+between cues, so VAD and codecs see speech-like structure. Texts mix words, numbers,
+abbreviations and occasional repetitions, so text normalization has work to do.
+Everything only depends on the seed.
+
+Usage:
+  python benchmarks/synthetic_corpus.py out/corpus [--hours 1] [--sentences 2000]
+"""
+import argparse
+import csv
+import random
+from pathlib import Path
+from typing import List, Union
+
+import numpy as np
+import soundfile as sf
+
+from whisper_prep.subtitling.srt import Caption, generate_srt
+
+SAMPLE_RATE = 16000
+WORDS_PER_SECOND = 2.5
+VOCABULARY = (
+    "heute gehen wir an den See und baden dort wenn die Sonne scheint aber morgen "
+    "regnet es in Zürich Bern Basel wieder der Zug fährt um Uhr ab Bahnhof mit ca. "
+    "z.B. bzw. Fr. CHF € % Kilometer pro Stunde Nr. Dr. Müller sagte dass alles gut sei"
+).split()
+
+
+def synthetic_text(rng: random.Random, n_words: int) -> str:
+    words = []
+    while len(words) < n_words:
+        roll = rng.random()
+        if roll < 0.1:
+            words.append(f"{rng.randint(1, 99999)}")
+        elif roll < 0.13:
+            words.append(f"{rng.randint(0, 999)},{rng.randint(0, 99):02d}")
+        elif roll < 0.15 and words:
+            words.extend(words[-2:])  # disfluent repetition
+        else:
+            words.append(rng.choice(VOCABULARY))
+    text = " ".join(words[:n_words])
+    return text[0].upper() + text[1:] + "."
+
+
+def _tone(rng: random.Random, seconds: float) -> np.ndarray:
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    pitch = rng.uniform(90, 250)
+    envelope = np.clip(np.sin(np.pi * t / max(seconds, 1e-3)), 0, None)
+    return 0.4 * envelope * np.sin(2 * np.pi * pitch * t)
+
+
+def _write_audio(path: Path, audio: np.ndarray, rng: random.Random) -> None:
+    noise = np.random.default_rng(rng.randrange(2**32)).standard_normal(audio.size)
+    sf.write(str(path), (audio + 0.01 * noise).astype(np.float32), SAMPLE_RATE)
+
+
+def _write_vtt(captions: List[Caption], path: Path) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("WEBVTT\n\n")
+        for caption in captions:
+            f.write(
+                f"{caption.start_timestamp()} --> {caption.end_timestamp()}\n"
+                f"{caption.text}\n\n"
+            )
+
+
+def write_long_form_corpus(
+    folder: Union[str, Path],
+    hours: float = 1.0,
+    minutes_per_file: float = 20.0,
+    cues_per_minute: float = 12.0,
+    transcript_format: str = "srt",
+    audio_format: str = "wav",
+    language: str = "de",
+    seed: int = 42,
+) -> dict:
+    """
+    Write `audio/<id>.<audio_format>`, `transcripts/<id>.<transcript_format>` and
+    `transcripts.tsv` below *folder*. Returns the corpus summary (files, cues, seconds).
+    """
+    rng = random.Random(seed)
+    folder = Path(folder)
+    audio_dir = Path(folder, "audio")
+    transcript_dir = Path(folder, "transcripts")
+    audio_dir.mkdir(parents=True, exist_ok=True)
+    transcript_dir.mkdir(parents=True, exist_ok=True)
+
+    n_files = max(1, round(hours * 60 / minutes_per_file))
+    file_seconds = minutes_per_file * 60
+    slot = 60 / cues_per_minute
+    rows = []
+    n_cues = 0
+    for index in range(n_files):
+        file_id = f"longform{index:05d}"
+        audio = np.zeros(int(file_seconds * SAMPLE_RATE))
+        captions = []
+        for slot_start in np.arange(0, file_seconds - slot, slot):
+            duration = rng.uniform(0.4, 0.95) * slot
+            start = float(slot_start) + rng.uniform(0, slot - duration)
+            tone = _tone(rng, duration)
+            first = int(start * SAMPLE_RATE)
+            audio[first : first + tone.size] += tone
+            n_words = max(1, round(duration * WORDS_PER_SECOND))
+            captions.append(Caption(start, start + duration, synthetic_text(rng, n_words)))
+        n_cues += len(captions)
+
+        audio_path = Path(audio_dir, f"{file_id}.{audio_format}")
+        transcript_path = Path(transcript_dir, f"{file_id}.{transcript_format}")
+        _write_audio(audio_path, audio, rng)
+        if transcript_format == "vtt":
+            _write_vtt(captions, transcript_path)
+        else:
+            generate_srt(captions, transcript_path)
+        rows.append(
+            {
+                "srt_path": str(transcript_path),
+                "audio_path": str(audio_path),
+                "id": file_id,
+                "language": language,
+            }
+        )
+
+    tsv_path = Path(folder, "transcripts.tsv")
+    with open(tsv_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]), delimiter="\t")
+        writer.writeheader()
+        writer.writerows(rows)
+    return {
+        "tsv": str(tsv_path),
+        "audio_dir": str(audio_dir),
+        "transcript_dir": str(transcript_dir),
+        "files": n_files,
+        "cues": n_cues,
+        "audio_seconds": n_files * file_seconds,
+    }
+
+
+def write_sentence_corpus(
+    folder: Union[str, Path],
+    n_sentences: int = 2000,
+    n_speakers: int = 50,
+    n_distinct_sentences: int = 500,
+    seed: int = 42,
+) -> dict:
+    """
+    Write `clips/<n>.wav` and `sentences.tsv` (`path`, `sentence`, `client_id`) below
+    *folder*. Sentences are drawn from *n_distinct_sentences* prompts, as Common Voice
+    reads the same prompts with many speakers. Returns the corpus summary.
+    """
+    rng = random.Random(seed)
+    folder = Path(folder)
+    clips_dir = Path(folder, "clips")
+    clips_dir.mkdir(parents=True, exist_ok=True)
+    prompts = [synthetic_text(rng, rng.randint(4, 14)) for _ in range(n_distinct_sentences)]
+
+    rows = []
+    audio_seconds = 0.0
+    for index in range(n_sentences):
+        sentence = rng.choice(prompts)
+        seconds = len(sentence.split()) / WORDS_PER_SECOND + rng.uniform(0.5, 1.5)
+        clip = np.zeros(int(seconds * SAMPLE_RATE))
+        tone = _tone(rng, seconds - 0.5)
+        clip[int(0.25 * SAMPLE_RATE) : int(0.25 * SAMPLE_RATE) + tone.size] = tone
+        name = f"{index:07d}.wav"
+        _write_audio(Path(clips_dir, name), clip, rng)
+        audio_seconds += clip.size / SAMPLE_RATE
+        rows.append(
+            {
+                "path": name,
+                "sentence": sentence,
+                "client_id": f"speaker{rng.randrange(n_speakers):04d}",
+            }
+        )
+
+    tsv_path = Path(folder, "sentences.tsv")
+    with open(tsv_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]), delimiter="\t")
+        writer.writeheader()
+        writer.writerows(rows)
+    return {
+        "tsv": str(tsv_path),
+        "clips_dir": str(clips_dir),
+        "sentences": n_sentences,
+        "audio_seconds": audio_seconds,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Write a synthetic benchmark corpus")
+    parser.add_argument("folder", type=Path)
+    parser.add_argument("--hours", type=float, default=1.0, help="Long-form audio")
+    parser.add_argument("--minutes-per-file", type=float, default=20.0)
+    parser.add_argument("--cues-per-minute", type=float, default=12.0)
+    parser.add_argument("--transcript-format", choices=["srt", "vtt"], default="srt")
+    parser.add_argument("--audio-format", choices=["wav", "flac"], default="wav")
+    parser.add_argument("--sentences", type=int, default=2000)
+    parser.add_argument("--speakers", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    long_form = write_long_form_corpus(
+        Path(args.folder, "long_form"),
+        hours=args.hours,
+        minutes_per_file=args.minutes_per_file,
+        cues_per_minute=args.cues_per_minute,
+        transcript_format=args.transcript_format,
+        audio_format=args.audio_format,
+        seed=args.seed,
+    )
+    sentences = write_sentence_corpus(
+        Path(args.folder, "sentences"),
+        n_sentences=args.sentences,
+        n_speakers=args.speakers,
+        seed=args.seed,
+    )
+    print(f"Long-form: {long_form}")
+    print(f"Sentences: {sentences}")
+
+
+if __name__ == "__main__":
+    main()
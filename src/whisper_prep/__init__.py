@@ -1,3 +1,5 @@
+import os
+import socket
 from pathlib import Path
 import yaml
 
@@ -6,154 +8,108 @@ from whisper_prep.generation.data_processor import DataProcessor
 from whisper_prep.generation.generate import generate_fold_from_yaml
 from whisper_prep.utils import (
     parse_args,
-    get_compression_ratio,
-    is_french,
-    is_english,
     netflix_normalize_all_srts_in_folder,
     save_hu_dataset_locally,
     netflix_normalize_file,
 )
-from whisper_prep.dataset.convert import ljson_to_pandas, pandas_to_hf_dataset
-import csv
-from tqdm import tqdm
-
-
-def main(config=None):
+from whisper_prep.instrumentation import configure, span, write_run_report
+from whisper_prep.metrics import start_metrics, stop_metrics
+from whisper_prep.pipeline import run_pipeline
+from whisper_prep.profiling import finish_profiling, profiled, start_profiling
+from whisper_prep.sharding import merge_shards, shard_folder, shard_spec
+
+__all__ = [
+    "DataProcessor",
+    "generate_fold_from_yaml",
+    "main",
+    "netflix_normalize_all_srts_in_folder",
+    "netflix_normalize_file",
+    "save_hu_dataset_locally",
+]
+
+
+def main(config=None, command="run", force=False):
     if config is None:
         args = parse_args()
         with open(args.config, "r") as config_file:
             config = yaml.safe_load(config_file)
+        command = args.command
+        force = args.force
+        if args.num_shards is not None:
+            config["num_shards"] = args.num_shards
+        if args.shard_index is not None:
+            config["shard_index"] = args.shard_index
+        if args.profile is not None:
+            config["profile"] = args.profile
+        if args.profile_fraction is not None:
+            config["profile_fraction"] = args.profile_fraction
 
     out_folder_base = config["out_folder_base"]
     dataset_name = config["dataset_name"]
     split_name = config["split_name"]
 
     out_folder = Path(out_folder_base, dataset_name, split_name)
-    out_folder.mkdir(parents=True, exist_ok=True)
-
-    config["out_folder"] = out_folder
-
-    hu_names = config.get("hu_datasets")
-    transcripts_tsv = config.get("transcripts_tsv")
-
-    # Setup paths and folders
-    audio_dir = Path(out_folder, "audios")
-    audio_dir.mkdir(parents=True, exist_ok=True)
-    transcript_dir = Path(out_folder, "transcripts")
-    transcript_dir.mkdir(parents=True, exist_ok=True)
-    output_dir = Path(out_folder, "created_dataset")
-    output_file = Path(output_dir, "data.ljson")
-    dump_dir = Path(output_dir, "dump")
-    output_dir.mkdir(parents=True, exist_ok=True)
-
-    # Step 1: download HF dataset assets (audio + real SRT or sentence TSV) if requested
-    sentence_tsvs = []
-    if hu_names:
-        sentence_tsvs = save_hu_dataset_locally(config, audio_dir, transcript_dir)
-
-    # Step 2: synthesize SRTs from sentences only when needed
-    if not transcripts_tsv:
-        # HF sentence-only datasets → generate SRTs from HF-derived TSVs
-        if sentence_tsvs:
-            config["tsv_paths"] = sentence_tsvs
-            config["clips_folders"] = [str(audio_dir)] * len(sentence_tsvs)
-            config["partials"] = config.get("partials", [1.0] * len(sentence_tsvs))
-            generate_fold_from_yaml(config)
-        # Local sentence-TSV inputs (no HF) → generate SRTs from sentences
-        elif not hu_names:
-            generate_fold_from_yaml(config)
-
-    # Get filter_words for Netflix normalization and DataProcessor
-    filter_words = config.get("filter_words", [])
-    
-    # Step 3: Netflix-style SRT normalization (optional)
-    if config.get("netflix_normalize", False):
-        if transcripts_tsv:
-            with open(transcripts_tsv, encoding="utf-8") as tsvfile:
-                reader = csv.DictReader(tsvfile, delimiter="\t")
-                for row in reader:
-                    netflix_normalize_file(row["srt_path"], skip_words=filter_words)
-        else:
-            netflix_normalize_all_srts_in_folder(transcript_dir, skip_words=filter_words)
-    
-    # Step 4: segment & timestamp via DataProcessor
-    dp = DataProcessor(
-        audio_dir=audio_dir,
-        transcript_dir=transcript_dir,
-        output=output_file,
-        dump_dir=dump_dir,
-        cut_initial_audio=config.get("cut_initial_audio", False),
-        filter_segment_words=filter_words,
-        transcripts_tsv=transcripts_tsv,
-    )
-    dp.run()
-
-    df_dataframe = ljson_to_pandas(json_path=output_file)
-    print(f"Loaded {len(df_dataframe)} samples")
 
-    # Basic filtering on text length and compression ratio
-    high_compression = df_dataframe["text"].apply(get_compression_ratio) >= 2.4
-    few_words = df_dataframe["text"].str.split().str.len() <= 8
-    bad_idx = high_compression | few_words
-    if bad_idx.any():
-        print(f"Found {bad_idx.sum()} problematic samples:")
-        df_dataframe[bad_idx].to_csv(Path(out_folder, "bad_examples.csv"), sep="\t")
-        df_dataframe = df_dataframe[~bad_idx]
-
-    # Filter out French if requested
-    if config.get("filter_french", False):
-        french_idx = df_dataframe["text"].apply(is_french)
-        if french_idx.any():
-            df_dataframe[french_idx].to_csv(
-                Path(out_folder, "french_examples.csv"), sep="\t"
-            )
-            df_dataframe = df_dataframe[~french_idx]
-    
-    # Filter out English if requested
-    if config.get("filter_english", False):
-        english_idx = df_dataframe["text"].apply(is_english)
-        if english_idx.any():
-            df_dataframe[english_idx].to_csv(
-                Path(out_folder, "english_examples.csv"), sep="\t"
-            )
-            df_dataframe = df_dataframe[~english_idx]
-
-    # Filter out chunks with certain words if specified
-    if "filter_words" in config:
-        for word in config["filter_words"]:
-            word_idx = df_dataframe["text"].str.contains(
-                word, case=False, regex=False, na=False
-            )
-            if word_idx.any():
-                print(f"Filtering out {word} from dataset")
-                df_dataframe[word_idx].to_csv(
-                    Path(out_folder, f"filtered_{word}_examples.csv"), sep="\t"
-                )
-                df_dataframe = df_dataframe[~word_idx]
+    if command == "merge":
+        hf_dataset = merge_shards(out_folder, split_name)
+        if hf_dataset is not None and config.get("upload_to_hu", False):
+            hf_dataset.push_to_hub(config["hu_repo"], private=config["hu_private"])
+        return
+
+    # Each shard works in its own folder below out_folder; `merge` combines them.
+    num_shards, shard_index = shard_spec(config)
+    # With a work queue all workers share out_folder and lease units dynamically.
+    work_queue = config.get("work_queue")
+    if work_queue and (num_shards > 1 or config.get("hu_datasets")):
+        raise ValueError(
+            "work_queue cannot be combined with num_shards > 1 or hu_datasets"
+        )
+    if num_shards > 1:
+        out_folder = shard_folder(out_folder, num_shards, shard_index)
+    out_folder.mkdir(parents=True, exist_ok=True)
 
-    # Hard safety check: no filtered words should remain in final data.
-    if "filter_words" in config:
-        residual_idx = None
-        for word in config["filter_words"]:
-            word_idx = df_dataframe["text"].str.contains(
-                word, case=False, regex=False, na=False
-            )
-            residual_idx = word_idx if residual_idx is None else (residual_idx | word_idx)
-        if residual_idx is not None and residual_idx.any():
-            residual_path = Path(out_folder, "residual_filtered_words_examples.csv")
-            df_dataframe[residual_idx].to_csv(residual_path, sep="\t")
-            raise ValueError(
-                f"Filtered words still present in final dataset. See: {residual_path}"
+    # Per-stage times and resources of this run (and its pool workers) go to a run
+    # report, progress to live metrics. Work-queue workers share out_folder, so each of
+    # them writes its own files.
+    run_suffix = f".{socket.gethostname()}-{os.getpid()}" if work_queue else ""
+    configure(out_folder)
+    metrics_interval = config.get("metrics_interval", 30)
+    if metrics_interval:
+        start_metrics(
+            out_folder,
+            interval=metrics_interval,
+            prometheus_path=config.get("metrics_textfile")
+            or Path(out_folder, f"metrics{run_suffix}.prom"),
+            jsonl_path=Path(out_folder, f"metrics{run_suffix}.jsonl"),
+        )
+    profile = config.get("profile")
+    if profile:
+        start_profiling(
+            out_folder,
+            mode="cprofile" if profile is True else profile,
+            fraction=config.get("profile_fraction", 1.0),
+        )
+    try:
+        with span("main"), profiled():
+            # `run` is every stage, a stage command runs it and the stages it needs.
+            run_pipeline(
+                config,
+                out_folder,
+                num_shards,
+                shard_index,
+                target=None if command == "run" else command,
+                force=force,
             )
-
-    # Convert to HuggingFace dataset and save
-    hf_dataset = pandas_to_hf_dataset(
-        train_meta_file=df_dataframe, split_name=split_name
-    )
-    hf_folder = Path(out_folder, "hf")
-    hf_folder.mkdir(parents=True, exist_ok=True)
-    hf_dataset.save_to_disk(str(hf_folder))
-
-    # Upload to HuggingFace hub if configured
-    if config.get("upload_to_hu", False):
-        hf_dataset.push_to_hub(config["hu_repo"], private=config["hu_private"])
+    finally:
+        stop_metrics()
+        write_run_report(
+            Path(out_folder, f"run_report{run_suffix}.json"),
+            extra={
+                "command": command,
+                "num_shards": num_shards,
+                "shard_index": shard_index,
+            },
+        )
+        profiles = finish_profiling()
+        if profiles is not None:
+            print(f"Profiles written to {profiles.parent}")
@@ -1,9 +1,42 @@
+import json
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Union
+from typing import Dict, List, Optional, Union
 
+import numpy as np
+import soundfile as sf
 from pydub import AudioSegment, effects
 
 
+# Codecs for generated long-form audio (exported by pydub) and the 30-second segments.
+# Values are the soundfile (format, subtype) used for segments; MP3 goes through torchaudio.
+AUDIO_FORMATS = {
+    "mp3": None,
+    "flac": ("FLAC", "PCM_16"),
+    "opus": ("OGG", "OPUS"),
+    "wav": ("WAV", "PCM_16"),
+}
+
+
+def check_audio_format(audio_format: str) -> str:
+    if audio_format not in AUDIO_FORMATS:
+        raise ValueError(
+            f"Unsupported audio format: {audio_format}. "
+            f"Use one of {', '.join(AUDIO_FORMATS)}."
+        )
+    return audio_format
+
+
+def write_audio(
+    path: Union[str, Path], samples: np.ndarray, sample_rate: int, audio_format: str
+) -> None:
+    """Write float *samples* in [-1, 1) with soundfile in one of the non-MP3 `AUDIO_FORMATS`."""
+    format, subtype = AUDIO_FORMATS[check_audio_format(audio_format)]
+    sf.write(str(path), samples, sample_rate, format=format, subtype=subtype)
+
+
 def read_audio(
     path: Union[str, Path], resample_rate: Optional[int] = None, normalize: bool = True
 ) -> AudioSegment:
@@ -23,3 +56,83 @@ def save_audio_segment(
     audio_segment: AudioSegment, path: Union[str, Path], format: str
 ) -> None:
     audio_segment.export(path, format=format)
+
+
+def probe_duration(path: Union[str, Path]) -> Optional[float]:
+    """
+    Duration in seconds from the file header (soundfile), falling back to `ffprobe` for
+    containers libsndfile cannot read. Nothing is decoded. Returns None if both fail.
+    """
+    try:
+        return sf.info(str(path)).duration
+    except Exception:
+        pass
+    try:
+        result = subprocess.run(
+            [
+                "ffprobe",
+                "-v",
+                "error",
+                "-show_entries",
+                "format=duration",
+                "-of",
+                "default=noprint_wrappers=1:nokey=1",
+                str(path),
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return float(result.stdout.strip())
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+
+
+class DurationCache:
+    """
+    Probed audio durations, optionally persisted as JSON at *path*. Entries are keyed by
+    file path and invalidated when the file's size or mtime changes.
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = None) -> None:
+        self.path = Path(path) if path else None
+        self.entries: Dict[str, list] = {}
+        if self.path and self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def _signature(path: str) -> list:
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def durations(
+        self, paths: List[Union[str, Path]], n_threads: int = 16
+    ) -> List[Optional[float]]:
+        """Durations of *paths*; uncached files are probed in *n_threads* threads."""
+        paths = [str(path) for path in paths]
+
+        def lookup(path: str) -> Optional[float]:
+            try:
+                signature = self._signature(path)
+            except OSError:
+                return None
+            entry = self.entries.get(path)
+            if entry is not None and entry[:2] == signature:
+                return entry[2]
+            duration = probe_duration(path)
+            self.entries[path] = signature + [duration]
+            return duration
+
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            durations = list(executor.map(lookup, paths))
+        self.save()
+        return durations
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,192 @@
+import os
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+from whisper_prep.audio.io import probe_duration
+from whisper_prep.executor import worker_threads
+
+SAMPLE_RATE = 16000
+# Outputs (each an open encoder and file) per ffmpeg process.
+MAX_OUTPUTS = 32
+
+# (segment_start_ms, segment_end_ms, output_path)
+SegmentPlan = List[Tuple[int, int, str]]
+
+
+def _ffmpeg_trim_command(
+    source_path: Union[str, Path],
+    segments: SegmentPlan,
+    sample_rate: int,
+    threads: int = 1,
+    seek_ms: int = 0,
+) -> List[str]:
+    """
+    One decode of *source_path*, resampled to mono *sample_rate* like `load_audio`, split
+    into one `atrim` branch per segment. Sample indices match the tensor slices of
+    `DataProcessor._save_segment_audio`. With *seek_ms* the input starts there, which is
+    exact for the PCM WAV `write_segments_ffmpeg` decodes long sources to.
+    """
+    offset = int(seek_ms * sample_rate / 1000)
+    labels = [f"[s{i}]" for i in range(len(segments))]
+    graph = [
+        f"[0:a]aformat=sample_fmts=s16:sample_rates={sample_rate}:channel_layouts=mono,"
+        f"asplit={len(segments)}{''.join(labels)}"
+    ]
+    outputs = []
+    for i, (start_ms, end_ms, path) in enumerate(segments):
+        start = int(start_ms * sample_rate / 1000) - offset
+        end = int(end_ms * sample_rate / 1000) - offset
+        graph.append(
+            f"{labels[i]}atrim=start_sample={start}:end_sample={end},"
+            f"asetpts=PTS-STARTPTS[o{i}]"
+        )
+        outputs += ["-map", f"[o{i}]", str(path)]
+    seek = ["-ss", f"{seek_ms / 1000:.3f}"] if seek_ms else []
+    return [
+        "ffmpeg",
+        "-nostdin",
+        "-y",
+        "-v",
+        "error",
+        "-threads",
+        str(threads),
+        "-filter_complex_threads",
+        str(threads),
+        *seek,
+        "-i",
+        str(source_path),
+        "-filter_complex",
+        ";".join(graph),
+        *outputs,
+    ]
+
+
+def _ffmpeg_decode_command(
+    source_path: Union[str, Path],
+    wav_path: Union[str, Path],
+    sample_rate: int,
+    threads: int,
+) -> List[str]:
+    """Decode *source_path* to mono *sample_rate* PCM, the format of the trim graph."""
+    return [
+        "ffmpeg",
+        "-nostdin",
+        "-y",
+        "-v",
+        "error",
+        "-threads",
+        str(threads),
+        "-i",
+        str(source_path),
+        "-af",
+        f"aformat=sample_fmts=s16:sample_rates={sample_rate}:channel_layouts=mono",
+        "-c:a",
+        "pcm_s16le",
+        str(wav_path),
+    ]
+
+
+def _ffmpeg_copy_command(source_path: Union[str, Path], segments: SegmentPlan) -> List[str]:
+    """Cut an MP3 *source_path* without re-encoding. Cuts snap to MP3 frame boundaries
+    (about 26 ms), and the source's sample rate and channels are kept."""
+    outputs = []
+    for start_ms, end_ms, path in segments:
+        outputs += [
+            "-map",
+            "0:a",
+            "-c",
+            "copy",
+            "-ss",
+            f"{start_ms / 1000:.3f}",
+            "-to",
+            f"{end_ms / 1000:.3f}",
+            str(path),
+        ]
+    return ["ffmpeg", "-nostdin", "-y", "-v", "error", "-i", str(source_path), *outputs]
+
+
+def _has_audio(path: Union[str, Path]) -> bool:
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return False
+    return bool(probe_duration(path))
+
+
+def _run_ffmpeg(
+    command: List[str], source_path: Union[str, Path], segments: SegmentPlan = ()
+) -> List[str]:
+    """
+    Run *command* and return the outputs of *segments* that got no audio (removed).
+    ffmpeg fails when an output gets no samples, e.g. a window past the end of a source
+    whose duration was over-estimated; other failures raise.
+    """
+    result = subprocess.run(command, capture_output=True)
+    empty = [path for _, _, path in segments if not _has_audio(path)]
+    if result.returncode != 0 and not empty:
+        raise RuntimeError(
+            f"ffmpeg failed to write segments of {source_path}: "
+            f"{result.stderr.decode()}"
+        )
+    for path in empty:
+        Path(path).unlink(missing_ok=True)
+    return empty
+
+
+def write_segments_ffmpeg(
+    source_path: Union[str, Path],
+    segments: SegmentPlan,
+    stream_copy: bool = False,
+    sample_rate: int = SAMPLE_RATE,
+    max_outputs: int = MAX_OUTPUTS,
+    threads: Optional[int] = None,
+) -> List[str]:
+    """
+    Write all *segments* of *source_path* with ffmpeg, *max_outputs* at most per
+    process. The output format follows each output path's suffix. A source with more
+    segments is first decoded once to a temporary WAV next to the outputs, which every
+    group then seeks into. With *stream_copy*, MP3 sources cut into MP3 segments are not
+    re-encoded at all. ffmpeg uses *threads* (default `worker_threads()`, the thread
+    budget of a pool worker).
+
+    The plan comes from the probed duration, a header estimate that can be too long
+    (e.g. VBR MP3s without a Xing header). Returns the paths of the segments that got no
+    audio; they are not written.
+    """
+    if not segments:
+        return []
+    threads = worker_threads() if threads is None else threads
+    groups = [
+        segments[i : i + max_outputs] for i in range(0, len(segments), max_outputs)
+    ]
+    copy = (
+        stream_copy
+        and Path(source_path).suffix.lower() == ".mp3"
+        and all(Path(path).suffix.lower() == ".mp3" for _, _, path in segments)
+    )
+    empty = []
+    if copy:
+        for group in groups:
+            command = _ffmpeg_copy_command(source_path, group)
+            empty += _run_ffmpeg(command, source_path, group)
+        return empty
+    if len(groups) == 1:
+        command = _ffmpeg_trim_command(source_path, segments, sample_rate, threads)
+        return _run_ffmpeg(command, source_path, segments)
+
+    fd, wav_path = tempfile.mkstemp(suffix=".wav", dir=Path(segments[0][2]).parent)
+    os.close(fd)
+    try:
+        _run_ffmpeg(
+            _ffmpeg_decode_command(source_path, wav_path, sample_rate, threads),
+            source_path,
+        )
+        for group in groups:
+            seek_ms = min(start_ms for start_ms, _, _ in group)
+            command = _ffmpeg_trim_command(
+                wav_path, group, sample_rate, threads, seek_ms
+            )
+            empty += _run_ffmpeg(command, source_path, group)
+    finally:
+        os.unlink(wav_path)
+    return empty
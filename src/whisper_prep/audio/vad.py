@@ -9,7 +9,17 @@ try:
 except ImportError:  # optional dependency; only needed for VoiceActivityDetector
     Vad = None
 
-SILERO_MODEL = load_silero_vad()
+_SILERO_MODEL = None
+
+
+def load_silero_model():
+    """The silero VAD model, loaded on first use (once per process; pool workers load it
+    in their initializer)."""
+    global _SILERO_MODEL
+    if _SILERO_MODEL is None:
+        _SILERO_MODEL = load_silero_vad()
+    return _SILERO_MODEL
+
 
 @dataclass
 class Frame:
@@ -115,7 +125,7 @@ def silero_vad_collector(
     # Get speech timestamps
     speech_timestamps = get_speech_timestamps(
         audio,
-        SILERO_MODEL,
+        load_silero_model(),
         threshold=threshold,
         min_speech_duration_ms=min_speech_duration_ms,
         min_silence_duration_ms=min_silence_duration_ms,
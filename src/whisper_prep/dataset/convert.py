@@ -1,12 +1,14 @@
 import json
 import os
 from pathlib import Path
-from typing import Union
+from typing import Iterator, Optional, Union
 
 import pandas as pd
-from datasets import Audio, Dataset, DatasetDict, load_dataset
+from datasets import Audio, Dataset, DatasetDict, Features, Value, load_dataset
 from pydub import AudioSegment
-from tqdm import tqdm
+
+from whisper_prep.dataset.manifest import load_sentence_manifest
+from whisper_prep.executor import resolve_workers
 
 
 def ljson_to_dataframe(json_path: Union[str, Path]) -> pd.DataFrame:
@@ -25,6 +27,65 @@ def ljson_to_pandas(json_path: Union[str, Path]) -> pd.DataFrame:
     return train_meta_file
 
 
+def iter_ljson_chunks(
+    json_path: Union[str, Path], chunk_size: int = 50_000
+) -> Iterator[pd.DataFrame]:
+    """Like `ljson_to_pandas`, but yields DataFrames of at most *chunk_size* rows.
+    The index keeps counting across chunks, so row labels match the unchunked frame.
+    """
+    rows = []
+    start = 0
+    with open(json_path, "r", encoding="utf-8") as file:
+        for line in file:
+            rows.append(json.loads(line))
+            if len(rows) >= chunk_size:
+                yield _rows_to_frame(rows, start)
+                start += len(rows)
+                rows = []
+    if rows:
+        yield _rows_to_frame(rows, start)
+
+
+def _rows_to_frame(rows: list, start: int) -> pd.DataFrame:
+    frame = pd.DataFrame(rows, index=pd.RangeIndex(start, start + len(rows)))
+    frame.rename(columns={"audio_path": "audio"}, inplace=True)
+    return frame
+
+
+def write_hf_ljson(df: pd.DataFrame, path: Union[str, Path], mode: str = "a") -> None:
+    """Append *df* as JSON lines with `audio` already in the Audio storage layout,
+    so `ljson_to_hf_dataset` can read it back without a string cast."""
+    with open(path, mode, encoding="utf-8") as f:
+        for row in df.to_dict(orient="records"):
+            row["audio"] = {"path": str(row["audio"]), "bytes": None}
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+def ljson_to_hf_dataset(json_path: Union[str, Path], split_name: str = "train"):
+    """Build the HF dataset from a file written by `write_hf_ljson`.
+    Arrow reads the file in blocks, so memory does not grow with the number of rows."""
+    if os.path.getsize(json_path) == 0:
+        features = Features(
+            {
+                "audio": Audio(sampling_rate=16000),
+                "text": Value("string"),
+                "language": Value("string"),
+                "prompt": Value("string"),
+            }
+        )
+        dataset_train = Dataset.from_dict(
+            {name: [] for name in features}, features=features
+        )
+    else:
+        dataset_train = Dataset.from_json(str(json_path))
+
+    dataset = DatasetDict()
+    dataset[split_name] = dataset_train
+
+    dataset = dataset.cast_column("audio", Audio(sampling_rate=16000))
+    return dataset
+
+
 def pandas_to_hf_dataset(train_meta_file: pd.DataFrame, split_name: str = "train"):
     train_meta_file = train_meta_file.copy()
     # Datasets>=4 with recent pyarrow can fail casting audio from large_string.
@@ -45,31 +106,10 @@ def combine_tsvs_to_dataframe(
     tsv_paths: list[Union[str, Path]],
     clips_folders: list[Union[str, Path]],
     partials: list[float],
+    seed: Optional[int] = None,
 ) -> pd.DataFrame:
-    combined_dataset = []
-
-    for dataset_tsv_path, clips_folder, partial in zip(
-        tsv_paths, clips_folders, partials
-    ):
-        data = pd.read_csv(dataset_tsv_path, sep="\t", header=0)
-
-        if partial < 1.0:
-            data = data.sample(frac=partial)
-
-        for row in tqdm(pd.DataFrame.itertuples(data), total=len(data)):
-            sentence = row.sentence
-            sample_path = row.path if hasattr(row, "path") else row.clip_path
-            audio_file_path = Path(clips_folder, sample_path)
-
-            client_id = "0"
-            if hasattr(row, "client_id"):
-                client_id = row.client_id
-
-            combined_dataset.append((sentence, audio_file_path, client_id))
-
-    return pd.DataFrame(
-        data=combined_dataset, columns=["sentence", "audio_file_path", "client_id"]
-    )
+    """See `load_sentence_manifest`; rows whose clip is missing are dropped."""
+    return load_sentence_manifest(tsv_paths, clips_folders, partials, seed=seed)
 
 
 def _prepare_dataset(batch):
@@ -113,11 +153,12 @@ def hf_dataset_to_tsv(
     os.makedirs(clips_path, exist_ok=True)
 
     dataset = load_dataset(dataset_name, language, split=split, trust_remote_code=True)
-    dataset = dataset.map(_prepare_dataset, num_proc=os.cpu_count())
+    num_proc = resolve_workers()
+    dataset = dataset.map(_prepare_dataset, num_proc=num_proc)
 
     dataset = dataset.map(
         lambda batch: _process_record(batch, base_path, clips_path),
-        num_proc=os.cpu_count(),
+        num_proc=num_proc,
         desc=f"Processing {split} records",
         remove_columns="audio",
     )
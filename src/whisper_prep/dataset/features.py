@@ -0,0 +1,111 @@
+import re
+from functools import lru_cache
+from typing import List, Optional
+
+import numpy as np
+from datasets import Array2D, DatasetDict, Sequence, Value
+from whisper.audio import N_FRAMES, log_mel_spectrogram, pad_or_trim
+from whisper.tokenizer import Tokenizer, get_tokenizer
+
+from whisper_prep.executor import pin_threads, worker_threads
+
+TIMESTAMP_RE = re.compile(r"<\|(\d+\.\d+)\|>")
+TIME_PRECISION = 0.02  # seconds per timestamp token
+
+
+@lru_cache(maxsize=None)
+def _get_tokenizer(multilingual: bool, language: Optional[str]) -> Tokenizer:
+    return get_tokenizer(
+        multilingual=multilingual,
+        language=language if multilingual else None,
+        task="transcribe",
+    )
+
+
+def encode_with_timestamps(tokenizer: Tokenizer, text: str) -> List[int]:
+    """Token ids of a record text. `<|1.24|>` tags become timestamp tokens, the rest is
+    encoded as ordinary text."""
+    ids = []
+    position = 0
+    for match in TIMESTAMP_RE.finditer(text):
+        if match.start() > position:
+            ids.extend(tokenizer.encode(text[position : match.start()]))
+        ids.append(
+            tokenizer.timestamp_begin + round(float(match.group(1)) / TIME_PRECISION)
+        )
+        position = match.end()
+    if position < len(text):
+        ids.extend(tokenizer.encode(text[position:]))
+    return ids
+
+
+def _features_batch(
+    batch: dict, n_mels: int, multilingual: bool, n_threads: Optional[int] = None
+) -> dict:
+    if n_threads is not None:
+        # `Dataset.map` workers, one torch thread each.
+        pin_threads(n_threads)
+    input_features, labels, prompt_ids = [], [], []
+    for audio, text, language, prompt in zip(
+        batch["audio"], batch["text"], batch["language"], batch["prompt"]
+    ):
+        samples = np.asarray(audio["array"], dtype=np.float32)
+        mel = log_mel_spectrogram(pad_or_trim(samples), n_mels=n_mels)
+        input_features.append(mel.numpy().astype(np.float16))
+
+        tokenizer = _get_tokenizer(multilingual, language)
+        labels.append(
+            list(tokenizer.sot_sequence)
+            + encode_with_timestamps(tokenizer, text)
+            + [tokenizer.eot]
+        )
+        prompt_ids.append(
+            [tokenizer.sot_prev] + encode_with_timestamps(tokenizer, prompt)
+            if prompt
+            else []
+        )
+    return {"input_features": input_features, "labels": labels, "prompt_ids": prompt_ids}
+
+
+def add_whisper_features(
+    dataset: DatasetDict,
+    n_mels: int = 80,
+    tokenizer_type: str = "multilingual",
+    num_proc: Optional[int] = None,
+    batch_size: int = 32,
+) -> DatasetDict:
+    """
+    Add the model inputs so training does not decode audio or tokenize per epoch:
+
+    - `input_features`: float16 `(n_mels, 3000)` log-mel spectrogram of the 30-second
+      padded segment, as `whisper.audio.log_mel_spectrogram` computes it (80 bins, or 128
+      for large-v3).
+    - `labels`: start-of-transcript sequence for the record's language, the text with its
+      timestamp tokens, end-of-text.
+    - `prompt_ids`: `<|startofprev|>` and the prompt, empty without a prompt.
+
+    The columns are stored in Arrow and memory-mapped when the dataset is loaded.
+    """
+    if n_mels not in (80, 128):
+        raise ValueError(f"n_mels must be 80 or 128, got {n_mels}")
+
+    result = DatasetDict()
+    for split, split_dataset in dataset.items():
+        features = split_dataset.features.copy()
+        features["input_features"] = Array2D(shape=(n_mels, N_FRAMES), dtype="float16")
+        features["labels"] = Sequence(Value("int32"))
+        features["prompt_ids"] = Sequence(Value("int32"))
+        result[split] = split_dataset.map(
+            _features_batch,
+            batched=True,
+            batch_size=batch_size,
+            num_proc=num_proc,
+            features=features,
+            fn_kwargs={
+                "n_mels": n_mels,
+                "multilingual": tokenizer_type == "multilingual",
+                "n_threads": worker_threads() if num_proc and num_proc > 1 else None,
+            },
+            desc="Computing log-mel features and token ids",
+        )
+    return result
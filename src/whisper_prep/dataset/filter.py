@@ -0,0 +1,158 @@
+from functools import partial
+from pathlib import Path
+from typing import Callable, List, Optional, Union
+
+import pandas as pd
+
+from whisper_prep.dataset.convert import iter_ljson_chunks, write_hf_ljson
+from whisper_prep.instrumentation import span
+from whisper_prep.metrics import inc
+from whisper_prep.repetition import repetition_score
+from whisper_prep.utils import TAG_RE, get_compression_ratio, is_english, is_french
+
+COMPRESSION_RATIO_THRESHOLD = 2.4
+MAX_FEW_WORDS = 8
+REPETITION_MAX_N = 16
+
+
+def _bad_mask(
+    df: pd.DataFrame, compression_ratio_threshold: float = COMPRESSION_RATIO_THRESHOLD
+) -> pd.Series:
+    high_compression = (
+        df["text"].apply(get_compression_ratio) >= compression_ratio_threshold
+    )
+    few_words = df["text"].str.split().str.len() <= MAX_FEW_WORDS
+    return high_compression | few_words
+
+
+def text_repetition_score(text: str, max_n: int = REPETITION_MAX_N) -> float:
+    """Share of the words of *text* (timestamp tokens removed) that repeat the word or
+    n-gram (n <= *max_n*) right before them."""
+    return repetition_score(TAG_RE.sub(" ", text).split(), max_n)
+
+
+def _repetition_mask(
+    max_score: float, max_n: int
+) -> Callable[[pd.DataFrame], pd.Series]:
+    def mask(df: pd.DataFrame) -> pd.Series:
+        scores = df["text"].apply(text_repetition_score, max_n=max_n)
+        return scores > max_score
+
+    return mask
+
+
+def _word_mask(word: str) -> Callable[[pd.DataFrame], pd.Series]:
+    def mask(df: pd.DataFrame) -> pd.Series:
+        return df["text"].str.contains(word, case=False, regex=False, na=False)
+
+    return mask
+
+
+class _ReportWriter:
+    """Appends rejected rows to per-reason TSV reports. The first write of a run
+    truncates the report, later chunks append without repeating the header."""
+
+    def __init__(self, out_folder: Union[str, Path]) -> None:
+        self.out_folder = Path(out_folder)
+        self.counts = {}
+
+    def write(self, name: str, df: pd.DataFrame) -> Path:
+        path = self.out_folder / name
+        first = name not in self.counts
+        df.to_csv(path, sep="\t", mode="w" if first else "a", header=first)
+        self.counts[name] = self.counts.get(name, 0) + len(df)
+        return path
+
+
+@span("filter_records")
+def filter_records(
+    json_path: Union[str, Path],
+    out_folder: Union[str, Path],
+    accepted_path: Union[str, Path],
+    filter_words: Optional[List[str]] = None,
+    filter_french: bool = False,
+    filter_english: bool = False,
+    chunk_size: int = 50_000,
+    max_repetition_score: Optional[float] = None,
+    repetition_max_n: int = REPETITION_MAX_N,
+    compression_ratio_threshold: float = COMPRESSION_RATIO_THRESHOLD,
+) -> dict:
+    """
+    Run the post-DataProcessor quality filters over *json_path* one chunk at a time.
+
+    Rejected rows are appended to their report in *out_folder* (`bad_examples.csv`,
+    `repetitive_examples.csv`, `french_examples.csv`, `english_examples.csv`,
+    `filtered_<word>_examples.csv`),
+    accepted rows are appended to *accepted_path* (see `write_hf_ljson`). Memory is
+    bounded by *chunk_size* instead of the number of records. Rows whose compression ratio
+    reaches *compression_ratio_threshold* are bad examples.
+
+    Returns a dict with the number of `loaded` and `accepted` rows and the number of
+    rejected rows per report.
+    """
+    filter_words = filter_words or []
+
+    filters = [
+        (
+            "bad_examples.csv",
+            partial(_bad_mask, compression_ratio_threshold=compression_ratio_threshold),
+        )
+    ]
+    if max_repetition_score is not None:
+        filters.append(
+            (
+                "repetitive_examples.csv",
+                _repetition_mask(max_repetition_score, repetition_max_n),
+            )
+        )
+    if filter_french:
+        filters.append(("french_examples.csv", lambda df: df["text"].apply(is_french)))
+    if filter_english:
+        filters.append(
+            ("english_examples.csv", lambda df: df["text"].apply(is_english))
+        )
+    for word in filter_words:
+        filters.append((f"filtered_{word}_examples.csv", _word_mask(word)))
+
+    reports = _ReportWriter(out_folder)
+    loaded = 0
+    accepted = 0
+    open(accepted_path, "w", encoding="utf-8").close()
+
+    for chunk in iter_ljson_chunks(json_path, chunk_size=chunk_size):
+        loaded += len(chunk)
+        for name, mask_fn in filters:
+            if chunk.empty:
+                break
+            with span(f"filter_records.{Path(name).stem}"):
+                mask = mask_fn(chunk)
+            if mask.any():
+                reports.write(name, chunk[mask])
+                inc("records_rejected_total", int(mask.sum()), reason=Path(name).stem)
+                chunk = chunk[~mask]
+
+        # Hard safety check: no filtered words should remain in final data.
+        if filter_words and not chunk.empty:
+            residual_idx = None
+            for word in filter_words:
+                word_idx = _word_mask(word)(chunk)
+                residual_idx = (
+                    word_idx if residual_idx is None else (residual_idx | word_idx)
+                )
+            if residual_idx.any():
+                residual_path = reports.write(
+                    "residual_filtered_words_examples.csv", chunk[residual_idx]
+                )
+                raise ValueError(
+                    f"Filtered words still present in final dataset. See: {residual_path}"
+                )
+
+        write_hf_ljson(chunk, accepted_path)
+        accepted += len(chunk)
+        inc("records_accepted_total", len(chunk))
+
+    print(f"Loaded {loaded} samples, kept {accepted}")
+    for name, count in reports.counts.items():
+        print(f"Filtered {count} samples into {name}")
+
+    return {"loaded": loaded, "accepted": accepted, **reports.counts}
@@ -0,0 +1,164 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import csv as pa_csv
+
+STAT_THREADS = 32
+
+
+def read_tsv_columns(path: Union[str, Path], columns: List[str]) -> pa.Table:
+    """
+    Read *columns* of a TSV as strings with Arrow's multithreaded CSV reader.
+    Other columns are skipped, requested columns missing from the file come back as
+    nulls, and so do empty cells. Files with rows shorter than the header, which Arrow
+    rejects, are read with pandas instead, which fills the missing cells with nulls.
+    """
+    try:
+        return pa_csv.read_csv(
+            str(path),
+            parse_options=pa_csv.ParseOptions(delimiter="\t", newlines_in_values=True),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=columns,
+                include_missing_columns=True,
+                column_types={column: pa.string() for column in columns},
+                strings_can_be_null=True,
+            ),
+        )
+    except pa.ArrowInvalid:
+        frame = pd.read_csv(
+            path, sep="\t", dtype=str, usecols=lambda column: column in columns
+        )
+        return pa.table(
+            {
+                column: pa.array(
+                    frame[column] if column in frame else [None] * len(frame),
+                    type=pa.string(),
+                    from_pandas=True,
+                )
+                for column in columns
+            }
+        )
+
+
+def _join_folder(folder: Union[str, Path], paths: pa.ChunkedArray) -> pa.ChunkedArray:
+    """Vectorized `Path(folder, path)`: absolute paths are kept as they are."""
+    joined = pc.binary_join_element_wise(str(folder), paths, os.sep)
+    return pc.if_else(pc.starts_with(paths, os.sep), paths, joined)
+
+
+def _stem(paths: pa.ChunkedArray) -> pa.ChunkedArray:
+    """Vectorized `Path(path).stem`."""
+    names = pc.replace_substring_regex(paths, pattern=r"^.*/", replacement="")
+    return pc.replace_substring_regex(names, pattern=r"(.)\.[^.]*$", replacement=r"\1")
+
+
+def _exists_all(paths: List[str]) -> List[bool]:
+    return [os.path.exists(path) for path in paths]
+
+
+def existing_mask(paths: List[str], n_threads: int = STAT_THREADS) -> np.ndarray:
+    """`os.path.exists` for every path, with the `stat` calls spread over threads."""
+    if not paths:
+        return np.zeros(0, dtype=bool)
+    chunk = max(1, -(-len(paths) // (n_threads * 4)))
+    chunks = [paths[i : i + chunk] for i in range(0, len(paths), chunk)]
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        return np.fromiter(
+            (found for part in executor.map(_exists_all, chunks) for found in part),
+            dtype=bool,
+            count=len(paths),
+        )
+
+
+def _drop_missing(
+    frame: pd.DataFrame, columns: List[str], source: Union[str, Path]
+) -> pd.DataFrame:
+    keep = np.ones(len(frame), dtype=bool)
+    for column in columns:
+        keep &= existing_mask(frame[column].tolist())
+    if not keep.all():
+        print(f"Dropping {(~keep).sum()} rows of {source} with missing files")
+        frame = frame[keep].reset_index(drop=True)
+    return frame
+
+
+def load_sentence_manifest(
+    tsv_paths: List[Union[str, Path]],
+    clips_folders: List[Union[str, Path]],
+    partials: List[float],
+    validate: bool = True,
+    seed: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Load sentence-level TSVs (Common Voice style) into one table with the columns
+    `sentence`, `audio_file_path` and `client_id`.
+
+    The clip path is taken from `path` (or `clip_path`) relative to its clips folder and
+    `client_id` defaults to "0". With *validate*, rows whose clip does not exist are dropped.
+    *seed* makes the `partials` subsampling reproducible.
+    """
+    frames = []
+    for tsv_path, clips_folder, partial in zip(tsv_paths, clips_folders, partials):
+        table = read_tsv_columns(tsv_path, ["path", "clip_path", "sentence", "client_id"])
+        if table.column("path").null_count < table.num_rows:
+            sample_paths = table.column("path")
+        else:
+            sample_paths = table.column("clip_path")
+        frame = pd.DataFrame(
+            {
+                "sentence": table.column("sentence").to_pandas(),
+                "audio_file_path": _join_folder(clips_folder, sample_paths).to_pandas(),
+                "client_id": pc.fill_null(table.column("client_id"), "0").to_pandas(),
+            }
+        )
+
+        if partial < 1.0:
+            frame = frame.sample(frac=partial, random_state=seed)
+        if validate:
+            frame = _drop_missing(frame, ["audio_file_path"], tsv_path)
+        frames.append(frame)
+
+    if not frames:
+        return pd.DataFrame(columns=["sentence", "audio_file_path", "client_id"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def load_transcripts_manifest(
+    transcripts_tsv: Union[str, Path],
+    validate: bool = False,
+    num_shards: int = 1,
+    shard_index: int = 0,
+) -> pd.DataFrame:
+    """
+    Load a `transcripts_tsv` into a table with the columns `srt_path`, `audio_path`,
+    `id` (defaults to the audio file stem) and `language` (None when not given).
+    With *validate*, rows whose transcript or audio does not exist are dropped.
+    With *num_shards* > 1 only every *num_shards*-th row starting at *shard_index* is
+    kept (before validation, so the partition does not depend on the file system).
+    """
+    table = read_tsv_columns(
+        transcripts_tsv, ["srt_path", "audio_path", "id", "language"]
+    )
+    audio_paths = table.column("audio_path")
+    frame = pd.DataFrame(
+        {
+            "srt_path": table.column("srt_path").to_pandas(),
+            "audio_path": audio_paths.to_pandas(),
+            "id": pc.coalesce(table.column("id"), _stem(audio_paths)).to_pandas(),
+            "language": table.column("language").to_pandas(),
+        }
+    )
+    frame["language"] = frame["language"].astype(object).where(
+        frame["language"].notna(), None
+    )
+    if num_shards > 1:
+        frame = frame.iloc[shard_index::num_shards].reset_index(drop=True)
+    if validate:
+        frame = _drop_missing(frame, ["srt_path", "audio_path"], transcripts_tsv)
+    return frame
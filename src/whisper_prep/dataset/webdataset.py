@@ -0,0 +1,206 @@
+"""
+WebDataset-style export: the accepted records packed into sequential tar shards.
+
+Every record becomes two tar members that share a key: `<key>.<ext>` holds the bytes of
+its audio segment as written by the DataProcessor (no re-encoding) and `<key>.json` its
+text, prompt, language and metadata. A shard is closed once it reaches `shard_size_mb`
+(or `shard_max_records`), so training loaders read a few large files sequentially
+instead of one small file per segment. `index.json` next to the shards lists every shard
+with its number of records, size and first/last key.
+"""
+import io
+import json
+import os
+import tarfile
+from pathlib import Path
+from typing import Iterator, List, Optional, Union
+
+SHARD_SIZE_MB = 512
+SHARD_PREFIX = "shard"
+INDEX_FILE = "index.json"
+# Tar members get a fixed mtime, so the same records always produce the same shards.
+MEMBER_MTIME = 0
+
+
+def iter_records(json_path: Union[str, Path]) -> Iterator[dict]:
+    """The records of a `data.ljson` or `accepted.ljson`, one line at a time, with
+    `audio_path` as a string."""
+    with open(json_path, "r", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            audio = record.pop("audio", None)
+            if audio is not None:
+                # `write_hf_ljson` stores the path in the Audio storage layout.
+                path = audio["path"] if isinstance(audio, dict) else audio
+                record["audio_path"] = path
+            yield record
+
+
+class ShardWriter:
+    """
+    Writes samples into `<out_dir>/<prefix>-000000.tar`, `-000001.tar`, ... A shard is
+    written as `.tmp` and renamed when it is closed, so readers never see a partial
+    shard. `close` writes the index.
+    """
+
+    def __init__(
+        self,
+        out_dir: Union[str, Path],
+        shard_size_mb: float = SHARD_SIZE_MB,
+        shard_max_records: Optional[int] = None,
+        prefix: str = SHARD_PREFIX,
+    ) -> None:
+        if shard_size_mb <= 0:
+            raise ValueError(f"shard_size_mb must be positive, got {shard_size_mb}")
+        if shard_max_records is not None and shard_max_records < 1:
+            raise ValueError(
+                f"shard_max_records must be positive, got {shard_max_records}"
+            )
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = shard_size_mb * 2**20
+        self.max_records = shard_max_records
+        self.prefix = prefix
+        self.shards: List[dict] = []
+        self.index: Optional[dict] = None
+        self._tar: Optional[tarfile.TarFile] = None
+        self._tmp_path: Optional[Path] = None
+
+    def _open(self) -> None:
+        name = f"{self.prefix}-{len(self.shards):06d}.tar"
+        self._tmp_path = Path(self.out_dir, f"{name}.tmp")
+        self._tar = tarfile.open(self._tmp_path, "w", format=tarfile.PAX_FORMAT)
+        self.shards.append(
+            {
+                "name": name,
+                "records": 0,
+                "bytes": 0,
+                "first_key": None,
+                "last_key": None,
+            }
+        )
+
+    def _close_shard(self) -> None:
+        self._tar.close()
+        shard = self.shards[-1]
+        shard["bytes"] = self._tmp_path.stat().st_size
+        os.replace(self._tmp_path, Path(self.out_dir, shard["name"]))
+        self._tar = None
+
+    def _add(self, name: str, size: int, fileobj) -> None:
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = MEMBER_MTIME
+        info.mode = 0o444
+        self._tar.addfile(info, fileobj)
+
+    def write(self, key: str, audio_path: Union[str, Path], metadata: dict) -> None:
+        """Add the sample *key*: the file *audio_path* and *metadata* as JSON."""
+        if "." in key:
+            # WebDataset splits member names at the first dot into key and extension.
+            raise ValueError(f"Sample keys cannot contain dots: {key}")
+        if self._tar is not None:
+            records = self.shards[-1]["records"]
+            full = self.max_records is not None and records >= self.max_records
+            if full or self._tar.offset >= self.max_bytes:
+                self._close_shard()
+        if self._tar is None:
+            self._open()
+
+        extension = Path(audio_path).suffix.lstrip(".") or "audio"
+        with open(audio_path, "rb") as f:
+            self._add(f"{key}.{extension}", os.fstat(f.fileno()).st_size, f)
+        encoded = json.dumps(metadata, ensure_ascii=False).encode("utf-8")
+        self._add(f"{key}.json", len(encoded), io.BytesIO(encoded))
+
+        shard = self.shards[-1]
+        shard["records"] += 1
+        shard["first_key"] = shard["first_key"] or key
+        shard["last_key"] = key
+
+    def close(self) -> dict:
+        """Close the last shard and write the index; returns the index."""
+        if self._tar is not None:
+            self._close_shard()
+        self.index = {
+            "records": sum(shard["records"] for shard in self.shards),
+            "bytes": sum(shard["bytes"] for shard in self.shards),
+            "shards": self.shards,
+        }
+        write_index(self.index, Path(self.out_dir, INDEX_FILE))
+        return self.index
+
+    def __enter__(self) -> "ShardWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        elif self._tar is not None:
+            self._tar.close()
+            self._tmp_path.unlink()
+
+
+def write_index(index: dict, path: Union[str, Path]) -> None:
+    tmp_path = Path(f"{path}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def export_webdataset(
+    json_path: Union[str, Path],
+    out_dir: Union[str, Path],
+    shard_size_mb: float = SHARD_SIZE_MB,
+    shard_max_records: Optional[int] = None,
+    prefix: str = SHARD_PREFIX,
+    key_prefix: str = "",
+) -> dict:
+    """
+    Pack the records of *json_path* (e.g. `created_dataset/accepted.ljson`) into tar
+    shards in *out_dir*, streaming one record at a time. Sample keys are *key_prefix*
+    and the record's position (`000000042`); the JSON member holds the record's fields,
+    including its `audio_path`. Shards of an earlier export are replaced. Returns the
+    index.
+    """
+    out_dir = Path(out_dir)
+    for stale in [*out_dir.glob(f"{prefix}-*.tar*"), Path(out_dir, INDEX_FILE)]:
+        stale.unlink(missing_ok=True)
+    with ShardWriter(
+        out_dir,
+        shard_size_mb=shard_size_mb,
+        shard_max_records=shard_max_records,
+        prefix=prefix,
+    ) as writer:
+        for n, record in enumerate(iter_records(json_path)):
+            writer.write(f"{key_prefix}{n:09d}", record["audio_path"], record)
+    index = writer.index
+    print(f"Wrote {index['records']} records into {len(index['shards'])} shards")
+    return index
+
+
+def _read_index(out_dir: Union[str, Path]) -> dict:
+    with open(Path(out_dir, INDEX_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def merge_indexes(shard_dirs: List[Path], out_dir: Union[str, Path]) -> dict:
+    """
+    Write one index over the tar shards of several runs (e.g. the shards of a sharded
+    run) into *out_dir*. The tar files stay where they are; their names in the merged
+    index are relative to *out_dir*.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    shards = []
+    for shard_dir in shard_dirs:
+        for shard in _read_index(shard_dir)["shards"]:
+            path = Path(shard_dir, shard["name"])
+            shards.append({**shard, "name": os.path.relpath(path, out_dir)})
+    index = {
+        "records": sum(shard["records"] for shard in shards),
+        "bytes": sum(shard["bytes"] for shard in shards),
+        "shards": shards,
+    }
+    write_index(index, Path(out_dir, INDEX_FILE))
+    return index
@@ -0,0 +1,230 @@
+"""
+The pools behind the parallel steps (generation, normalization, segmentation and the
+HF exports).
+
+`Executor` wraps a `multiprocessing` process pool (CPU-bound work) or thread pool. The
+pool is started on first use and kept for all the work submitted to it, and not started
+at all when the work runs in this process (one worker, or fewer items than workers).
+Process workers first call `pin_threads`, so torch and the OpenMP/BLAS libraries use
+`worker_threads` threads (1 by default) instead of one per core in every worker, then
+the optional *initializer*, which loads the worker's models once.
+
+`resolve_workers` turns the `n_jobs` config value, a number or `auto`, into a pool size:
+`auto` is one worker per available core, limited by the available memory divided by
+`worker_memory_mb`.
+"""
+import os
+import sys
+from collections import deque
+from multiprocessing.pool import AsyncResult, Pool, ThreadPool
+from typing import Callable, Iterable, Iterator, List, Optional, Union
+
+from tqdm import tqdm
+
+EXECUTOR_KINDS = ["process", "thread"]
+WORKER_MEMORY_MB = 2048
+THREAD_ENV_VARS = [
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+]
+_THREADS_ENV = "WHISPER_PREP_WORKER_THREADS"
+_CGROUP_MEMORY = [
+    "/sys/fs/cgroup/memory.max",
+    "/sys/fs/cgroup/memory/memory.limit_in_bytes",
+]
+
+
+def available_cpus() -> int:
+    """Cores this process may run on (its affinity mask, e.g. a Slurm allocation)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def available_memory_mb() -> Optional[float]:
+    """Available memory (`MemAvailable`), capped by the cgroup limit; None if unknown."""
+    limits = []
+    try:
+        with open("/proc/meminfo", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    limits.append(int(line.split()[1]) / 1024)
+                    break
+    except OSError:
+        pass
+    for path in _CGROUP_MEMORY:
+        try:
+            with open(path, encoding="ascii") as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit():
+            limits.append(int(value) / 2**20)
+        break
+    return min(limits) if limits else None
+
+
+def resolve_workers(
+    n_jobs: Union[int, str, None] = "auto",
+    worker_memory_mb: Optional[float] = WORKER_MEMORY_MB,
+) -> int:
+    """
+    Pool size for *n_jobs*. A number is used as is; `auto` (or None) is one worker per
+    available core, but no more than fit into the available memory with
+    *worker_memory_mb* each, and at least one.
+    """
+    if n_jobs not in (None, "auto"):
+        if int(n_jobs) < 1:
+            raise ValueError(f"n_jobs must be a positive number or 'auto', got {n_jobs}")
+        return int(n_jobs)
+    n_workers = available_cpus()
+    memory = available_memory_mb()
+    if worker_memory_mb and memory is not None:
+        n_workers = min(n_workers, int(memory // worker_memory_mb))
+    return max(1, n_workers)
+
+
+def set_worker_threads(n_threads: int) -> None:
+    """Threads per process worker of the executors of this process and its children."""
+    if n_threads < 1:
+        raise ValueError(f"worker_threads must be positive, got {n_threads}")
+    os.environ[_THREADS_ENV] = str(n_threads)
+
+
+def worker_threads() -> int:
+    return int(os.environ.get(_THREADS_ENV, 1))
+
+
+def pin_threads(n_threads: Optional[int] = None) -> None:
+    """
+    Limit this process to *n_threads* (default `worker_threads()`) compute threads:
+    torch if it is imported, and the OpenMP/BLAS libraries loaded later.
+    """
+    n_threads = worker_threads() if n_threads is None else n_threads
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(n_threads)
+    # Not imported here: workers that never use torch should not pay for it.
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.get_num_threads() != n_threads:
+        torch.set_num_threads(n_threads)
+
+
+def _init_process(
+    n_threads: int, initializer: Optional[Callable], initargs: tuple
+) -> None:
+    pin_threads(n_threads)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+class Executor:
+    """
+    A process (or thread) pool of *n_workers*, started on first use. Use it as a context
+    manager; leaving the block terminates the workers like `with Pool(...)`.
+    """
+
+    def __init__(
+        self,
+        n_workers: int,
+        kind: str = "process",
+        initializer: Optional[Callable] = None,
+        initargs: tuple = (),
+        threads_per_worker: Optional[int] = None,
+    ) -> None:
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(
+                f"Unknown executor kind {kind}, expected one of {EXECUTOR_KINDS}"
+            )
+        if n_workers < 1:
+            raise ValueError(f"n_workers must be positive, got {n_workers}")
+        self.n_workers = n_workers
+        self.kind = kind
+        self.initializer = initializer
+        self.initargs = initargs
+        self.threads_per_worker = (
+            worker_threads() if threads_per_worker is None else threads_per_worker
+        )
+        self._pool: Optional[Pool] = None
+        self._initialized_inline = False
+
+    @property
+    def pool(self) -> Pool:
+        if self._pool is None:
+            if self.kind == "process":
+                self._pool = Pool(
+                    self.n_workers,
+                    initializer=_init_process,
+                    initargs=(self.threads_per_worker, self.initializer, self.initargs),
+                )
+            else:
+                # Threads share the thread pools of torch/BLAS with this process.
+                self._pool = ThreadPool(
+                    self.n_workers, initializer=self.initializer, initargs=self.initargs
+                )
+        return self._pool
+
+    def _init_inline(self) -> None:
+        if not self._initialized_inline:
+            if self.initializer is not None:
+                self.initializer(*self.initargs)
+            self._initialized_inline = True
+
+    def map(
+        self, func: Callable, items: List, chunksize: int = 1, desc: Optional[str] = None
+    ) -> list:
+        """
+        `func` of every item, in completion order and with a progress bar. With no more
+        items than workers they are processed in this process, which avoids starting the
+        pool for small workloads.
+        """
+        items = list(items)
+        if self.n_workers <= 1 or len(items) <= self.n_workers:
+            self._init_inline()
+            return [func(item) for item in items]
+        return list(
+            tqdm(
+                self.pool.imap_unordered(func, items, chunksize=chunksize),
+                total=len(items),
+                desc=desc,
+            )
+        )
+
+    def imap(
+        self, func: Callable, iterable: Iterable, max_in_flight: Optional[int] = None
+    ) -> Iterator:
+        """
+        Ordered `func` of every item that reads at most *max_in_flight* (default 4 per
+        worker) items ahead of the consumer, so a stream is not drained into the task
+        queue like with `Pool.imap`. With one worker the items are processed lazily in
+        this process.
+        """
+        if self.n_workers <= 1:
+            self._init_inline()
+            yield from map(func, iterable)
+            return
+        max_in_flight = max_in_flight or 4 * self.n_workers
+        pending = deque()
+        for item in iterable:
+            pending.append(self.pool.apply_async(func, (item,)))
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+    def apply_async(self, func: Callable, args: tuple = ()) -> AsyncResult:
+        return self.pool.apply_async(func, args)
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self) -> "Executor":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -1,17 +1,35 @@
 import json
+import os
 import unicodedata
 import warnings
 from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import asdict
 from pathlib import Path
-from typing import Deque, List, Optional, Union
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
+import numpy as np
 import torch
 import torchaudio
 from tqdm import tqdm
 from whisper.audio import load_audio
 from whisper.tokenizer import LANGUAGES, TO_LANGUAGE_CODE, get_tokenizer
 from whisper.utils import format_timestamp
-from whisper_prep.generation.typing import PromptNode, Record, Utterance
+from whisper_prep.audio.io import (
+    DurationCache,
+    check_audio_format,
+    probe_duration,
+    write_audio,
+)
+from whisper_prep.audio.segment import SegmentPlan, write_segments_ffmpeg
+from whisper_prep.dataset.manifest import load_transcripts_manifest
+from whisper_prep.executor import Executor
+from whisper_prep.generation.typing import PromptNode, Record, Source, Utterance
+from whisper_prep.instrumentation import span
+from whisper_prep.metrics import flush_metrics, inc, set_gauge
+from whisper_prep.profiling import profiled
+from whisper_prep.repetition import find_repeats
+from whisper_prep.workqueue import WorkQueue
 import csv
 from collections import defaultdict
 
@@ -20,6 +38,34 @@ SAMPLE_RATE = 16000
 DURATION_IN_SAMPLES = int(DURATION * SAMPLE_RATE / 1000)
 
 
+def _decoded_bytes(duration: Optional[float]) -> int:
+    """Estimated memory of one decoded source (float32 samples from `load_audio`, shared
+    with the tensor). Unknown durations count as one hour."""
+    seconds = duration if duration is not None else 3600
+    return int(seconds * SAMPLE_RATE * 4)
+
+
+@span("data_processor.decode")
+def _load_audio(audio_path: Union[str, Path]) -> np.ndarray:
+    return load_audio(str(audio_path))
+
+
+_WORKER_PROCESSOR = None
+
+
+def _init_worker(processor: "DataProcessor") -> None:
+    global _WORKER_PROCESSOR
+    _WORKER_PROCESSOR = processor
+
+
+def _process_source_in_worker(source: Source) -> Tuple[Optional[List[Record]], List[dict]]:
+    processor = _WORKER_PROCESSOR
+    records = processor._process_source(source)
+    filtered, processor.filtered_segment_records = processor.filtered_segment_records, []
+    flush_metrics()
+    return records, filtered
+
+
 class DataProcessor:
     def __init__(
         self,
@@ -44,6 +90,20 @@ class DataProcessor:
         cut_initial_audio: bool = False,
         filter_segment_words: Optional[List[str]] = None,
         transcripts_tsv: Optional[str] = None,
+        transcript_overrides: Optional[Dict[str, str]] = None,
+        sources: Optional[Iterable[Source]] = None,
+        num_shards: int = 1,
+        shard_index: int = 0,
+        work_queue: Optional[Union[str, Path]] = None,
+        work_queue_lease_timeout: float = 600.0,
+        n_jobs: int = 1,
+        decode_memory_budget_mb: Optional[int] = None,
+        duration_cache: Optional[Union[str, Path]] = None,
+        prefetch: int = 0,
+        encode_workers: int = 0,
+        segment_backend: str = "torchaudio",
+        segment_stream_copy: bool = False,
+        audio_format: str = "mp3",
     ) -> None:
         self.with_timestamps = with_timestamps
         self.audio_dir = audio_dir
@@ -63,6 +123,36 @@ class DataProcessor:
         self.cut_initial_audio = cut_initial_audio
         self.filter_segment_words = filter_segment_words
         self.transcripts_tsv = transcripts_tsv
+        # Maps `str(transcript_path)` to the file holding its (e.g. Netflix-normalized) cues.
+        self.transcript_overrides = transcript_overrides or {}
+        # Explicit inputs (e.g. streamed from a HF dataset) instead of the TSV / folders.
+        self.sources = sources
+        # Static sharding of TSV rows / audio files; explicit sources are used as given.
+        self.num_shards = num_shards
+        self.shard_index = shard_index
+        self._manifest = None
+        # Shared `WorkQueue` folder: sources are leased one at a time, so several processes
+        # (or nodes) can work on the same inputs. The worker that finds the queue drained
+        # first writes `output`, see `wrote_output`.
+        self.work_queue = work_queue
+        self.work_queue_lease_timeout = work_queue_lease_timeout
+        self.wrote_output = True
+        # With n_jobs > 1 sources are processed in a pool, longest first (durations are
+        # probed up front and cached in `duration_cache`). Sources are only started while
+        # the estimated decoded audio in flight fits `decode_memory_budget_mb`.
+        self.n_jobs = n_jobs
+        self.decode_memory_budget_mb = decode_memory_budget_mb
+        self.duration_cache = duration_cache
+        # Serial mode: number of upcoming sources decoded in the background.
+        self.prefetch = prefetch
+        # Threads encoding the segments of the current source while it is still being cut.
+        self.encode_workers = encode_workers
+        # "ffmpeg": all segments of a source are written by one ffmpeg process reading the
+        # source file, optionally stream-copying MP3 frames (`segment_stream_copy`).
+        self.segment_backend = segment_backend
+        self.segment_stream_copy = segment_stream_copy
+        # Codec of the segments in dump_dir, see `AUDIO_FORMATS`.
+        self.audio_format = audio_format
         self.filtered_segment_records: List[dict] = []
 
         self._verify_args()
@@ -74,10 +164,10 @@ class DataProcessor:
 
     def _verify_args(self) -> None:
         if self.with_timestamps:
-            if not self.transcripts_tsv:
+            if not self.transcripts_tsv and self.sources is None:
                 if not self.audio_dir or not self.transcript_dir:
                     raise ValueError(
-                        "`audio_dir` and `transcript_dir` must be set when `with_timestamps` is True and no transcripts_tsv provided"
+                        "`audio_dir` and `transcript_dir` must be set when `with_timestamps` is True and no transcripts_tsv or sources provided"
                     )
             if self.timestamp_resolution % 20 != 0:
                 raise ValueError(
@@ -99,6 +189,11 @@ class DataProcessor:
         if self.tokenizer_type not in ["multilingual", "english"]:
             raise ValueError(f"Unsupported tokenizer type: {self.tokenizer_type}")
 
+        if self.segment_backend not in ["torchaudio", "ffmpeg"]:
+            raise ValueError(f"Unsupported segment backend: {self.segment_backend}")
+
+        check_audio_format(self.audio_format)
+
         if Path(self.output).exists():
             raise ValueError(f"Output file {self.output} already exists")
 
@@ -108,6 +203,9 @@ class DataProcessor:
         else:
             self._process_without_timestamps()
 
+        if not self.wrote_output:
+            return
+
         self._write_filtered_segments()
 
         if self.subsampling_factor_for_silence > 1:
@@ -139,35 +237,15 @@ class DataProcessor:
     def _drop_repeated_utterances(
         self, utterances: List[Utterance], threshold: int = 3
     ) -> List[Utterance]:
-        if not utterances:
-            return []
-
         # This function assumes utterances are already sorted by start time.
+        # Drop every run of `threshold` or more consecutive utterances with the same text.
         result_utterances = []
-        repeat_count = 1
-        last_text = None
-
-        for i in range(len(utterances)):
-            current_text = utterances[i].text
-
-            if i == 0:
-                last_text = current_text
-                continue
-
-            if current_text == last_text:
-                repeat_count += 1
-            else:
-                if repeat_count < threshold:
-                    # Append all non-repeated or less than threshold utterances
-                    result_utterances.extend(utterances[i - repeat_count : i])
-                # Reset count and update last_text
-                repeat_count = 1
-                last_text = current_text
-
-        # Check the last sequence at the end of the list
-        if repeat_count < threshold:
-            result_utterances.extend(utterances[-repeat_count:])
-
+        position = 0
+        for run in find_repeats([u.text for u in utterances], max_n=1):
+            if run.repeats >= threshold:
+                result_utterances.extend(utterances[position : run.start])
+                position = run.end
+        result_utterances.extend(utterances[position:])
         return result_utterances
 
     def _drop_single_letter_utterance(
@@ -231,106 +309,303 @@ class DataProcessor:
         return sanitized_utterances
 
     def _process_with_timestamps(self) -> None:
-        if self.transcripts_tsv:
-            with open(self.transcripts_tsv, encoding="utf-8") as tsvfile:
-                # Pre-count rows so tqdm can display ETA and progress percentage.
-                total_rows = max(0, sum(1 for _ in tsvfile) - 1)
-                tsvfile.seek(0)
-                reader = csv.DictReader(tsvfile, delimiter="\t")
-                for row in tqdm(
-                    reader,
-                    total=total_rows,
-                    desc="Processing TSV transcripts",
-                ):
-                    srt_path = Path(row["srt_path"])
-                    audio_path = Path(row["audio_path"])
-                    speech_id = row.get("id") or audio_path.stem
-                    orig_lang = self.language
-                    self.language = row.get("language") or self.language
-                    filtered_for_speech: List[dict] = []
-                    try:
-                        if srt_path.suffix == ".srt":
-                            utterances = self.read_utterances_from_srt(
-                                srt_path,
-                                self.normalize_unicode,
-                                self.filter_segment_words,
-                                filtered_for_speech,
-                                speech_id,
-                            )
-                        elif srt_path.suffix == ".vtt":
-                            utterances = self.read_utterances_from_vtt(
-                                srt_path,
-                                self.normalize_unicode,
-                                self.filter_segment_words,
-                                filtered_for_speech,
-                                speech_id,
-                            )
-                        else:
-                            raise ValueError(
-                                f"Unsupported transcript format: {srt_path.suffix}"
-                            )
-                        self.filtered_segment_records.extend(filtered_for_speech)
-                        if not self._is_valid_utterances(utterances, 0):
-                            utterances = self._sanitize_utterances(utterances)
-                        blocked_intervals = [
-                            (r["start_ms"], r["end_ms"]) for r in filtered_for_speech
-                        ]
-                        records = self._create_records_with_timestamps(
-                            utterances,
-                            audio_path,
-                            speech_id,
-                            blocked_intervals=blocked_intervals,
-                        )
+        if self.work_queue:
+            self._process_from_queue()
+            return
+        if self.n_jobs > 1:
+            self._process_in_pool()
+            return
+
+        for source, audio in tqdm(
+            self._prefetched(self._iter_sources()),
+            total=self._count_sources(),
+            desc="Processing TSV transcripts" if self.transcripts_tsv else None,
+        ):
+            records = self._process_source(source, audio)
+            if records is not None:
+                self.write_records(records, self.output)
+
+    def _process_from_queue(self) -> None:
+        queue = WorkQueue(self.work_queue, lease_timeout=self.work_queue_lease_timeout)
+        queue.populate(
+            lambda: (
+                {
+                    "audio_path": str(source.audio_path),
+                    "transcript_path": str(source.transcript_path),
+                    "speech_id": source.speech_id,
+                    "language": source.language,
+                }
+                for source, _ in self._scheduled_sources()
+            )
+        )
+
+        for lease in tqdm(queue.leases(), desc=f"Processing {self.work_queue}"):
+            with lease:
+                unit = lease.unit
+                source = Source(
+                    audio_path=Path(unit["audio_path"]),
+                    transcript_path=Path(unit["transcript_path"]),
+                    speech_id=unit["speech_id"],
+                    language=unit["language"],
+                )
+                n_filtered = len(self.filtered_segment_records)
+                records = self._process_source(source) or []
+                lease.commit(
+                    {
+                        "records": [asdict(record) for record in records],
+                        "filtered_segments": self.filtered_segment_records[n_filtered:],
+                    }
+                )
+                del self.filtered_segment_records[n_filtered:]
+
+        self.wrote_output = queue.claim("collect")
+        if not self.wrote_output:
+            return
+        # Renamed into place at the end, so a crashed collection leaves no partial output.
+        tmp_output = Path(f"{self.output}.tmp")
+        open(tmp_output, "w", encoding="utf-8").close()
+        for result in queue.results():
+            self.write_records([Record(**r) for r in result["records"]], tmp_output)
+            self.filtered_segment_records.extend(result["filtered_segments"])
+        os.replace(tmp_output, self.output)
+        for unit in queue.failed():
+            print(f"Skipped {unit['audio_path']}: failed on every lease")
+
+    def __getstate__(self) -> dict:
+        # Sent to pool workers: the tokenizer is rebuilt there, inputs are sent per task.
+        state = self.__dict__.copy()
+        for name in ["tokenizer", "sources", "_manifest"]:
+            state[name] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.tokenizer = get_tokenizer(
+            multilingual=(self.tokenizer_type == "multilingual")
+        )
+
+    def _scheduled_sources(self) -> Iterator[Tuple[Source, Optional[float]]]:
+        """
+        Yield `(source, duration_seconds)`. Explicit sources keep their (streaming) order,
+        TSV and folder inputs are probed up front and ordered longest first, so the
+        longest files do not end up running alone at the end. Unprobeable files go first.
+        """
+        if self.sources is not None:
+            for source in self.sources:
+                yield source, probe_duration(source.audio_path)
+            return
+
+        sources = list(self._iter_sources())
+        durations = DurationCache(self.duration_cache).durations(
+            [source.audio_path for source in sources]
+        )
+        order = sorted(
+            range(len(sources)),
+            key=lambda i: -(durations[i] if durations[i] is not None else float("inf")),
+        )
+        for i in order:
+            yield sources[i], durations[i]
+
+    def _process_in_pool(self) -> None:
+        budget = (
+            self.decode_memory_budget_mb * 2**20
+            if self.decode_memory_budget_mb
+            else None
+        )
+        pending: Dict = {}
+        in_flight = 0
+
+        def collect(block: bool) -> int:
+            freed = 0
+            while True:
+                for result in [r for r in pending if r.ready()]:
+                    records, filtered = result.get()
+                    if records is not None:
                         self.write_records(records, self.output)
-                    except Exception as e:
-                        print(e)
-                        print(f"Skipping {srt_path} due to an error in the transcript")
-                    finally:
-                        self.language = orig_lang
+                    self.filtered_segment_records.extend(filtered)
+                    freed += pending.pop(result)
+                    progress.update(1)
+                if freed or not block or not pending:
+                    return freed
+                next(iter(pending)).wait(0.1)
+
+        with Executor(
+            self.n_jobs, initializer=_init_worker, initargs=(self,)
+        ) as executor, tqdm(total=self._count_sources()) as progress:
+            for source, duration in self._scheduled_sources():
+                # The ffmpeg backend does not decode sources in Python.
+                cost = 0 if self.segment_backend == "ffmpeg" else _decoded_bytes(duration)
+                # At least one source always runs, even if it alone exceeds the budget.
+                while pending and (
+                    len(pending) >= 2 * self.n_jobs
+                    or (budget is not None and in_flight + cost > budget)
+                ):
+                    in_flight -= collect(block=True)
+                result = executor.apply_async(_process_source_in_worker, (source,))
+                pending[result] = cost
+                in_flight += cost
+                in_flight -= collect(block=False)
+            while pending:
+                collect(block=True)
+
+    def _count_sources(self) -> Optional[int]:
+        if self.sources is not None:
+            return None
+        if self.transcripts_tsv:
+            return len(self._transcripts_manifest())
+        return len(self._audio_files())
+
+    def _transcripts_manifest(self):
+        # Read once, shared by `_count_sources` and `_iter_sources`.
+        if self._manifest is None:
+            self._manifest = load_transcripts_manifest(
+                self.transcripts_tsv,
+                validate=True,
+                num_shards=self.num_shards,
+                shard_index=self.shard_index,
+            )
+        return self._manifest
+
+    def _audio_files(self) -> List[Path]:
+        # Sorted, so every shard sees the same order.
+        audio_files = sorted(Path(self.audio_dir).iterdir())
+        return audio_files[self.shard_index :: self.num_shards]
+
+    def _iter_sources(self) -> Iterator[Source]:
+        if self.sources is not None:
+            yield from self.sources
             return
-        audio_paths = list(Path(self.audio_dir).iterdir())
 
-        for audio_path in tqdm(audio_paths):
-            speech_id = audio_path.stem
-            transcript_found = False
+        if self.transcripts_tsv:
+            for row in self._transcripts_manifest().itertuples(index=False):
+                yield Source(
+                    audio_path=Path(row.audio_path),
+                    transcript_path=Path(row.srt_path),
+                    speech_id=row.id,
+                    language=row.language,
+                )
+            return
 
+        for audio_path in self._audio_files():
+            speech_id = audio_path.stem
             for format in self.transcript_formats:
                 transcript_path = Path(self.transcript_dir) / format.format(
                     id=speech_id
                 )
                 if transcript_path.exists():
-                    try:
-                        if transcript_path.suffix == ".srt":
-                            utterances_for_speech = self.read_utterances_from_srt(
-                                transcript_path, self.normalize_unicode
-                            )
-                        elif transcript_path.suffix == ".vtt":
-                            utterances_for_speech = self.read_utterances_from_vtt(
-                                transcript_path, self.normalize_unicode
-                            )
-                        # Sanitize utterances, if necessary.
-                        # Takes care of some random timestamps error produces by the VAD of whisperx.
-                        if not self._is_valid_utterances(utterances_for_speech, 0):
-                            utterances_for_speech = self._sanitize_utterances(
-                                utterances_for_speech
-                            )
-                        records = self._create_records_with_timestamps(
-                            utterances_for_speech, audio_path
-                        )
-                        self.write_records(records, self.output)
-                        transcript_found = True
-                        break
-                    except Exception as e:
-                        print(e)
-                        print(
-                            f"Skipping {transcript_path} due to an error in the transcript"
-                        )
-                        continue
-
-            if not transcript_found:
+                    yield Source(audio_path, transcript_path, speech_id)
+                    break
+            else:
                 raise FileNotFoundError(f"Transcript file not found for {speech_id}")
 
+    def _prefetched(
+        self, sources: Iterable[Source]
+    ) -> Iterator[Tuple[Source, Optional[Future]]]:
+        """
+        Yield `(source, decoded_audio)` where the audio of the next `prefetch` sources is
+        decoded (`load_audio`, an ffmpeg subprocess) in background threads while the
+        current one is cut and encoded. Decoding pauses while the estimated decoded audio
+        exceeds `decode_memory_budget_mb`. With `prefetch=0` the audio is None and decoded
+        when the source is processed.
+        """
+        if self.prefetch <= 0 or self.segment_backend == "ffmpeg":
+            for source in sources:
+                yield source, None
+            return
+
+        budget = (
+            self.decode_memory_budget_mb * 2**20
+            if self.decode_memory_budget_mb
+            else None
+        )
+        window: Deque[Tuple[Source, Future, int]] = deque()
+        in_flight = 0
+        with ThreadPoolExecutor(max_workers=self.prefetch) as executor:
+            for source in sources:
+                cost = _decoded_bytes(probe_duration(source.audio_path))
+                while window and (
+                    len(window) > self.prefetch
+                    or (budget is not None and in_flight + cost > budget)
+                ):
+                    head, audio, head_cost = window.popleft()
+                    yield head, audio
+                    in_flight -= head_cost
+                window.append(
+                    (source, executor.submit(_load_audio, source.audio_path), cost)
+                )
+                in_flight += cost
+            while window:
+                head, audio, _ = window.popleft()
+                yield head, audio
+
+    @span("data_processor.source")
+    def _process_source(
+        self, source: Source, audio: Optional[Future] = None
+    ) -> Optional[List[Record]]:
+        """
+        Cut one source into records. Returns None if the transcript could not be processed.
+        Segment-level word filtering is only applied to `transcripts_tsv` inputs.
+        *audio* is the source's audio being decoded by `_prefetched`, if any.
+        """
+        transcript_path = self._transcript_to_read(source.transcript_path)
+        filter_words = self.filter_segment_words if self.transcripts_tsv else None
+        orig_lang = self.language
+        self.language = source.language or self.language
+        filtered_for_speech: List[dict] = []
+        with profiled(str(source.audio_path)):
+            try:
+                if transcript_path.suffix == ".srt":
+                    utterances = self.read_utterances_from_srt(
+                        transcript_path,
+                        self.normalize_unicode,
+                        filter_words,
+                        filtered_for_speech,
+                        source.speech_id,
+                    )
+                elif transcript_path.suffix == ".vtt":
+                    utterances = self.read_utterances_from_vtt(
+                        transcript_path,
+                        self.normalize_unicode,
+                        filter_words,
+                        filtered_for_speech,
+                        source.speech_id,
+                    )
+                else:
+                    raise ValueError(
+                        f"Unsupported transcript format: {transcript_path.suffix}"
+                    )
+                self.filtered_segment_records.extend(filtered_for_speech)
+                # Sanitize utterances, if necessary.
+                # Takes care of some random timestamps error produces by the VAD of whisperx.
+                if not self._is_valid_utterances(utterances, 0):
+                    utterances = self._sanitize_utterances(utterances)
+                blocked_intervals = [
+                    (r["start_ms"], r["end_ms"]) for r in filtered_for_speech
+                ]
+                records = self._create_records_with_timestamps(
+                    utterances,
+                    source.audio_path,
+                    source.speech_id,
+                    blocked_intervals=blocked_intervals,
+                    audio=audio.result() if audio is not None else None,
+                )
+                inc("sources_done_total")
+                inc("segments_written_total", len(records))
+                return records
+            except Exception as e:
+                print(e)
+                print(f"Skipping {transcript_path} due to an error in the transcript")
+                inc("sources_failed_total")
+                return None
+            finally:
+                self.language = orig_lang
+
+    def _transcript_to_read(self, transcript_path: Path) -> Path:
+        override = self.transcript_overrides.get(str(transcript_path))
+        return Path(override) if override else transcript_path
+
     @staticmethod
+    @span("data_processor.parse")
     def read_utterances_from_srt(
         transcript_path: Union[str, Path],
         normalize_unicode: bool = False,
@@ -402,6 +677,7 @@ class DataProcessor:
         return utterances
 
     @staticmethod
+    @span("data_processor.parse")
     def read_utterances_from_vtt(
         transcript_path: Union[str, Path],
         normalize_unicode: bool = False,
@@ -507,143 +783,248 @@ class DataProcessor:
         audio_path: Path,
         speech_id: Optional[str] = None,
         blocked_intervals: Optional[List[tuple]] = None,
+        audio: Optional[np.ndarray] = None,
     ) -> List[Record]:
-        audio = torch.tensor(load_audio(audio_path))
+        if self.segment_backend == "ffmpeg":
+            # ffmpeg reads the source itself, only its length is needed here.
+            duration = probe_duration(audio_path)
+            if duration is None:
+                raise ValueError(f"Could not probe the duration of {audio_path}")
+            audio_duration_ms = int(duration * 1000)
+        else:
+            if audio is None:
+                audio = _load_audio(audio_path)
+            audio = torch.from_numpy(audio)
+            audio_duration_ms = int(audio.size(0) * 1000 / SAMPLE_RATE)
         dump_dir = Path(self.dump_dir) / (speech_id if speech_id else audio_path.stem)
         dump_dir.mkdir(parents=True, exist_ok=True)
-        audio_duration_ms = int(audio.size(0) * 1000 / SAMPLE_RATE)
         safe_spans = self._get_safe_spans(audio_duration_ms, blocked_intervals or [])
         records = []
-        utterances = sorted(utterances, key=lambda u: u.start)
-        span_cursor = 0
-        for i, (span_start, span_end) in enumerate(safe_spans):
-            if span_start >= span_end:
-                continue
-            # Restart aggregation across filtered-word gaps.
-            prompt_buffer: Deque[PromptNode] = deque()
-
-            span_utterances = []
-            while span_cursor < len(utterances):
-                utterance = utterances[span_cursor]
-                if utterance.end is None or utterance.start is None:
-                    span_cursor += 1
-                    continue
-                if utterance.end <= span_start:
-                    span_cursor += 1
+        encodes: List[Future] = []
+        segment_plan: SegmentPlan = []
+        # Per source, so no encoder threads outlive it. Leaving early (a failed source)
+        # cancels the queued encodes and waits for the running ones, so no more files
+        # are written for it.
+        encoder = (
+            ThreadPoolExecutor(max_workers=self.encode_workers)
+            if self.encode_workers > 0 and self.segment_backend != "ffmpeg"
+            else None
+        )
+        try:
+            utterances = sorted(utterances, key=lambda u: u.start)
+            span_cursor = 0
+            for i, (span_start, span_end) in enumerate(safe_spans):
+                if span_start >= span_end:
                     continue
-                if utterance.start >= span_end:
-                    break
-                # Defensive: if a subtitle intersects a blocked interval boundary, drop it.
-                if utterance.start < span_start or utterance.end > span_end:
+                # Restart aggregation across filtered-word gaps.
+                prompt_buffer: Deque[PromptNode] = deque()
+
+                span_utterances = []
+                while span_cursor < len(utterances):
+                    utterance = utterances[span_cursor]
+                    if utterance.end is None or utterance.start is None:
+                        span_cursor += 1
+                        continue
+                    if utterance.end <= span_start:
+                        span_cursor += 1
+                        continue
+                    if utterance.start >= span_end:
+                        break
+                    # Defensive: if a subtitle intersects a blocked interval boundary, drop it.
+                    if utterance.start < span_start or utterance.end > span_end:
+                        span_cursor += 1
+                        continue
+                    span_utterances.append(utterance)
                     span_cursor += 1
+
+                if not span_utterances:
                     continue
-                span_utterances.append(utterance)
-                span_cursor += 1
 
-            if not span_utterances:
-                continue
+                # Optionally trim initial audio only for the first safe span.
+                if i == 0 and self.cut_initial_audio:
+                    segment_start = max(span_start, span_utterances[0].start - 1000)
+                else:
+                    segment_start = span_start
 
-            # Optionally trim initial audio only for the first safe span.
-            if i == 0 and self.cut_initial_audio:
-                segment_start = max(span_start, span_utterances[0].start - 1000)
-            else:
-                segment_start = span_start
+                idx = 0
+                while idx < len(span_utterances):
+                    segment_end = min(segment_start + DURATION, span_end)
+                    if segment_start >= segment_end:
+                        break
 
-            idx = 0
-            while idx < len(span_utterances):
-                segment_end = min(segment_start + DURATION, span_end)
-                if segment_start >= segment_end:
-                    break
+                    # If the utterance is included in the segment and longer than the segment, skip it.
+                    if (
+                        span_utterances[idx].start < segment_end
+                        and span_utterances[idx].start + DURATION < span_utterances[idx].end
+                    ):
+                        segment_start = span_utterances[idx].end
+                        idx += 1
+                        continue
 
-                # If the utterance is included in the segment and longer than the segment, skip it.
-                if (
-                    span_utterances[idx].start < segment_end
-                    and span_utterances[idx].start + DURATION < span_utterances[idx].end
-                ):
-                    segment_start = span_utterances[idx].end
-                    idx += 1
-                    continue
+                    segment_audio_path = self._segment_audio_path(segment_start, dump_dir)
+                    prompt = self._get_prompt(prompt_buffer)
 
-                segment_audio_path = self._save_segment_audio(
-                    audio, segment_start, segment_end, dump_dir
-                )
-                prompt = self._get_prompt(prompt_buffer)
-
-                segment_utterances = []
-                while idx < len(span_utterances) and span_utterances[idx].start < segment_end:
-                    segment_utterances.append(span_utterances[idx])
-                    idx += 1
-
-                if not self._is_valid_utterances(segment_utterances, segment_start):
-                    tqdm.write(
-                        f"Skipping {audio_path} ({format_timestamp(segment_start / 1000)}-"
-                        f"{format_timestamp(segment_end / 1000)}) because it contains invalid "
-                        f"utterances: {segment_utterances}"
-                    )
-                    prompt_buffer.clear()
-                    segment_start = max(segment_end, segment_utterances[-1].end)
-                    continue
+                    segment_utterances = []
+                    while idx < len(span_utterances) and span_utterances[idx].start < segment_end:
+                        segment_utterances.append(span_utterances[idx])
+                        idx += 1
 
-                tokens_length = 0
-                segment_text = []
-                for utterance in segment_utterances:
-                    start_token = self._get_time_token(
-                        utterance.start, segment_start, audio_path
-                    )
-                    if utterance.end <= segment_end:
-                        end_token = self._get_time_token(
-                            utterance.end, segment_start, audio_path
+                    if not self._is_valid_utterances(segment_utterances, segment_start):
+                        tqdm.write(
+                            f"Skipping {audio_path} ({format_timestamp(segment_start / 1000)}-"
+                            f"{format_timestamp(segment_end / 1000)}) because it contains invalid "
+                            f"utterances: {segment_utterances}"
                         )
-                        utterance_text = self._add_leading_space(utterance.text)
-                        segment_text.extend([start_token, utterance_text, end_token])
-                        new_prompt_length = len(self.tokenizer.encode(utterance_text)) + 2
-                        new_prompt_node = PromptNode(
-                            start_token + utterance_text + end_token, new_prompt_length
+                        prompt_buffer.clear()
+                        segment_start = max(segment_end, segment_utterances[-1].end)
+                        continue
+
+                    tokens_length = 0
+                    segment_text = []
+                    with span("data_processor.tokenize"):
+                        for utterance in segment_utterances:
+                            start_token = self._get_time_token(
+                                utterance.start, segment_start, audio_path
+                            )
+                            if utterance.end <= segment_end:
+                                end_token = self._get_time_token(
+                                    utterance.end, segment_start, audio_path
+                                )
+                                utterance_text = self._add_leading_space(utterance.text)
+                                segment_text.extend([start_token, utterance_text, end_token])
+                                new_prompt_length = (
+                                    len(self.tokenizer.encode(utterance_text)) + 2
+                                )
+                                new_prompt_node = PromptNode(
+                                    start_token + utterance_text + end_token,
+                                    new_prompt_length,
+                                )
+                                tokens_length += new_prompt_length
+                            else:
+                                segment_text.append(start_token)
+                                new_prompt_node = PromptNode(start_token, 1)
+                                tokens_length += 1
+
+                            prompt_buffer.append(new_prompt_node)
+
+                    if tokens_length > self.max_tokens_length:
+                        tqdm.write(
+                            f"Skipping {audio_path} ({format_timestamp(segment_start / 1000)}-"
+                            f"{format_timestamp(segment_end / 1000)}) because it is too long "
+                            f"({tokens_length} tokens)"
                         )
-                        tokens_length += new_prompt_length
                     else:
-                        segment_text.append(start_token)
-                        new_prompt_node = PromptNode(start_token, 1)
-                        tokens_length += 1
-
-                    prompt_buffer.append(new_prompt_node)
-
-                if tokens_length > self.max_tokens_length:
-                    tqdm.write(
-                        f"Skipping {audio_path} ({format_timestamp(segment_start / 1000)}-"
-                        f"{format_timestamp(segment_end / 1000)}) because it is too long "
-                        f"({tokens_length} tokens)"
-                    )
-                else:
-                    record = Record(
-                        audio_path=segment_audio_path,
-                        language=self.language,
-                        text="".join(segment_text),
-                        prompt=prompt,
+                        if self.segment_backend == "ffmpeg":
+                            segment_plan.append(
+                                (segment_start, segment_end, segment_audio_path)
+                            )
+                        else:
+                            encodes.append(
+                                self._submit_encode(
+                                    encoder,
+                                    audio,
+                                    segment_start,
+                                    segment_end,
+                                    segment_audio_path,
+                                    encodes,
+                                )
+                            )
+                        record = Record(
+                            audio_path=segment_audio_path,
+                            language=self.language,
+                            text="".join(segment_text),
+                            prompt=prompt,
+                        )
+                        records.append(record)
+
+                    if len(segment_utterances) == 0:
+                        segment_start += DURATION
+                    elif segment_utterances[-1].end <= segment_end:
+                        segment_start = segment_utterances[-1].end
+                    else:  # segment_utterances[-1].end > segment_end
+                        # The text of the last utterance was not included in the segment and will be
+                        # included in the next segment
+                        segment_start = segment_utterances[-1].start
+                        idx -= 1
+
+            # The records are only handed out once every segment was written; a failed
+            # encode fails the whole source.
+            for encode in encodes:
+                encode.result()
+        finally:
+            if encoder is not None:
+                encoder.shutdown(cancel_futures=True)
+        if segment_plan:
+            with span("data_processor.encode"):
+                empty = set(
+                    write_segments_ffmpeg(
+                        audio_path, segment_plan, stream_copy=self.segment_stream_copy
                     )
-                    records.append(record)
-
-                if len(segment_utterances) == 0:
-                    segment_start += DURATION
-                elif segment_utterances[-1].end <= segment_end:
-                    segment_start = segment_utterances[-1].end
-                else:  # segment_utterances[-1].end > segment_end
-                    # The text of the last utterance was not included in the segment and will be
-                    # included in the next segment
-                    segment_start = segment_utterances[-1].start
-                    idx -= 1
-
+                )
+            if empty:
+                # The probed duration was longer than the audio ffmpeg decoded.
+                tqdm.write(
+                    f"Dropping {len(empty)} segments of {audio_path} past the end of "
+                    f"its audio"
+                )
+                records = [r for r in records if r.audio_path not in empty]
+        inc("audio_seconds_processed_total", audio_duration_ms / 1000)
         return records
 
+    def _segment_audio_path(self, segment_start: int, dump_dir: Path) -> str:
+        return str((dump_dir / f"{segment_start}.{self.audio_format}").absolute())
+
+    def _submit_encode(
+        self,
+        encoder: Optional[ThreadPoolExecutor],
+        audio: torch.Tensor,
+        segment_start: int,
+        segment_end: int,
+        segment_audio_path: str,
+        pending: List[Future],
+    ) -> Future:
+        """
+        Encode a segment on the *encoder* threads (`encode_workers`), or right away if
+        there are none. At most two encodes per thread are queued, so the planning loop
+        cannot run far ahead of the encoders.
+        """
+        if encoder is None:
+            future: Future = Future()
+            future.set_result(
+                self._save_segment_audio(
+                    audio, segment_start, segment_end, segment_audio_path
+                )
+            )
+            return future
+
+        queued = [encode for encode in pending if not encode.done()]
+        set_gauge("encode_queue_depth", len(queued))
+        if len(queued) >= 2 * self.encode_workers:
+            wait(queued, return_when=FIRST_COMPLETED)
+        return encoder.submit(
+            self._save_segment_audio,
+            audio,
+            segment_start,
+            segment_end,
+            segment_audio_path,
+        )
+
+    @staticmethod
+    @span("data_processor.encode")
     def _save_segment_audio(
-        self, audio: torch.Tensor, segment_start: int, segment_end: int, dump_dir: Path
+        audio: torch.Tensor, segment_start: int, segment_end: int, segment_audio_path: str
     ) -> str:
         audio_start_idx = int(segment_start * SAMPLE_RATE / 1000)
         audio_end_idx = int(segment_end * SAMPLE_RATE / 1000)
-        segment_audio_path = str((dump_dir / f"{segment_start}.mp3").absolute())
         segment_audio = audio[
             audio_start_idx : min(audio_end_idx, audio_start_idx + DURATION_IN_SAMPLES, audio.size(0))
         ]
+        audio_format = Path(segment_audio_path).suffix[1:]
+        if audio_format != "mp3":
+            write_audio(
+                segment_audio_path, segment_audio.numpy(), SAMPLE_RATE, audio_format
+            )
+            return segment_audio_path
         with warnings.catch_warnings():
             warnings.filterwarnings(
                 "ignore",
@@ -712,18 +1093,10 @@ class DataProcessor:
                 return False
 
         # Check for repeated words three or more times consecutively
-        last_text = utterances[0].text
-        repeat_count = 1
-        for i in range(1, len(utterances)):
-            if utterances[i].text == last_text:
-                repeat_count += 1
-                if repeat_count >= self.rep_threshold:
-                    return False
-            else:
-                last_text = utterances[i].text
-                repeat_count = 1
-
-        return True
+        return all(
+            run.repeats < self.rep_threshold
+            for run in find_repeats([u.text for u in utterances], max_n=1)
+        )
 
     def _add_leading_space(self, text: str) -> str:
         """
@@ -810,6 +1183,7 @@ class DataProcessor:
         return records
 
     @staticmethod
+    @span("data_processor.write")
     def write_records(records: List[Record], path: Union[str, Path]) -> None:
         with open(path, "a", encoding="utf-8") as f:
             for record in records:
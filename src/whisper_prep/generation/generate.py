@@ -2,30 +2,34 @@ import random
 import uuid
 from functools import partial
 from inspect import signature
-from multiprocessing.pool import Pool
 from pathlib import Path
-from typing import Union
+from typing import Iterator, Optional, Union
 
 import pandas as pd
 from pydub import AudioSegment
-from tqdm import tqdm
 
-from whisper_prep.audio.io import read_audio, save_audio_segment
-from whisper_prep.audio.vad import silero_vad_collector
+from whisper_prep.audio.io import check_audio_format, read_audio, save_audio_segment
+from whisper_prep.audio.vad import load_silero_model, silero_vad_collector
 from whisper_prep.dataset.convert import combine_tsvs_to_dataframe
+from whisper_prep.executor import Executor
+from whisper_prep.instrumentation import span
+from whisper_prep.metrics import flush_metrics, inc
+from whisper_prep.profiling import profiled
+from whisper_prep.sharding import in_shard
+from whisper_prep.workqueue import WorkQueue
 from whisper_prep.subtitling.srt import Caption, generate_srt
-from whisper_prep.generation.text_normalizer import normalize_text as normalize_text_
+from whisper_prep.generation.text_normalizer import normalize_many
 
 
 def _get_number_of_rows(speaker_groups) -> int:
     return sum(len(data) for _, data in speaker_groups.items())
 
 
-def _return_random_example(speaker_groups):
+def _return_random_example(speaker_groups, rng: random.Random):
     filtered_speaker = pd.DataFrame()
     while len(filtered_speaker) == 0:
         # Choose a random speaker
-        speaker = random.choice(list(speaker_groups.keys()))
+        speaker = rng.choice(list(speaker_groups.keys()))
         # Further filter to find segments from the chosen speaker
         filtered_speaker = speaker_groups[speaker]
     return filtered_speaker.iloc[0]
@@ -39,35 +43,32 @@ def _generate_wrapper(
     max_overlap_chance: float,
     max_overlap_duration: float,
     audio_format: str,
-) -> None:
+    file_name: Optional[str] = None,
+) -> Optional[list[str]]:
     try:
-        return _generate(
-            constructed_samples=sample,
-            audios_folder=audios_folder,
-            transcripts_folder=transcripts_folder,
-            overlap_chance=overlap_chance,
-            max_overlap_chance=max_overlap_chance,
-            max_overlap_duration=max_overlap_duration,
-            audio_format=audio_format,
-        )
+        # Sampled for profiling by the first clip of the sequence.
+        with profiled(str(sample[0]["path"])):
+            save_paths = _generate(
+                constructed_samples=sample,
+                audios_folder=audios_folder,
+                transcripts_folder=transcripts_folder,
+                overlap_chance=overlap_chance,
+                max_overlap_chance=max_overlap_chance,
+                max_overlap_duration=max_overlap_duration,
+                audio_format=audio_format,
+                file_name=file_name,
+            )
+        inc("sequences_generated_total")
+        return save_paths
     except Exception as e:
         print(f"Error in sample {sample}: {e}")
+        inc("sequences_failed_total")
         return None
+    finally:
+        flush_metrics()
 
 
-def _execute_parallel_process(func, args, n_jobs: int) -> list:
-    # For small workloads, run sequentially to avoid multiprocessing overhead
-    if len(args) <= n_jobs:
-        results = []
-        for arg in args:
-            results.append(func(arg))
-        return results
-
-    with Pool(n_jobs) as executor:
-        results = list(tqdm(executor.imap_unordered(func, args), total=len(args)))
-    return results
-
-
+@span("generate.sequence")
 def _generate(
     constructed_samples: list[dict],
     audios_folder: Union[Path, str],
@@ -76,7 +77,8 @@ def _generate(
     max_overlap_chance: float,
     max_overlap_duration: float,
     audio_format: str = "mp3",
-) -> None:
+    file_name: Optional[str] = None,
+) -> list[str]:
     offset = 0
     current_seg_dur = 0
     current_seg_start = None
@@ -155,16 +157,18 @@ def _generate(
         offset += audio_segment.duration_seconds - overlap_move
         space_before_seconds = audio_duration_seconds - end_second
 
-    file_name = str(uuid.uuid4())
+    file_name = file_name or str(uuid.uuid4())
 
     save_path_audio = Path(audios_folder, f"{file_name}.{audio_format}")
     save_path_srt = Path(transcripts_folder, f"{file_name}.srt")
 
     save_audio_segment(combined_audio, save_path_audio, format=audio_format)
+    # Written last, so an existing transcript implies a complete audio file.
     generate_srt(captions, save_path_srt)
+    return [str(save_path_audio), str(save_path_srt)]
 
 
-def generate_fold_from_yaml(config: dict):
+def generate_fold_from_yaml(config: dict) -> list[str]:
     """See test.yaml in tests/assets/configs/test.yaml on the setup of the config."""
     # Get the list of parameters accepted by generate_fold
     generate_fold_params = signature(generate_fold).parameters
@@ -173,9 +177,10 @@ def generate_fold_from_yaml(config: dict):
     filtered_config = {k: v for k, v in config.items() if k in generate_fold_params}
 
     # Call generate_fold with the filtered configuration
-    generate_fold(**filtered_config)
+    return generate_fold(**filtered_config)
 
 
+@span("generate_fold")
 def generate_fold(
     tsv_paths: list[Union[str, Path]],
     clips_folders: list[Union[str, Path]],
@@ -190,9 +195,14 @@ def generate_fold(
     audio_format: str = "mp3",
     n_jobs: int = 4,
     seed: int = 42,
-) -> None:
+    num_shards: int = 1,
+    shard_index: int = 0,
+    work_queue: Optional[Union[str, Path]] = None,
+    work_queue_lease_timeout: float = 600.0,
+) -> list[str]:
     """
-    Generates a data fold for audio processing.
+    Generates a data fold for audio processing and returns the written audio and SRT
+    files (of the whole queue with *work_queue*).
 
     Parameters:
     - tsv_paths (list[Union[str, Path]]): List of paths to the .tsv files containing audio metadata.
@@ -204,12 +214,20 @@ def generate_fold(
     - overlap_chance (float): Probability that clips will overlap.
     - max_overlap_chance (float): Maximum allowed overlap probability.
     - max_overlap_duration (float): Maximum duration for overlap.
-    - audio_format (str): Desired audio format for output files.
+    - audio_format (str): Desired audio format for output files (mp3, flac, opus or wav).
     - n_jobs (int, optional): Number of jobs to run in parallel. Default is 2.
     - seed (int, optional): Seed for random number generation. Default is 42.
+    - num_shards (int, optional): Number of nodes the fold is split across. Default is 1.
+    - shard_index (int, optional): Which sequences this node renders. Every shard builds
+      the same sequences (they only depend on the inputs and the seed) and keeps those
+      whose position modulo num_shards equals shard_index. Default is 0.
+    - work_queue (Union[str, Path], optional): Shared folder of a `WorkQueue`. Instead of a
+      static partition, every worker process (local or on other nodes) leases one
+      sequence at a time from `<work_queue>/generate`. Default is None.
+    - work_queue_lease_timeout (float, optional): Seconds without heartbeat after which a
+      leased sequence is given to another worker. Default is 600.
     """
-    data = combine_tsvs_to_dataframe(tsv_paths, clips_folders, partials=partials)
-
+    check_audio_format(audio_format)
     Path(out_folder).mkdir(parents=True, exist_ok=True)
 
     audios_folder = Path(out_folder, "audios")
@@ -217,15 +235,89 @@ def generate_fold(
     transcripts_folder = Path(out_folder, "transcripts")
     transcripts_folder.mkdir(parents=True, exist_ok=True)
 
+    generate_ = partial(
+        _generate_wrapper,
+        audios_folder=audios_folder,
+        transcripts_folder=transcripts_folder,
+        overlap_chance=overlap_chance,
+        max_overlap_chance=max_overlap_chance,
+        max_overlap_duration=max_overlap_duration,
+        audio_format=audio_format,
+    )
+
+    sequences = partial(
+        _iter_sequences,
+        tsv_paths=tsv_paths,
+        clips_folders=clips_folders,
+        partials=partials,
+        maintain_speaker_chance=maintain_speaker_chance,
+        n_samples_per_srt=n_samples_per_srt,
+        normalize_text=normalize_text,
+        seed=seed,
+        n_jobs=n_jobs,
+    )
+
+    if work_queue:
+        return _generate_from_queue(
+            Path(work_queue, "generate"),
+            sequences,
+            generate_,
+            n_jobs,
+            {"lease_timeout": work_queue_lease_timeout},
+        )
+
+    written = []
+    constructed_samples = []
+    # One pool for all batches; every worker loads the VAD model once.
+    with Executor(n_jobs, initializer=load_silero_model) as executor:
+        for n_sequences, sequence in enumerate(sequences()):
+            if in_shard(n_sequences, num_shards, shard_index):
+                constructed_samples.append(sequence)
+
+            # If there are too many SRTs, the list is getting to big and append to list will come to a halt.
+            if (
+                len(constructed_samples) * n_samples_per_srt > 50000
+            ):  # Lists starts to get extremely slow if it has more than 50k items.
+                # Parallel execution with progress tracking
+                results = executor.map(generate_, constructed_samples)
+                written.extend(path for paths in results if paths for path in paths)
+                constructed_samples = []
+
+        # Parallel execution with progress tracking
+        results = executor.map(generate_, constructed_samples)
+        written.extend(path for paths in results if paths for path in paths)
+    return written
+
+
+def _iter_sequences(
+    tsv_paths: list[Union[str, Path]],
+    clips_folders: list[Union[str, Path]],
+    partials: list[float],
+    maintain_speaker_chance: float,
+    n_samples_per_srt: int,
+    normalize_text: bool,
+    seed: int,
+    n_jobs: int = 1,
+) -> Iterator[list[dict]]:
+    """Yield the sentence sequences of the fold, each rendered into one audio + SRT.
+    The sequences only depend on the inputs and the seed."""
+    data = combine_tsvs_to_dataframe(
+        tsv_paths, clips_folders, partials=partials, seed=seed
+    )
+    if normalize_text:
+        # Once per distinct sentence, in n_jobs processes, before the sequential sampling.
+        data["sentence"] = normalize_many(data["sentence"].tolist(), n_jobs=n_jobs)
+    rng = random.Random(seed)
+
     # Shuffle the dataset
     data = data.sample(frac=1, random_state=seed)
 
     # Initialize variables
     last_speaker = None
-    constructed_samples = []
     data["picked"] = 0
     sequence = []
     n_samples_picked = 0
+    n_sequences = 0
 
     fold_data = data.copy()
 
@@ -235,7 +327,7 @@ def generate_fold(
 
     while remaining_samples > 0:
         # Check if the current segment should maintain the same speaker as the previous segment
-        if last_speaker is not None and random.random() < maintain_speaker_chance:
+        if last_speaker is not None and rng.random() < maintain_speaker_chance:
             # Further filter to find segments from the same speaker
             filtered_speaker = speaker_groups[last_speaker]
             # Choose a segment from the same speaker if available
@@ -243,10 +335,10 @@ def generate_fold(
                 sample = filtered_speaker.iloc[0]
                 # If no segment from the same speaker, choose from any available segments
             else:
-                sample = _return_random_example(speaker_groups)
+                sample = _return_random_example(speaker_groups, rng)
         else:
             # If maintaining the same speaker is not required, choose any available segment
-            sample = _return_random_example(speaker_groups)
+            sample = _return_random_example(speaker_groups, rng)
 
         # Extract sentence and audio file path from the chosen sample
         sentence = sample["sentence"]
@@ -256,10 +348,6 @@ def generate_fold(
         fold_data.loc[sample.name, "picked"] = 1
         remaining_samples -= 1
 
-        # Normalize the sentence
-        if normalize_text:
-            sentence = normalize_text_(sentence)
-
         # Remove sample for speaker groups
         speaker_groups[last_speaker] = speaker_groups[last_speaker].iloc[1:]
 
@@ -274,45 +362,52 @@ def generate_fold(
 
         # Check if the limit of samples has been reached
         if n_samples_picked >= n_samples_per_srt:
-            # Add the completed sequence to the list of constructed samples
-            constructed_samples.append(sequence)
+            yield sequence
+            n_sequences += 1
             print(f"Used {len(sequence)} samples for this SRT.")
             sequence = []
             n_samples_picked = 0
-            print(f"Constructed {len(constructed_samples)} SRTs.")
+            print(f"Constructed {n_sequences} SRTs.")
             print(f"Remaining samples: {remaining_samples}")
 
-        # If there are too many SRTs, the list is getting to big and append to list will come to a halt.
-        if (
-            len(constructed_samples) * n_samples_per_srt > 50000
-        ):  # Lists starts to get extremely slow if it has more than 50k items.
-            generate_ = partial(
-                _generate_wrapper,
-                audios_folder=audios_folder,
-                transcripts_folder=transcripts_folder,
-                overlap_chance=overlap_chance,
-                max_overlap_chance=max_overlap_chance,
-                max_overlap_duration=max_overlap_duration,
-                audio_format=audio_format,
-            )
-
-            # Parallel execution with progress tracking
-            _execute_parallel_process(generate_, constructed_samples, n_jobs)
-            constructed_samples = []
-
     # Add the last sequence if it is not empty
     if len(sequence) > 0:
-        constructed_samples.append(sequence)
-
-    generate_ = partial(
-        _generate_wrapper,
-        audios_folder=audios_folder,
-        transcripts_folder=transcripts_folder,
-        overlap_chance=overlap_chance,
-        max_overlap_chance=max_overlap_chance,
-        max_overlap_duration=max_overlap_duration,
-        audio_format=audio_format,
+        yield sequence
+
+
+def _drain_generation_queue(queue_dir: Path, generate_, queue_options: dict) -> int:
+    """Render leased sequences until the queue is empty. Files are named after the unit,
+    so a unit that is rendered again (after a crash) overwrites its earlier output."""
+    queue = WorkQueue(queue_dir, **queue_options)
+    n_rendered = 0
+    for lease in queue.leases():
+        with lease:
+            save_paths = generate_(
+                lease.unit["samples"], file_name=f"seq-{lease.unit_id}"
+            )
+            lease.commit({"files": save_paths})
+        n_rendered += 1
+    return n_rendered
+
+
+def _generate_from_queue(
+    queue_dir: Path, sequences, generate_, n_jobs: int, queue_options: dict
+) -> list[str]:
+    queue = WorkQueue(queue_dir, **queue_options)
+    queue.populate(lambda: ({"samples": sequence} for sequence in sequences()))
+
+    # Every process leases on its own, so local processes and other nodes share the queue.
+    drain = partial(
+        _drain_generation_queue,
+        queue_dir,
+        generate_,
+        queue_options=queue_options,
     )
-
-    # Parallel execution with progress tracking
-    _execute_parallel_process(generate_, constructed_samples, n_jobs)
+    if n_jobs <= 1:
+        n_rendered = drain()
+    else:
+        with Executor(n_jobs, initializer=load_silero_model) as executor:
+            drains = [executor.apply_async(drain) for _ in range(n_jobs)]
+            n_rendered = sum(result.get() for result in drains)
+    print(f"Rendered {n_rendered} sequences from {queue_dir}")
+    return [path for result in queue.results() for path in result["files"] or []]
@@ -1,5 +1,9 @@
 import re
 import unicodedata
+from typing import Dict, Iterable, List, Tuple, Union
+
+from whisper_prep.executor import Executor
+from whisper_prep.repetition import collapse_repeats
 
 APOS_TABLE = str.maketrans(
     {
@@ -13,62 +17,167 @@ APOS_TABLE = str.maketrans(
     }
 )
 
+# German abbreviations expanded when they stand alone (case-insensitive).
+ABBREVIATIONS = {
+    "Std.": "Stunden",
+    "Min.": "Minuten",
+    "Sek.": "Sekunden",
+    "Jr.": "Jahr",
+    "Tg.": "Tage",
+    "m ü. M.": "Meter über Meer",
+    "u.a.": "unter anderem",
+    "sog.": "sogenannte",
+    "bzw.": "beziehungsweise",
+    "ca.": "circa",
+    "z.B.": "zum Beispiel",
+    "d.h.": "das heisst",
+    "D.h": "das heisst",
+    "etc.": "et cetera",
+    "z.T.": "zum Teil",
+    "i.d.R.": "in der Regel",
+    "u.v.m.": "und vieles mehr",
+    "Nr.": "Nummer",
+    "b.a.w.": "bis auf weiteres",
+    "n.Chr.": "nach Christus",
+    "v.Chr.": "vor Christus",
+    "ggf.": "gegebenenfalls",
+    "evtl.": "eventuell",
+    "u.U.": "unter Umständen",
+    "v.a.": "vor allem",
+    "vgl.": "vergleiche",
+    "inkl.": "inklusive",
+    "zzgl.": "zuzüglich",
+    "u.s.w.": "und so weiter",
+    "bzgl.": "bezüglich",
+    "s.a.": "siehe auch",
+    "bspw.": "beispielsweise",
+    "Hbf.": "Hauptbahnhof",
+    "Dr.": "Doktor",
+    "Dipl.": "Diplom",
+    "Univ.": "Universität",
+    "km/h": "Kilometer pro Stunde",
+    "ms/s": "Meter pro Sekunde",
+    "Gebr.": "Gebrüder",
+    "äSEND$": " ",
+    "Mio.": "Millionen",
+    "Mia.": "Milliarden",
+    "ähm": "",
+    "äh": "",
+    "hm": "",
+    "hm...": "",
+    "Öhh...": "",
+    "Öhh": "",
+}
+
+# Unicode and typographic characters, applied in this order.
+REPLACEMENTS = {
+    # –––– Invisible / spacing chars ––––––––––––––––––––––––––––––––––––––––
+    "\u00a0": " ",  # NO-BREAK SPACE → plain space
+    "\u202f": " ",  # NARROW NO-BREAK SPACE → space
+    "\u200b": "",  # ZERO-WIDTH SPACE
+    "\u200c": "",  # ZERO-WIDTH NON-JOINER
+    "\u200d": "",  # ZERO-WIDTH JOINER
+    "\u2060": "",  # WORD-JOINER
+    # –––– Quotes & apostrophes –––––––––––––––––––––––––––––––––––––––––––––
+    "‘": "'",
+    "’": "'",
+    "‚": "'",
+    "‛": "'",
+    "“": '"',
+    "”": '"',
+    "«": '"',
+    "»": '"',
+    "„": '"',
+    "‟": '"',
+    # –––– Dashes & hyphens ––––––––––––––––––––––––––––––––––––––––––––––––
+    "-": "-",  # NON-BREAKING HYPHEN
+    "–": "-",  # EN-DASH
+    "—": "-",  # EM-DASH
+    "−": "-",  # MINUS SIGN
+    "--": "-",  # double NB-hyphen → single
+    # –––– Ellipsis ––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+    "…": "...",
+    # –––– Ligatures & spelling variants –––––––––––––––––––––––––––––––––––
+    "ﬁ": "fi",
+    "ﬂ": "fl",
+    "ﬀ": "ff",
+    "ß": "ss",
+    # –––– Bullets & list marks ––––––––––––––––––––––––––––––––––––––––––––
+    "•": "-",
+    "·": "-",
+    # –––– Accidental markup leftovers ––––––––––––––––––––––––––––––––––––
+    "<i>": "",
+    "</i>": "",
+    "<b>": "",
+    "</b>": "",
+    # –––– Catch-alls you already had ––––––––––––––––––––––––––––––––––––––
+    "\u00ad": "",  # SOFT HYPHEN
+    "- -": "-",  # double hyphen → single
+    "/, ": "",  # "Renter/, innen" → "Renterinnen"
+}
+
+# A compiled `{old: new}` mapping: `str.translate` tables and (gate, replacements) runs.
+ReplacementSteps = List[Union[Dict[int, str], Tuple[re.Pattern, List[Tuple[str, str]]]]]
+
+
+def compile_replacements(replacements: Dict[str, str]) -> ReplacementSteps:
+    """
+    Compile an ordered mapping that is applied with one `str.replace` per entry into steps
+    with the same result. Consecutive single characters become one `str.translate` table,
+    unless an earlier output of the table contains the character. Consecutive longer keys
+    are only replaced, in order, when one alternation regex finds any of them; replacements
+    may form keys of later entries (`"SGUSD"` → `"SGDollar"` → `"Dollarollar"`), so a single
+    regex substitution would not be equivalent.
+    """
+    steps = []
+    for old, new in replacements.items():
+        last = steps[-1] if steps else None
+        if len(old) == 1:
+            if isinstance(last, dict) and not any(old in out for out in last.values()):
+                last[old] = new
+            else:
+                steps.append({old: new})
+        elif isinstance(last, list):
+            last.append((old, new))
+        else:
+            steps.append([(old, new)])
+    return [
+        str.maketrans(step)
+        if isinstance(step, dict)
+        else (re.compile("|".join(re.escape(old) for old, _ in step)), step)
+        for step in steps
+    ]
+
+
+def apply_replacements(text: str, steps: ReplacementSteps) -> str:
+    for step in steps:
+        if isinstance(step, dict):
+            text = text.translate(step)
+        elif step[0].search(text):
+            for old, new in step[1]:
+                text = text.replace(old, new)
+    return text
+
+
+# One alternation with a group per abbreviation; the group index selects the expansion.
+# Expansions never form another abbreviation, so one pass equals one `sub` per entry.
+ABBREVIATION_RE = re.compile(
+    r"(^|\s)(?:"
+    + "|".join(f"({re.escape(abbr)})" for abbr in ABBREVIATIONS)
+    + r")(?=\s|$)",
+    re.IGNORECASE,
+)
+_EXPANSIONS = list(ABBREVIATIONS.values())
+_STANDARDIZE_STEPS = compile_replacements(REPLACEMENTS)
+_WEIRD_SPACES_RE = re.compile(r"[\u00A0\u202F\u200B\u200C\u200D\u2060]+")
+
+
+def _expand_abbreviation(match: re.Match) -> str:
+    return match.group(1) + _EXPANSIONS[match.lastindex - 2]
+
 
 def normalize_abbrv(text):
-    abbreviation_map = {
-        "Std.": "Stunden",
-        "Min.": "Minuten",
-        "Sek.": "Sekunden",
-        "Jr.": "Jahr",
-        "Tg.": "Tage",
-        "m ü. M.": "Meter über Meer",
-        "u.a.": "unter anderem",
-        "sog.": "sogenannte",
-        "bzw.": "beziehungsweise",
-        "ca.": "circa",
-        "z.B.": "zum Beispiel",
-        "d.h.": "das heisst",
-        "D.h": "das heisst",
-        "etc.": "et cetera",
-        "z.T.": "zum Teil",
-        "i.d.R.": "in der Regel",
-        "u.v.m.": "und vieles mehr",
-        "Nr.": "Nummer",
-        "b.a.w.": "bis auf weiteres",
-        "n.Chr.": "nach Christus",
-        "v.Chr.": "vor Christus",
-        "ggf.": "gegebenenfalls",
-        "evtl.": "eventuell",
-        "u.U.": "unter Umständen",
-        "v.a.": "vor allem",
-        "vgl.": "vergleiche",
-        "inkl.": "inklusive",
-        "zzgl.": "zuzüglich",
-        "u.s.w.": "und so weiter",
-        "bzgl.": "bezüglich",
-        "s.a.": "siehe auch",
-        "bspw.": "beispielsweise",
-        "Hbf.": "Hauptbahnhof",
-        "Dr.": "Doktor",
-        "Dipl.": "Diplom",
-        "Univ.": "Universität",
-        "km/h": "Kilometer pro Stunde",
-        "ms/s": "Meter pro Sekunde",
-        "Gebr.": "Gebrüder",
-        "äSEND$": " ",
-        "Mio.": "Millionen",
-        "Mia.": "Milliarden",
-        "ähm": "",
-        "äh": "",
-        "hm": "",
-        "hm...": "",
-        "Öhh...": "",
-        "Öhh": "",
-    }
-    for abbr, full in abbreviation_map.items():
-        pattern = re.compile(rf"(^|\s)({re.escape(abbr)})(?=\s|$)", re.IGNORECASE)
-        text = pattern.sub(lambda m: m.group(1) + full, text)
-    return text
+    return ABBREVIATION_RE.sub(_expand_abbreviation, text)
 
 
 def standardize_text(text: str) -> str:
@@ -78,59 +187,10 @@ def standardize_text(text: str) -> str:
     - Removes specific unwanted symbols and quotation marks.
     - Collapses multiple spaces into a single space.
     """
-    # Define replacements for specific Unicode and typographic characters
-    REPLACEMENTS = {
-        # –––– Invisible / spacing chars ––––––––––––––––––––––––––––––––––––––––
-        "\u00a0": " ",  # NO-BREAK SPACE → plain space
-        "\u202f": " ",  # NARROW NO-BREAK SPACE → space
-        "\u200b": "",  # ZERO-WIDTH SPACE
-        "\u200c": "",  # ZERO-WIDTH NON-JOINER
-        "\u200d": "",  # ZERO-WIDTH JOINER
-        "\u2060": "",  # WORD-JOINER
-        # –––– Quotes & apostrophes –––––––––––––––––––––––––––––––––––––––––––––
-        "‘": "'",
-        "’": "'",
-        "‚": "'",
-        "‛": "'",
-        "“": '"',
-        "”": '"',
-        "«": '"',
-        "»": '"',
-        "„": '"',
-        "‟": '"',
-        # –––– Dashes & hyphens ––––––––––––––––––––––––––––––––––––––––––––––––
-        "-": "-",  # NON-BREAKING HYPHEN
-        "–": "-",  # EN-DASH
-        "—": "-",  # EM-DASH
-        "−": "-",  # MINUS SIGN
-        "--": "-",  # double NB-hyphen → single
-        # –––– Ellipsis ––––––––––––––––––––––––––––––––––––––––––––––––––––––––
-        "…": "...",
-        # –––– Ligatures & spelling variants –––––––––––––––––––––––––––––––––––
-        "ﬁ": "fi",
-        "ﬂ": "fl",
-        "ﬀ": "ff",
-        "ß": "ss",
-        # –––– Bullets & list marks ––––––––––––––––––––––––––––––––––––––––––––
-        "•": "-",
-        "·": "-",
-        # –––– Accidental markup leftovers ––––––––––––––––––––––––––––––––––––
-        "<i>": "",
-        "</i>": "",
-        "<b>": "",
-        "</b>": "",
-        # –––– Catch-alls you already had ––––––––––––––––––––––––––––––––––––––
-        "\u00ad": "",  # SOFT HYPHEN
-        "- -": "-",  # double hyphen → single
-        "/, ": "",  # "Renter/, innen" → "Renterinnen"
-    }
-
-    # Apply replacements
-    for original, replacement in REPLACEMENTS.items():
-        text = text.replace(original, replacement)
+    text = apply_replacements(text, _STANDARDIZE_STEPS)
 
     # Some other wierd spaces
-    text = re.sub(r"[\u00A0\u202F\u200B\u200C\u200D\u2060]+", " ", text)
+    text = _WEIRD_SPACES_RE.sub(" ", text)
     return text
 
 
@@ -150,15 +210,17 @@ def normalize_capitalization(text):
 
 
 ELLIPSIS = r"(?:\.{3}|…)"  # ASCII or Unicode
+_BRACKETED_ELLIPSIS_RE = re.compile(r"\[\s*(?:\.{3,}|…+)\s*\]")
+_ELLIPSIS_RUN_RE = re.compile(r"(?:\.{3,}|…+)")
 
 
 def normalize_triple_dots(text: str) -> str:
     # Normalize bracketed ellipsis first: [...] or […] -> ...
-    text = re.sub(r"\[\s*(?:\.{3,}|…+)\s*\]", "...", text)
+    text = _BRACKETED_ELLIPSIS_RE.sub("...", text)
 
     # Normalize any triple-dot/ellipsis run to ASCII triple dots.
     # Examples: "..." -> "...", "......" -> "...", "……" -> "..."
-    text = re.sub(r"(?:\.{3,}|…+)", "...", text)
+    text = _ELLIPSIS_RUN_RE.sub("...", text)
 
     # ────────────────────────────────────────────────────────────────────────
     # 2️⃣  tidy punctuation spacing (same as before, but ellipses are gone)
@@ -178,58 +240,60 @@ def normalize_triple_dots(text: str) -> str:
     return text.strip()
 
 
+_SQUARE_BRACKETS_RE = re.compile(r"\[.*?\]")
+_PARENTHESES_RE = re.compile(r"\(.*?\)")
+_ASTERISKS_RE = re.compile(r"\*.*?\*")
+_FONT_TAG_RE = re.compile(r"</?font[^>]*>", re.I)
+
+
 def remove_bracketed_text(text):
     # Remove text enclosed in square brackets or parentheses, including the brackets
-    text = re.sub(r"\[.*?\]", "", text)
-    text = re.sub(r"\(.*?\)", "", text)
-    text = re.sub(r"\*.*?\*", "", text)
+    text = _SQUARE_BRACKETS_RE.sub("", text)
+    text = _PARENTHESES_RE.sub("", text)
+    text = _ASTERISKS_RE.sub("", text)
     # Strip <font> tags, preserving inner text
-    text = re.sub(r"</?font[^>]*>", "", text, flags=re.I)
+    text = _FONT_TAG_RE.sub("", text)
     return text.strip()
 
 
+_TOKEN_RE = re.compile(r"\.\.\.|[^\s]+")
+
+
 def tokenize(text):
     # treat "..." as a standalone token
-    return re.findall(r"\.\.\.|[^\s]+", text)
+    return _TOKEN_RE.findall(text)
 
 
 def collapse_ngrams(tokens, max_n=3):
-    out, i = [], 0
-    while i < len(tokens):
-
-        # 1️⃣  Collapse runs of a single repeated token
-        j = i + 1
-        while j < len(tokens) and tokens[j] == tokens[i]:
-            j += 1
-        if j - i > 1:  # found a run ≥ 2
-            out.append(tokens[i])
-            i = j
-            continue  # restart loop
-
-        # 2️⃣  Collapse repeated n-grams of length 2-max_n
-        replaced = False
-        for n in range(max_n, 1, -1):  # skip n=1 (already handled)
-            if (
-                i + 2 * n <= len(tokens)
-                and tokens[i : i + n] == tokens[i + n : i + 2 * n]
-            ):
-                k = i + n
-                while k + n <= len(tokens) and tokens[i : i + n] == tokens[k : k + n]:
-                    k += n
-                out.extend(tokens[i : i + n])  # keep one copy
-                i = k
-                replaced = True
-                break
-        if not replaced:
-            out.append(tokens[i])
-            i += 1
-    return out
+    # Keep one copy of each run of a repeated token or n-gram (longest n first)
+    return collapse_repeats(tokens, max_n)
 
 
 def collapse_text(text, max_n=3):
     return " ".join(collapse_ngrams(tokenize(text), max_n))
 
 
+_NBSP_RE = re.compile(r"[\u00A0\u202F]")
+_DIGIT_GROUP_SEPARATOR_RE = re.compile(r"(?<=\d)[ '\u00A0](?=\d{3}\b)")
+_FRACTION_RE = re.compile(r"(\d+)[⁄/](\d+)")
+_DECIMAL_COMMA_RE = re.compile(r"(?<=\d),(?=\d)")
+_NUMBER_RE = re.compile(r"\b(\d+)(\.\d+)?\b")
+
+
+def _frac(m: re.Match) -> str:
+    # Convert fractions (1⁄2 or 1/2) to decimal
+    num, den = int(m.group(1)), int(m.group(2))
+    return str(num / den)
+
+
+def _group_num(m: re.Match) -> str:
+    # Group integer numbers into thousands using apostrophes and preserve decimals
+    integer = m.group(1)
+    fraction = m.group(2) or ""
+    grouped = f"{int(integer):,}".replace(",", "'")
+    return grouped + fraction
+
+
 class SwissNumberConverter:
     def __init__(self):
         self.currency_map = {
@@ -292,6 +356,7 @@ class SwissNumberConverter:
             "SGD": "Dollar",
             "HKD": "Dollar",
         }
+        self._currency_steps = compile_replacements(self.currency_map)
 
     def combine_numbers(self, text):
         # collapse ISO thin spaces, NBSP, etc. to plain space first
@@ -306,35 +371,19 @@ class SwissNumberConverter:
     def replace_komma_w_dot(self, text):
         # Normalizes a comma to a dot for numbers
         # For example, "1,234" becomes "1.234"
-        return re.sub(r"(?<=\d),(?=\d)", ".", text)
+        return _DECIMAL_COMMA_RE.sub(".", text)
 
     def replace_currencies(self, text):
-        for symbol, word in self.currency_map.items():
-            text = text.replace(symbol, word)
-        return text
+        return apply_replacements(text, self._currency_steps)
 
     def convert_numbers(self, text):
         # Unify number separators: thin/non-breaking spaces and apostrophes
-        text = re.sub(r"[\u00A0\u202F]", " ", text)
-        text = re.sub(r"(?<=\d)[ '\u00A0](?=\d{3}\b)", "", text)
-
-        # Convert fractions (1⁄2 or 1/2) to decimal
-        def _frac(m):
-            num, den = int(m.group(1)), int(m.group(2))
-            return str(num / den)
-
-        text = re.sub(r"(\d+)[⁄/](\d+)", _frac, text)
+        text = _NBSP_RE.sub(" ", text)
+        text = _DIGIT_GROUP_SEPARATOR_RE.sub("", text)
+        text = _FRACTION_RE.sub(_frac, text)
         text = self.replace_currencies(text)
         text = self.replace_komma_w_dot(text)
-
-        # Group integer numbers into thousands using apostrophes and preserve decimals
-        def _group_num(m: re.Match) -> str:
-            integer = m.group(1)
-            fraction = m.group(2) or ""
-            grouped = f"{int(integer):,}".replace(",", "'")
-            return grouped + fraction
-
-        text = re.sub(r"\b(\d+)(\.\d+)?\b", _group_num, text)
+        text = _NUMBER_RE.sub(_group_num, text)
         return text
 
     def convert(self, text):
@@ -342,17 +391,63 @@ class SwissNumberConverter:
         return self.convert_numbers(text)
 
 
+_MULTIPLE_SPACES_RE = re.compile(r"\s{2,}")
+
+
+class TextNormalizer:
+    """
+    The `normalize_text` pipeline. All patterns and tables are compiled once, so build one
+    normalizer and call it per sentence.
+    """
+
+    def __init__(self):
+        self.number_converter = SwissNumberConverter()
+
+    def __call__(self, text: str) -> str:
+        text = unicodedata.normalize("NFKC", text)
+        text = text.translate(APOS_TABLE)
+        # Remove HTML font markup including content wrapped in <font>…</font>
+        text = remove_bracketed_text(text)
+        text = normalize_triple_dots(text)
+        text = normalize_abbrv(text)
+        text = normalize_capitalization(text)
+        text = standardize_text(text)
+        text = self.number_converter.convert_numbers(text)
+        text = text.replace("\n", " ")  # replace newlines with space
+        text = _MULTIPLE_SPACES_RE.sub(" ", text).strip()
+        return text
+
+
+_NORMALIZER = TextNormalizer()
+
+
 def normalize_text(text):
-    text = unicodedata.normalize("NFKC", text)
-    text = text.translate(APOS_TABLE)
-    # Remove HTML font markup including content wrapped in <font>…</font>
-    text = remove_bracketed_text(text)
-    text = normalize_triple_dots(text)
-    text = normalize_abbrv(text)
-    text = normalize_capitalization(text)
-    text = standardize_text(text)
-    converter = SwissNumberConverter()
-    text = converter.convert_numbers(text)
-    text = text.replace("\n", " ")  # replace newlines with space
-    text = re.sub(r"\s{2,}", " ", text).strip()
-    return text
+    return _NORMALIZER(text)
+
+
+def _normalize_chunk(texts: List[str]) -> List[str]:
+    return [_NORMALIZER(text) for text in texts]
+
+
+def normalize_many(
+    texts: Iterable[str], n_jobs: int = 1, chunksize: int = 1000
+) -> List[str]:
+    """
+    `normalize_text` for every text in *texts*, in order. Every distinct text is normalized
+    once (Common Voice repeats sentences across speakers), in chunks of *chunksize* texts
+    on a pool of *n_jobs* processes.
+    """
+    texts = list(texts)
+    unique = list(dict.fromkeys(texts))
+    if n_jobs <= 1 or len(unique) <= chunksize:
+        normalized = _normalize_chunk(unique)
+    else:
+        chunks = [unique[i : i + chunksize] for i in range(0, len(unique), chunksize)]
+        with Executor(n_jobs) as executor:
+            normalized = [
+                text
+                for chunk in executor.imap(_normalize_chunk, chunks)
+                for text in chunk
+            ]
+    lookup = dict(zip(unique, normalized))
+    return [lookup[text] for text in texts]
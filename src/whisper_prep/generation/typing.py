@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from pathlib import Path
 from typing import Optional
 
 
@@ -31,3 +32,16 @@ class Record:
 class PromptNode:
     text: str  # text including timestamps
     num_tokens: int
+
+
+@dataclass
+class Source:
+    """
+    One long-form input of the DataProcessor: an audio file and its .srt (or .vtt)
+    transcript. `language` overrides the processor's default language.
+    """
+
+    audio_path: Path
+    transcript_path: Path
+    speech_id: str
+    language: Optional[str] = None
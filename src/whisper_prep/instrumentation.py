@@ -0,0 +1,187 @@
+"""
+Lightweight per-stage instrumentation.
+
+`span(name)` times a block (or decorates a function) and aggregates, per stage name, the
+call count, wall time, CPU time of the calling thread, bytes read/written by the process
+(`rchar`/`wchar` of `/proc/self/io`, 0 elsewhere) and the peak RSS of the process. Spans
+nest; the times of a span include the spans inside it.
+
+Pool workers inherit the spans folder set by `configure` and flush their totals to
+`<folder>/<pid>.json` whenever none of their spans is open, so totals survive workers
+that are terminated with their pool. `write_run_report` merges every process of the run into
+one JSON report.
+"""
+import json
+import os
+import resource
+import shutil
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple, Union
+
+SPANS_DIR_ENV = "WHISPER_PREP_SPANS_DIR"
+SPANS_DIR = ".spans"
+
+_FIELDS = ["calls", "wall_seconds", "cpu_seconds", "bytes_read", "bytes_written"]
+
+_lock = threading.Lock()
+_depth = 0  # open spans of this process, over all threads
+_stats: Dict[str, dict] = {}
+_pid = os.getpid()
+_io_fd = None
+
+
+def _io_counters() -> Tuple[int, int]:
+    """`(rchar, wchar)` of this process: bytes passed through read/write calls."""
+    global _io_fd
+    try:
+        if _io_fd is None:
+            _io_fd = os.open("/proc/self/io", os.O_RDONLY)
+        # Starts with "rchar: <n>" and "wchar: <n>".
+        rchar, wchar, _ = os.pread(_io_fd, 4096, 0).split(b"\n", 2)
+        return int(rchar[7:]), int(wchar[7:])
+    except (OSError, ValueError):
+        return 0, 0
+
+
+def _peak_rss_mb() -> float:
+    # KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _check_pid() -> None:
+    """Forked children start with the totals and `/proc/self/io` of the parent."""
+    global _pid, _io_fd, _depth
+    if os.getpid() != _pid:
+        _pid = os.getpid()
+        _stats.clear()
+        if _io_fd is not None:
+            os.close(_io_fd)  # still the parent's counters
+            _io_fd = None
+        _depth = 0
+
+
+def _empty_stage() -> dict:
+    return {**{field: 0 for field in _FIELDS}, "peak_rss_mb": 0.0}
+
+
+def _add(name: str, values: dict) -> None:
+    stage = _stats.setdefault(name, _empty_stage())
+    for field in _FIELDS:
+        stage[field] += values[field]
+    stage["peak_rss_mb"] = max(stage["peak_rss_mb"], values["peak_rss_mb"])
+
+
+def _flush() -> None:
+    spans_dir = os.environ.get(SPANS_DIR_ENV)
+    if not spans_dir or not os.path.isdir(spans_dir):
+        return
+    path = Path(spans_dir, f"{os.getpid()}.json")
+    tmp_path = Path(spans_dir, f"{os.getpid()}.json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(_stats, f)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Account the enclosed block (or decorated function) to stage *name*."""
+    global _depth
+    with _lock:
+        _check_pid()
+        _depth += 1
+        read, written = _io_counters()
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - wall
+        cpu = time.thread_time() - cpu
+        with _lock:
+            _depth -= 1
+            end_read, end_written = _io_counters()
+            _add(
+                name,
+                {
+                    "calls": 1,
+                    "wall_seconds": wall,
+                    "cpu_seconds": cpu,
+                    "bytes_read": max(end_read - read, 0),
+                    "bytes_written": max(end_written - written, 0),
+                    "peak_rss_mb": _peak_rss_mb(),
+                },
+            )
+            if _depth == 0:
+                _flush()
+
+
+def configure(out_folder: Union[str, Path]) -> Path:
+    """
+    Collect the spans of this process and the processes it starts below *out_folder*.
+    Each run gets its own folder (several work-queue workers may share *out_folder*).
+    """
+    spans_dir = Path(
+        out_folder, SPANS_DIR, f"{socket.gethostname()}-{os.getpid()}"
+    )
+    shutil.rmtree(spans_dir, ignore_errors=True)
+    spans_dir.mkdir(parents=True)
+    os.environ[SPANS_DIR_ENV] = str(spans_dir)
+    with _lock:
+        _check_pid()
+        _stats.clear()
+    return spans_dir
+
+
+def collect() -> Dict[str, dict]:
+    """Totals per stage over this process and every process that flushed to the spans
+    folder. Counters are summed, the peak RSS is the largest of any process."""
+    with _lock:
+        _check_pid()
+        _flush()
+        own = {name: dict(stage) for name, stage in _stats.items()}
+
+    per_process = [own]
+    spans_dir = os.environ.get(SPANS_DIR_ENV)
+    if spans_dir and os.path.isdir(spans_dir):
+        per_process = []
+        for path in sorted(Path(spans_dir).glob("*.json")):
+            with open(path, encoding="utf-8") as f:
+                per_process.append(json.load(f))
+
+    stages: Dict[str, dict] = {}
+    for process_stats in per_process:
+        for name, values in process_stats.items():
+            stage = stages.setdefault(name, {**_empty_stage(), "processes": 0})
+            for field in _FIELDS:
+                stage[field] += values[field]
+            stage["peak_rss_mb"] = max(stage["peak_rss_mb"], values["peak_rss_mb"])
+            stage["processes"] += 1
+    return dict(sorted(stages.items()))
+
+
+def write_run_report(path: Union[str, Path], extra: Optional[dict] = None) -> dict:
+    """
+    Write the per-stage totals of the run (see `collect`) to *path* as JSON and remove the
+    spans folder. *extra* entries are added to the top level of the report.
+    """
+    report = {
+        "host": socket.gethostname(),
+        "pid": os.getpid(),
+        "finished": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        **(extra or {}),
+        "stages": collect(),
+    }
+    tmp_path = Path(f"{path}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+    spans_dir = os.environ.pop(SPANS_DIR_ENV, None)
+    if spans_dir:
+        shutil.rmtree(spans_dir, ignore_errors=True)
+    return report
@@ -0,0 +1,293 @@
+"""
+Live progress metrics for long-running jobs.
+
+Counters (`inc`) and gauges (`set_gauge`) can be updated in any process. `start_metrics`
+starts a background thread in the main process that, every *interval* seconds, sums them
+over the main process and its pool workers and writes:
+
+- a Prometheus textfile (for node_exporter's textfile collector), replaced atomically;
+- a JSONL stream with one snapshot per line.
+
+Workers write their values to `<folder>/<pid>.json` at most once per interval and when
+a unit of work ends (`flush_metrics`). Counters of finished workers are kept, gauges
+only count while their process is alive. Every process also reports its RSS.
+"""
+import json
+import os
+import shutil
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+PREFIX = "whisper_prep_"
+METRICS_DIR = ".metrics"
+_DIR_ENV = "WHISPER_PREP_METRICS_DIR"
+_INTERVAL_ENV = "WHISPER_PREP_METRICS_INTERVAL"
+
+HELP = {
+    "sources_done_total": "Source files cut into segments",
+    "sources_failed_total": "Source files skipped because of an error",
+    "segments_written_total": "30-second segments written as records",
+    "audio_seconds_processed_total": "Seconds of source audio cut into segments",
+    "sequences_generated_total": "Long-form audio + SRT files generated from sentences",
+    "sequences_failed_total": "Sequences that could not be generated",
+    "hf_examples_exported_total": "HF dataset examples exported as audio files",
+    "records_accepted_total": "Records that passed the quality filters",
+    "records_rejected_total": "Records removed by a quality filter",
+    "encode_queue_depth": "Segments queued on the encoder threads",
+    "rss_bytes": "Resident memory of the main process and its workers",
+    "last_progress_timestamp_seconds": "Last time a counter increased",
+    "start_timestamp_seconds": "Start of the run",
+}
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+_lock = threading.Lock()
+_counters: Dict[Key, float] = {}
+_gauges: Dict[Key, float] = {}
+_pid = os.getpid()
+_last_flush = 0.0
+_writer: Optional["MetricsWriter"] = None
+
+
+def _key(name: str, labels: dict) -> Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _check_pid() -> None:
+    """Forked workers start with the parent's values, which the parent reports."""
+    global _pid, _last_flush
+    if os.getpid() != _pid:
+        _pid = os.getpid()
+        _counters.clear()
+        _gauges.clear()
+        _last_flush = 0.0
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    """Add *value* to counter *name* (by convention ending in `_total`)."""
+    with _lock:
+        _check_pid()
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + value
+    _maybe_flush()
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    with _lock:
+        _check_pid()
+        _gauges[_key(name, labels)] = value
+    _maybe_flush()
+
+
+def _is_worker() -> bool:
+    return os.environ.get(_DIR_ENV) is not None and (
+        _writer is None or _writer.pid != os.getpid()
+    )
+
+
+def _maybe_flush() -> None:
+    if _is_worker() and time.monotonic() - _last_flush >= float(
+        os.environ.get(_INTERVAL_ENV, 0)
+    ):
+        flush_metrics()
+
+
+def _entries(values: Dict[Key, float]) -> list:
+    return [[name, dict(labels), value] for (name, labels), value in values.items()]
+
+
+def _snapshot() -> dict:
+    with _lock:
+        _check_pid()
+        gauges = {**_gauges, _key("rss_bytes", {}): _rss_bytes()}
+        return {"counters": _entries(_counters), "gauges": _entries(gauges)}
+
+
+def flush_metrics() -> None:
+    """Hand this worker's values to the main process (no-op in the main process)."""
+    global _last_flush
+    if not _is_worker():
+        return
+    metrics_dir = os.environ[_DIR_ENV]
+    if not os.path.isdir(metrics_dir):
+        return
+    snapshot = _snapshot()
+    path = Path(metrics_dir, f"{os.getpid()}.json")
+    tmp_path = Path(metrics_dir, f"{os.getpid()}.json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+    _last_flush = time.monotonic()
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = {
+        k: v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for k, v in labels.items()
+    }
+    return "{" + ",".join(f'{k}="{v}"' for k, v in sorted(escaped.items())) + "}"
+
+
+class MetricsWriter(threading.Thread):
+    """Writes the summed metrics of this process and its workers every *interval* s."""
+
+    def __init__(
+        self,
+        metrics_dir: Path,
+        interval: float,
+        prometheus_path: Optional[Path],
+        jsonl_path: Optional[Path],
+    ) -> None:
+        super().__init__(name="whisper-prep-metrics", daemon=True)
+        self.metrics_dir = metrics_dir
+        self.interval = interval
+        self.prometheus_path = prometheus_path
+        self.jsonl_path = jsonl_path
+        self.pid = os.getpid()
+        self.started = time.time()
+        self.last_progress = self.started
+        self._previous_counters: Dict[Key, float] = {}
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.write()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+        self.write()
+
+    def collect(self) -> Tuple[Dict[Key, float], Dict[Key, float]]:
+        """Counters and gauges summed over this process and the workers' files."""
+        snapshots = [_snapshot()]
+        for path in sorted(self.metrics_dir.glob("*.json")):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if not _alive(int(path.stem)):
+                snapshot["gauges"] = []
+            snapshots.append(snapshot)
+
+        counters: Dict[Key, float] = {}
+        gauges: Dict[Key, float] = {}
+        for snapshot in snapshots:
+            for values, kind in [(counters, "counters"), (gauges, "gauges")]:
+                for name, labels, value in snapshot[kind]:
+                    key = _key(name, labels)
+                    values[key] = values.get(key, 0) + value
+        return counters, gauges
+
+    def write(self) -> None:
+        counters, gauges = self.collect()
+        now = time.time()
+        if any(v > self._previous_counters.get(k, 0) for k, v in counters.items()):
+            self.last_progress = now
+        self._previous_counters = counters
+        gauges[_key("last_progress_timestamp_seconds", {})] = self.last_progress
+        gauges[_key("start_timestamp_seconds", {})] = self.started
+
+        if self.prometheus_path is not None:
+            self._write_prometheus(counters, gauges)
+        if self.jsonl_path is not None:
+            line = {
+                "time": now,
+                "host": socket.gethostname(),
+                "pid": self.pid,
+                "counters": _entries(counters),
+                "gauges": _entries(gauges),
+            }
+            with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(line) + "\n")
+
+    def _write_prometheus(
+        self, counters: Dict[Key, float], gauges: Dict[Key, float]
+    ) -> None:
+        lines = []
+        for kind, values in [("counter", counters), ("gauge", gauges)]:
+            names = sorted({name for name, _ in values})
+            for name in names:
+                if name in HELP:
+                    lines.append(f"# HELP {PREFIX}{name} {HELP[name]}")
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+                for (key_name, labels), value in sorted(values.items()):
+                    if key_name == name:
+                        labels = _format_labels(dict(labels))
+                        lines.append(f"{PREFIX}{name}{labels} {value}")
+        # node_exporter must never read a partial file.
+        tmp_path = Path(f"{self.prometheus_path}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.prometheus_path)
+
+
+def start_metrics(
+    out_folder: Union[str, Path],
+    interval: float = 30.0,
+    prometheus_path: Optional[Union[str, Path]] = None,
+    jsonl_path: Optional[Union[str, Path]] = None,
+) -> MetricsWriter:
+    """
+    Start writing the metrics of this process and the processes it starts. Paths
+    default to `metrics.prom` and `metrics.jsonl` in *out_folder*; workers hand over
+    their values through `<out_folder>/.metrics/<host>-<pid>/`.
+    """
+    global _writer
+    if interval <= 0:
+        raise ValueError(f"metrics_interval must be positive, got {interval}")
+    metrics_dir = Path(
+        out_folder, METRICS_DIR, f"{socket.gethostname()}-{os.getpid()}"
+    )
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    metrics_dir.mkdir(parents=True)
+    os.environ[_DIR_ENV] = str(metrics_dir)
+    os.environ[_INTERVAL_ENV] = str(interval)
+    with _lock:
+        _check_pid()
+        _counters.clear()
+        _gauges.clear()
+    _writer = MetricsWriter(
+        metrics_dir,
+        interval,
+        Path(prometheus_path or Path(out_folder, "metrics.prom")),
+        Path(jsonl_path or Path(out_folder, "metrics.jsonl")),
+    )
+    _writer.start()
+    return _writer
+
+
+def stop_metrics() -> None:
+    """Write the final values and stop the writer started by `start_metrics`."""
+    global _writer
+    if _writer is None or _writer.pid != os.getpid():
+        return
+    _writer.stop()
+    shutil.rmtree(_writer.metrics_dir, ignore_errors=True)
+    os.environ.pop(_DIR_ENV, None)
+    os.environ.pop(_INTERVAL_ENV, None)
+    _writer = None
@@ -0,0 +1,753 @@
+"""
+The steps of a run as a DAG of cached stages:
+
+    download -> generate -> normalize -> segment -> filter -> export, webdataset
+
+Every stage declares the config values it depends on (`params`), the external files it
+reads (`inputs`, hashed by content) and the files it owns (`outputs`). After a stage
+finished, `<out_folder>/.stages/<stage>.json` records a key (hash of its params, inputs
+and the digests of the stages it depends on) and a digest of what it produced. A later
+run skips a stage whose key is unchanged and whose outputs still exist, so changing e.g.
+`max_repetition_score` only reruns `filter` and the exports. A stale stage deletes its
+outputs before it runs again. Files that are only referenced (e.g. the audio and SRT
+files of a transcripts TSV) are not hashed; rerun `segment` with `--force` after changing
+them in place.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from whisper_prep.dataset.convert import ljson_to_hf_dataset
+from whisper_prep.dataset.features import add_whisper_features
+from whisper_prep.dataset.filter import COMPRESSION_RATIO_THRESHOLD, filter_records
+from whisper_prep.dataset.manifest import load_transcripts_manifest
+from whisper_prep.dataset.webdataset import SHARD_SIZE_MB, export_webdataset
+from whisper_prep.executor import WORKER_MEMORY_MB, resolve_workers, set_worker_threads
+from whisper_prep.generation.data_processor import DataProcessor
+from whisper_prep.generation.generate import generate_fold_from_yaml
+from whisper_prep.generation.typing import Source
+from whisper_prep.instrumentation import span
+from whisper_prep.utils import (
+    NETFLIX_CHAR,
+    NETFLIX_DUR,
+    netflix_normalize_all_srts_in_folder,
+    netflix_normalize_cached,
+    netflix_normalize_files,
+    save_hu_dataset_locally,
+    stream_hu_dataset_locally,
+    write_hu_sentences_tsv,
+)
+
+STAGES_DIR = ".stages"
+EXPORT_FORMATS = ["hf", "webdataset"]
+
+
+@dataclass
+class PipelineContext:
+    """The run's config and folders, plus the state the stages hand to each other."""
+
+    config: dict
+    out_folder: Path
+    num_shards: int = 1
+    shard_index: int = 0
+    sentence_tsvs: List[str] = field(default_factory=list)
+    generated_files: List[str] = field(default_factory=list)
+    transcript_overrides: Optional[Dict[str, str]] = None
+    filter_reports: List[str] = field(default_factory=list)
+    # Lazily exported sources of a streamed SRT dataset, consumed by `segment`.
+    hu_sources: Optional[object] = None
+    wrote_output: bool = True
+
+    @property
+    def audio_dir(self) -> Path:
+        return Path(self.out_folder, "audios")
+
+    @property
+    def transcript_dir(self) -> Path:
+        return Path(self.out_folder, "transcripts")
+
+    @property
+    def output_dir(self) -> Path:
+        return Path(self.out_folder, "created_dataset")
+
+    @property
+    def output_file(self) -> Path:
+        return Path(self.output_dir, "data.ljson")
+
+    @property
+    def dump_dir(self) -> Path:
+        return Path(self.output_dir, "dump")
+
+    @property
+    def accepted_file(self) -> Path:
+        return Path(self.output_dir, "accepted.ljson")
+
+    @property
+    def hf_folder(self) -> Path:
+        return Path(self.out_folder, "hf")
+
+    @property
+    def webdataset_folder(self) -> Path:
+        return Path(self.out_folder, "webdataset")
+
+    @property
+    def filter_words(self) -> List[str]:
+        return self.config.get("filter_words") or []
+
+    @property
+    def transcripts_tsv(self) -> Optional[str]:
+        return self.config.get("transcripts_tsv")
+
+    def manifest_shard(self) -> dict:
+        """Only the rows of a transcripts TSV are partitioned by the stages, generated and
+        HF-exported folders already belong to the shard."""
+        if self.transcripts_tsv:
+            return {"num_shards": self.num_shards, "shard_index": self.shard_index}
+        return {"num_shards": 1, "shard_index": 0}
+
+
+@dataclass
+class Stage:
+    """
+    A step of the pipeline. `run` returns the state later stages need (JSON-serializable
+    attributes of the context); it is stored with the stamp and restored when the stage
+    is skipped. Outputs of a stage with `clean` are deleted before it runs again.
+    """
+
+    name: str
+    deps: List[str]
+    run: Callable[[PipelineContext], dict]
+    params: Callable[[PipelineContext], dict]
+    enabled: Callable[[PipelineContext], bool] = lambda ctx: True
+    inputs: Callable[[PipelineContext], List[str]] = lambda ctx: []
+    outputs: Callable[[PipelineContext], List[Path]] = lambda ctx: []
+    clean: bool = True
+
+
+def export_formats(config: dict) -> List[str]:
+    """The `export_formats` of *config* (default: the HF dataset only)."""
+    formats = config.get("export_formats", ["hf"])
+    unknown = set(formats) - set(EXPORT_FORMATS)
+    if unknown:
+        raise ValueError(
+            f"Unknown export_formats {sorted(unknown)}, expected {EXPORT_FORMATS}"
+        )
+    return formats
+
+
+def _config_values(ctx: PipelineContext, keys: List[str]) -> dict:
+    return {key: ctx.config.get(key) for key in keys}
+
+
+# Download
+
+
+def _download_params(ctx: PipelineContext) -> dict:
+    return {
+        **_config_values(
+            ctx,
+            [
+                "hu_datasets",
+                "hu_input_split",
+                "split_name",
+                "hu_episode_ids_file",
+                "hu_audio_passthrough",
+                "hu_audio_sampling_rate",
+                "streaming",
+                "transcripts_tsv",
+            ],
+        ),
+        "num_shards": ctx.num_shards,
+        "shard_index": ctx.shard_index,
+    }
+
+
+def _download_inputs(ctx: PipelineContext) -> List[str]:
+    episode_ids = ctx.config.get("hu_episode_ids_file")
+    return [episode_ids] if episode_ids else []
+
+
+def _download_outputs(ctx: PipelineContext) -> List[Path]:
+    return [ctx.audio_dir, ctx.transcript_dir, *map(Path, ctx.sentence_tsvs)]
+
+
+def _download(ctx: PipelineContext) -> dict:
+    """Step 1: download HF dataset assets (audio + real SRT or sentence TSV)."""
+    ctx.audio_dir.mkdir(parents=True, exist_ok=True)
+    ctx.transcript_dir.mkdir(parents=True, exist_ok=True)
+    config = {**ctx.config, "out_folder": ctx.out_folder}
+    if not config.get("streaming", False):
+        return {
+            "sentence_tsvs": save_hu_dataset_locally(
+                config, ctx.audio_dir, ctx.transcript_dir
+            )
+        }
+
+    hu_columns, exported = stream_hu_dataset_locally(
+        config, ctx.audio_dir, ctx.transcript_dir
+    )
+    if "srt" in hu_columns and not ctx.transcripts_tsv:
+        # Lazy: each example is segmented as soon as it has been exported.
+        ctx.hu_sources = (
+            Source(
+                audio_path=audio_path,
+                transcript_path=Path(ctx.transcript_dir, f"{audio_path.stem}.srt"),
+                speech_id=audio_path.stem,
+            )
+            for audio_path, _ in exported
+        )
+        return {"sentence_tsvs": []}
+    return {
+        "sentence_tsvs": write_hu_sentences_tsv(
+            ctx.out_folder, (row for _, row in exported if row is not None)
+        )
+    }
+
+
+# Generate
+
+
+def _generate_config(ctx: PipelineContext) -> dict:
+    config = {**ctx.config, "out_folder": ctx.out_folder}
+    if ctx.sentence_tsvs:
+        # HF sentence-only datasets: the HF export already only contains this shard.
+        config["tsv_paths"] = ctx.sentence_tsvs
+        config["clips_folders"] = [str(ctx.audio_dir)] * len(ctx.sentence_tsvs)
+        config["partials"] = ctx.config.get("partials", [1.0] * len(ctx.sentence_tsvs))
+        config.update(num_shards=1, shard_index=0)
+    else:
+        config.update(num_shards=ctx.num_shards, shard_index=ctx.shard_index)
+    return config
+
+
+def _generate_params(ctx: PipelineContext) -> dict:
+    config = _generate_config(ctx)
+    return {
+        key: config.get(key)
+        for key in [
+            "tsv_paths",
+            "clips_folders",
+            "partials",
+            "maintain_speaker_chance",
+            "n_samples_per_srt",
+            "normalize_text",
+            "overlap_chance",
+            "max_overlap_chance",
+            "max_overlap_duration",
+            "audio_format",
+            "seed",
+            "num_shards",
+            "shard_index",
+        ]
+    }
+
+
+def _generate_enabled(ctx: PipelineContext) -> bool:
+    # SRTs are only synthesized from sentences: local sentence TSVs or an HF
+    # sentence-only dataset.
+    return not ctx.transcripts_tsv and (
+        bool(ctx.sentence_tsvs) or not ctx.config.get("hu_datasets")
+    )
+
+
+def _generate(ctx: PipelineContext) -> dict:
+    """Step 2: synthesize audio + SRT files from sentences."""
+    ctx.audio_dir.mkdir(parents=True, exist_ok=True)
+    ctx.transcript_dir.mkdir(parents=True, exist_ok=True)
+    return {"generated_files": generate_fold_from_yaml(_generate_config(ctx))}
+
+
+# Normalize
+
+
+def _normalize_params(ctx: PipelineContext) -> dict:
+    return {
+        "filter_words": ctx.filter_words,
+        "transcripts_tsv": ctx.transcripts_tsv,
+        "netflix_cache_dir": str(_netflix_cache_dir(ctx)),
+        "max_chars": NETFLIX_CHAR,
+        "max_duration": NETFLIX_DUR,
+        **ctx.manifest_shard(),
+    }
+
+
+def _normalize_outputs(ctx: PipelineContext) -> List[Path]:
+    return [Path(path) for path in (ctx.transcript_overrides or {}).values()]
+
+
+def _netflix_cache_dir(ctx: PipelineContext) -> Path:
+    return Path(
+        ctx.config.get("netflix_cache_dir", Path(ctx.out_folder, "netflix_cache"))
+    )
+
+
+def _normalize(ctx: PipelineContext) -> dict:
+    """Step 3: Netflix-style SRT normalization. Normalized cues are written to a cache
+    keyed by content and limits, the source transcripts stay untouched."""
+    netflix_cache_dir = _netflix_cache_dir(ctx)
+    n_jobs = ctx.config["n_jobs"]
+    if ctx.hu_sources is not None:
+        netflix_cache_dir.mkdir(parents=True, exist_ok=True)
+        ctx.hu_sources = (
+            replace(
+                source,
+                transcript_path=Path(
+                    netflix_normalize_cached(
+                        source.transcript_path,
+                        netflix_cache_dir,
+                        skip_words=ctx.filter_words,
+                    )
+                ),
+            )
+            for source in ctx.hu_sources
+        )
+        return {"transcript_overrides": None}
+    if ctx.transcripts_tsv:
+        srt_paths = load_transcripts_manifest(
+            ctx.transcripts_tsv, **ctx.manifest_shard()
+        )["srt_path"].tolist()
+        overrides = netflix_normalize_files(
+            srt_paths,
+            cache_dir=netflix_cache_dir,
+            skip_words=ctx.filter_words,
+            n_jobs=n_jobs,
+        )
+    else:
+        overrides = netflix_normalize_all_srts_in_folder(
+            ctx.transcript_dir,
+            skip_words=ctx.filter_words,
+            cache_dir=netflix_cache_dir,
+            n_jobs=n_jobs,
+        )
+    return {"transcript_overrides": {str(k): str(v) for k, v in overrides.items()}}
+
+
+# Segment
+
+
+def _segment_params(ctx: PipelineContext) -> dict:
+    return {
+        **_config_values(
+            ctx,
+            [
+                "cut_initial_audio",
+                "transcripts_tsv",
+                "audio_format",
+                "segment_backend",
+                "segment_stream_copy",
+            ],
+        ),
+        "filter_words": ctx.filter_words,
+        **ctx.manifest_shard(),
+    }
+
+
+def _segment_outputs(ctx: PipelineContext) -> List[Path]:
+    return [ctx.output_file, ctx.dump_dir]
+
+
+def _segment(ctx: PipelineContext) -> dict:
+    """Step 4: segment & timestamp via DataProcessor."""
+    config = ctx.config
+    work_queue = config.get("work_queue")
+    ctx.audio_dir.mkdir(parents=True, exist_ok=True)
+    ctx.transcript_dir.mkdir(parents=True, exist_ok=True)
+    ctx.output_dir.mkdir(parents=True, exist_ok=True)
+    dp = DataProcessor(
+        audio_dir=ctx.audio_dir,
+        transcript_dir=ctx.transcript_dir,
+        output=ctx.output_file,
+        dump_dir=ctx.dump_dir,
+        cut_initial_audio=config.get("cut_initial_audio", False),
+        filter_segment_words=ctx.filter_words,
+        transcripts_tsv=ctx.transcripts_tsv,
+        transcript_overrides=ctx.transcript_overrides,
+        sources=ctx.hu_sources,
+        work_queue=Path(work_queue, "segment") if work_queue else None,
+        work_queue_lease_timeout=config.get("work_queue_lease_timeout", 600.0),
+        n_jobs=config["n_jobs"],
+        decode_memory_budget_mb=config.get("decode_memory_budget_mb"),
+        duration_cache=config.get(
+            "duration_cache", Path(ctx.out_folder, "durations.json")
+        ),
+        prefetch=config.get("prefetch", 2),
+        encode_workers=config.get("encode_workers", 0),
+        segment_backend=config.get("segment_backend", "torchaudio"),
+        segment_stream_copy=config.get("segment_stream_copy", False),
+        audio_format=config.get("audio_format", "mp3"),
+        **ctx.manifest_shard(),
+    )
+    dp.run()
+    ctx.hu_sources = None
+    ctx.wrote_output = dp.wrote_output
+    return {}
+
+
+# Filter
+
+
+def _filter_params(ctx: PipelineContext) -> dict:
+    return {
+        **_config_values(
+            ctx,
+            ["filter_french", "filter_english", "max_repetition_score"],
+        ),
+        "filter_words": ctx.filter_words,
+        "repetition_max_n": ctx.config.get("repetition_max_n", 16),
+        "compression_ratio_threshold": ctx.config.get(
+            "compression_ratio_threshold", COMPRESSION_RATIO_THRESHOLD
+        ),
+    }
+
+
+def _filter_outputs(ctx: PipelineContext) -> List[Path]:
+    return [ctx.accepted_file, *map(Path, ctx.filter_reports)]
+
+
+def _filter(ctx: PipelineContext) -> dict:
+    """Step 5: stream the records through the quality filters chunk by chunk."""
+    config = ctx.config
+    counts = filter_records(
+        json_path=ctx.output_file,
+        out_folder=ctx.out_folder,
+        accepted_path=ctx.accepted_file,
+        filter_words=ctx.filter_words,
+        filter_french=config.get("filter_french", False),
+        filter_english=config.get("filter_english", False),
+        chunk_size=config.get("filter_chunk_size", 50_000),
+        max_repetition_score=config.get("max_repetition_score"),
+        repetition_max_n=config.get("repetition_max_n", 16),
+        compression_ratio_threshold=config.get(
+            "compression_ratio_threshold", COMPRESSION_RATIO_THRESHOLD
+        ),
+    )
+    reports = [name for name in counts if name not in ("loaded", "accepted")]
+    return {"filter_reports": [str(Path(ctx.out_folder, name)) for name in reports]}
+
+
+# Export
+
+
+def _export_params(ctx: PipelineContext) -> dict:
+    return {
+        **_config_values(
+            ctx, ["split_name", "export_features", "upload_to_hu", "hu_repo", "hu_private"]
+        ),
+        "n_mels": ctx.config.get("n_mels", 80),
+        "num_shards": ctx.num_shards,
+    }
+
+
+def _export(ctx: PipelineContext) -> dict:
+    """Convert to a HuggingFace dataset, save it and upload it if configured (sharded
+    runs upload after `merge`)."""
+    config = ctx.config
+    with span("export"):
+        hf_dataset = ljson_to_hf_dataset(
+            json_path=ctx.accepted_file, split_name=config["split_name"]
+        )
+        if config.get("export_features", False):
+            n_jobs = config["n_jobs"]
+            hf_dataset = add_whisper_features(
+                hf_dataset,
+                n_mels=config.get("n_mels", 80),
+                num_proc=n_jobs if n_jobs > 1 else None,
+            )
+        ctx.hf_folder.mkdir(parents=True, exist_ok=True)
+        hf_dataset.save_to_disk(str(ctx.hf_folder))
+
+    if config.get("upload_to_hu", False) and ctx.num_shards == 1:
+        hf_dataset.push_to_hub(config["hu_repo"], private=config["hu_private"])
+    return {}
+
+
+# WebDataset
+
+
+def _webdataset_params(ctx: PipelineContext) -> dict:
+    return {
+        "shard_size_mb": ctx.config.get("webdataset_shard_size_mb", SHARD_SIZE_MB),
+        "shard_max_records": ctx.config.get("webdataset_shard_max_records"),
+        "num_shards": ctx.num_shards,
+        "shard_index": ctx.shard_index,
+    }
+
+
+def _webdataset(ctx: PipelineContext) -> dict:
+    """Pack the accepted records into tar shards for streaming training."""
+    params = _webdataset_params(ctx)
+    with span("export.webdataset"):
+        export_webdataset(
+            ctx.accepted_file,
+            ctx.webdataset_folder,
+            shard_size_mb=params["shard_size_mb"],
+            shard_max_records=params["shard_max_records"],
+            # Keys stay unique when `merge` indexes the shards of all nodes.
+            key_prefix=f"{ctx.shard_index:05d}-" if ctx.num_shards > 1 else "",
+        )
+    return {}
+
+
+STAGES = [
+    Stage(
+        "download",
+        [],
+        _download,
+        _download_params,
+        enabled=lambda ctx: bool(ctx.config.get("hu_datasets")),
+        inputs=_download_inputs,
+        outputs=_download_outputs,
+    ),
+    Stage(
+        "generate",
+        ["download"],
+        _generate,
+        _generate_params,
+        enabled=_generate_enabled,
+        inputs=lambda ctx: [str(p) for p in _generate_config(ctx).get("tsv_paths") or []],
+        outputs=lambda ctx: [Path(p) for p in ctx.generated_files],
+    ),
+    Stage(
+        "normalize",
+        ["download", "generate"],
+        _normalize,
+        _normalize_params,
+        enabled=lambda ctx: bool(ctx.config.get("netflix_normalize", False)),
+        inputs=lambda ctx: [ctx.transcripts_tsv] if ctx.transcripts_tsv else [],
+        outputs=_normalize_outputs,
+        # The cache is keyed by content and shared with other runs.
+        clean=False,
+    ),
+    Stage(
+        "segment",
+        ["download", "generate", "normalize"],
+        _segment,
+        _segment_params,
+        inputs=lambda ctx: [ctx.transcripts_tsv] if ctx.transcripts_tsv else [],
+        outputs=_segment_outputs,
+    ),
+    Stage(
+        "filter",
+        ["segment"],
+        _filter,
+        _filter_params,
+        outputs=_filter_outputs,
+    ),
+    Stage(
+        "export",
+        ["filter"],
+        _export,
+        _export_params,
+        enabled=lambda ctx: "hf" in export_formats(ctx.config),
+        outputs=lambda ctx: [ctx.hf_folder],
+    ),
+    Stage(
+        "webdataset",
+        ["filter"],
+        _webdataset,
+        _webdataset_params,
+        enabled=lambda ctx: "webdataset" in export_formats(ctx.config),
+        outputs=lambda ctx: [ctx.webdataset_folder],
+    ),
+]
+
+
+def _sha256_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _hash_json(value) -> str:
+    return hashlib.sha256(
+        json.dumps(value, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def stage_key(stage: Stage, ctx: PipelineContext, upstream: Dict[str, str]) -> str:
+    """Hash of what *stage* depends on: its params, the content of its inputs and the
+    digests of the *upstream* stages."""
+    inputs = {
+        str(path): _sha256_file(Path(path)) if Path(path).is_file() else None
+        for path in stage.inputs(ctx)
+    }
+    return _hash_json(
+        {
+            "stage": stage.name,
+            "params": stage.params(ctx),
+            "inputs": inputs,
+            "upstream": upstream,
+        }
+    )
+
+
+def output_digest(paths: List[Path], state: dict) -> str:
+    """Hash of what a stage produced. Files are hashed by content; directories, which
+    hold many audio files, by the relative path and size of their files."""
+    h = hashlib.sha256()
+    for path in sorted(paths):
+        h.update(str(path).encode("utf-8"))
+        if path.is_dir():
+            for file in sorted(p for p in path.rglob("*") if p.is_file()):
+                h.update(f"{file.relative_to(path)}:{file.stat().st_size}".encode("utf-8"))
+        elif path.is_file():
+            h.update(_sha256_file(path).encode("ascii"))
+    h.update(_hash_json(state).encode("ascii"))
+    return h.hexdigest()
+
+
+def _stamp_path(out_folder: Path, name: str) -> Path:
+    return Path(out_folder, STAGES_DIR, f"{name}.json")
+
+
+def _read_stamp(out_folder: Path, name: str) -> Optional[dict]:
+    try:
+        with open(_stamp_path(out_folder, name), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_stamp(out_folder: Path, name: str, stamp: dict) -> None:
+    path = _stamp_path(out_folder, name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = Path(f"{path}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(stamp, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _remove(paths: List[Path]) -> None:
+    for path in paths:
+        if path.is_dir():
+            shutil.rmtree(path)
+        elif path.exists():
+            path.unlink()
+
+
+def _apply(ctx: PipelineContext, state: dict) -> None:
+    for name, value in state.items():
+        setattr(ctx, name, value)
+
+
+def run_pipeline(
+    config: dict,
+    out_folder: Path,
+    num_shards: int = 1,
+    shard_index: int = 0,
+    target: Optional[str] = None,
+    force: bool = False,
+    stages: Optional[List[Stage]] = None,
+) -> PipelineContext:
+    """
+    Run the stages up to *target* (default: all), skipping those that are up to date.
+    *force* reruns *target* (without one, the last enabled stage) even if it is. With a
+    `work_queue` nothing is cached: the workers share out_folder and every run processes
+    what is left in the queue.
+    """
+    # The pool size (`n_jobs`, a number or `auto`) and threads per worker of every
+    # stage's executors.
+    config = {
+        **config,
+        "n_jobs": resolve_workers(
+            config.get("n_jobs", "auto"),
+            config.get("worker_memory_mb", WORKER_MEMORY_MB),
+        ),
+    }
+    set_worker_threads(config.get("worker_threads", 1))
+    stages = STAGES if stages is None else stages
+    names = [stage.name for stage in stages]
+    requested = target
+    target = names[-1] if target is None else target
+    if target not in names:
+        raise ValueError(f"Unknown stage {target}, expected one of {names}")
+    # Before the long stages, not after them.
+    export_formats(config)
+    use_cache = not config.get("work_queue")
+    ctx = PipelineContext(
+        config=config,
+        out_folder=Path(out_folder),
+        num_shards=num_shards,
+        shard_index=shard_index,
+    )
+    if force and requested is None:
+        enabled = [stage.name for stage in stages if stage.enabled(ctx)]
+        target = enabled[-1] if enabled else target
+    digests: Dict[str, str] = {}
+    # Stages whose outputs are only written while a later stage consumes ctx.hu_sources.
+    pending: Dict[str, tuple] = {}
+
+    def finish(stage: Stage, key: Optional[str], state: dict) -> None:
+        if key is None:
+            key = stage_key(stage, ctx, _upstream(stage))
+        digests[stage.name] = output_digest(stage.outputs(ctx), state)
+        if use_cache:
+            _write_stamp(
+                ctx.out_folder,
+                stage.name,
+                {
+                    "key": key,
+                    "digest": digests[stage.name],
+                    "state": state,
+                    "finished": time.time(),
+                },
+            )
+
+    def _upstream(stage: Stage) -> Dict[str, str]:
+        return {dep: digests[dep] for dep in stage.deps if dep in digests}
+
+    for stage in stages[: names.index(target) + 1]:
+        if not stage.enabled(ctx):
+            if stage.name == requested:
+                print(f"Stage {stage.name} is not enabled by the config, nothing to do.")
+            continue
+
+        stamp = _read_stamp(ctx.out_folder, stage.name) if use_cache else None
+        key = None
+        if not any(dep in pending for dep in stage.deps):
+            key = stage_key(stage, ctx, _upstream(stage))
+        if stamp is not None:
+            # The previous state also tells which outputs to check or remove.
+            _apply(ctx, stamp["state"])
+            if (
+                stamp["key"] == key
+                and not (force and stage.name == target)
+                and all(path.exists() for path in stage.outputs(ctx))
+            ):
+                print(f"Stage {stage.name} is up to date, skipped.")
+                digests[stage.name] = stamp["digest"]
+                continue
+            _stamp_path(ctx.out_folder, stage.name).unlink()
+        if stage.clean and use_cache:
+            _remove(stage.outputs(ctx))
+
+        with span(f"stage.{stage.name}"):
+            state = stage.run(ctx)
+        _apply(ctx, state)
+        if not ctx.wrote_output:
+            print("Work queue drained, the worker that collects the results continues.")
+            return ctx
+
+        if ctx.hu_sources is not None:
+            pending[stage.name] = (stage, key, state)
+            continue
+        for args in pending.values():
+            finish(*args)
+        pending = {}
+        finish(stage, key, state)
+
+    if pending:
+        # The target only exports: consume the sources without segmenting them.
+        for _ in ctx.hu_sources:
+            pass
+        ctx.hu_sources = None
+        for args in pending.values():
+            finish(*args)
+    return ctx
@@ -0,0 +1,239 @@
+"""
+Opt-in profiling of the main process and its pool workers.
+
+`start_profiling` enables profiling for this process and the processes it starts; each run gets
+a folder below `<out_folder>/profiles`. Work wrapped in `profiled(key)` then runs under
+the profiler of its process:
+
+- `cprofile`: deterministic, per-function call counts and times of the profiled thread,
+  written as `<host>-<pid>.pstats` (`python -m pstats`, snakeviz, ...).
+- `sampling`: the stacks of all threads are sampled every `SAMPLE_INTERVAL` seconds and
+  written as `<host>-<pid>.collapsed`, one `frame;frame;... count` line per stack, the
+  input of `flamegraph.pl` and speedscope.
+
+With a *fraction* below 1, only units whose key (e.g. the source path) hashes into that
+fraction are profiled, and the main process as a whole is not, which keeps the overhead
+low enough for production configs. Every process rewrites its profile whenever a profiled
+unit ends, so profiles survive workers that are terminated with their pool.
+`finish_profiling` merges them into `all.pstats` / `all.collapsed`.
+"""
+import cProfile
+import os
+import pstats
+import shutil
+import socket
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+PROFILE_MODES = ["cprofile", "sampling"]
+PROFILES_DIR = "profiles"
+SAMPLE_INTERVAL = 0.005
+
+_DIR_ENV = "WHISPER_PREP_PROFILE_DIR"
+_MODE_ENV = "WHISPER_PREP_PROFILE_MODE"
+_FRACTION_ENV = "WHISPER_PREP_PROFILE_FRACTION"
+
+_lock = threading.Lock()
+_depth = 0
+_profiler: Optional[cProfile.Profile] = None
+_sampler: Optional["_Sampler"] = None
+
+
+class _Sampler(threading.Thread):
+    """Counts the stacks of every other thread while profiled work runs (wall clock, so
+    waiting threads are sampled too)."""
+
+    def __init__(self) -> None:
+        super().__init__(name="whisper-prep-sampler", daemon=True)
+        self.stacks: Counter = Counter()
+        self.lock = threading.Lock()
+        self.active = threading.Event()
+
+    def run(self) -> None:
+        while True:
+            self.active.wait()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            with self.lock:
+                for thread_id, frame in frames.items():
+                    if thread_id != self.ident:
+                        thread_name = names.get(thread_id, str(thread_id))
+                        self.stacks[_collapse(thread_name, frame)] += 1
+            frames = frame = None
+            time.sleep(SAMPLE_INTERVAL)
+
+
+def _collapse(thread_name: str, frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        file_name = os.path.basename(code.co_filename)
+        names.append(f"{code.co_name} ({file_name}:{code.co_firstlineno})")
+        frame = frame.f_back
+    names.append(thread_name)
+    return ";".join(reversed(names))
+
+
+def _reset() -> None:
+    global _lock, _depth, _profiler, _sampler
+    if _profiler is not None:
+        # A worker forked while the parent profiled would keep profiling into the
+        # parent's copy.
+        _profiler.disable()
+    _lock = threading.Lock()
+    _depth = 0
+    _profiler = None
+    _sampler = None
+
+
+os.register_at_fork(after_in_child=_reset)
+
+
+def start_profiling(
+    out_folder: Union[str, Path], mode: str = "cprofile", fraction: float = 1.0
+) -> Path:
+    """
+    Profile this process and the processes it starts into
+    `<out_folder>/profiles/<host>-<pid>/`, a folder per run.
+    """
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode {mode}, expected one of {PROFILE_MODES}")
+    if not 0 < fraction <= 1:
+        raise ValueError(f"profile_fraction must be in (0, 1], got {fraction}")
+    profiles_dir = Path(out_folder, PROFILES_DIR, _process_name())
+    shutil.rmtree(profiles_dir, ignore_errors=True)
+    profiles_dir.mkdir(parents=True)
+    os.environ[_DIR_ENV] = str(profiles_dir)
+    os.environ[_MODE_ENV] = mode
+    os.environ[_FRACTION_ENV] = str(fraction)
+    _reset()
+    return profiles_dir
+
+
+def is_sampled(key: str, fraction: float) -> bool:
+    """Whether *key* falls into the profiled *fraction*; stable across runs and hosts."""
+    return zlib.crc32(key.encode("utf-8")) < fraction * 2**32
+
+
+def _start(mode: str) -> None:
+    global _profiler, _sampler
+    if mode == "cprofile":
+        if _profiler is None:
+            _profiler = cProfile.Profile()
+        _profiler.enable()
+    else:
+        if _sampler is None:
+            _sampler = _Sampler()
+            _sampler.start()
+        _sampler.active.set()
+
+
+def _stop(mode: str) -> None:
+    if mode == "cprofile":
+        _profiler.disable()
+    else:
+        _sampler.active.clear()
+
+
+def _process_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _dump(profiles_dir: str, mode: str) -> None:
+    if mode == "cprofile":
+        path = Path(profiles_dir, f"{_process_name()}.pstats")
+        tmp_path = Path(f"{path}.tmp")
+        _profiler.dump_stats(str(tmp_path))
+    else:
+        path = Path(profiles_dir, f"{_process_name()}.collapsed")
+        tmp_path = Path(f"{path}.tmp")
+        with _sampler.lock:
+            stacks = _sampler.stacks.copy()
+        _write_collapsed(stacks, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _write_collapsed(stacks: Counter, path: Union[str, Path]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in sorted(stacks.items()):
+            f.write(f"{stack} {count}\n")
+
+
+@contextmanager
+def profiled(key: Optional[str] = None) -> Iterator[None]:
+    """
+    Profile the enclosed work if profiling is configured and *key* is sampled. Without a
+    key (the whole main process), the work is only profiled if every unit is. Nested
+    calls are part of the outer profile.
+    """
+    global _depth
+    profiles_dir = os.environ.get(_DIR_ENV)
+    if profiles_dir is None:
+        yield
+        return
+    mode = os.environ[_MODE_ENV]
+    fraction = float(os.environ[_FRACTION_ENV])
+    with _lock:
+        sampled = _depth > 0 or (
+            fraction >= 1 if key is None else is_sampled(key, fraction)
+        )
+        if sampled:
+            _depth += 1
+            if _depth == 1:
+                _start(mode)
+    if not sampled:
+        yield
+        return
+    try:
+        yield
+    finally:
+        with _lock:
+            _depth -= 1
+            if _depth == 0:
+                _stop(mode)
+                _dump(profiles_dir, mode)
+
+
+def finish_profiling() -> Optional[Path]:
+    """
+    Merge the profiles of every process into `all.pstats` / `all.collapsed` next to them
+    and return the merged file (None if nothing was profiled). Processes started later are
+    no longer profiled.
+    """
+    profiles_dir = os.environ.pop(_DIR_ENV, None)
+    mode = os.environ.pop(_MODE_ENV, None)
+    os.environ.pop(_FRACTION_ENV, None)
+    if profiles_dir is None:
+        return None
+
+    if mode == "cprofile":
+        paths = [
+            str(path)
+            for path in sorted(Path(profiles_dir).glob("*.pstats"))
+            if path.name != "all.pstats"
+        ]
+        if not paths:
+            return None
+        merged = Path(profiles_dir, "all.pstats")
+        pstats.Stats(*paths).dump_stats(str(merged))
+        return merged
+
+    stacks: Counter = Counter()
+    for path in sorted(Path(profiles_dir).glob("*.collapsed")):
+        if path.name == "all.collapsed":
+            continue
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                stack, count = line.rstrip("\n").rsplit(" ", 1)
+                stacks[stack] += int(count)
+    if not stacks:
+        return None
+    merged = Path(profiles_dir, "all.collapsed")
+    _write_collapsed(stacks, merged)
+    return merged
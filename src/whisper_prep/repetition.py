@@ -0,0 +1,115 @@
+from typing import Dict, Hashable, List, NamedTuple, Sequence
+
+import numpy as np
+
+# Odd, so powers of the base never vanish modulo 2**64.
+_BASE = np.uint64(0x9E3779B97F4A7C15)
+
+
+class Run(NamedTuple):
+    """`repeats` consecutive copies of the `period` tokens starting at `start`."""
+
+    start: int
+    period: int
+    repeats: int
+
+    @property
+    def end(self) -> int:
+        return self.start + self.period * self.repeats
+
+
+def _token_ids(tokens: Sequence[Hashable]) -> np.ndarray:
+    vocabulary: Dict[Hashable, int] = {}
+    return np.fromiter(
+        (vocabulary.setdefault(token, len(vocabulary) + 1) for token in tokens),
+        dtype=np.uint64,
+        count=len(tokens),
+    )
+
+
+def _equal_adjacent_blocks(ids: np.ndarray, max_n: int) -> Dict[int, np.ndarray]:
+    """
+    For every block length n in 2..max_n, a mask over start positions i telling whether the
+    hashes of `ids[i:i+n]` and `ids[i+n:i+2n]` are equal. The polynomial hash of any block is
+    a difference of two prefix sums (arithmetic wraps modulo 2**64), so each mask costs
+    O(len(ids)). Equal blocks always have equal hashes; callers verify candidates.
+    """
+    powers = np.ones(len(ids) + 1, dtype=np.uint64)
+    powers[1:] = np.cumprod(np.full(len(ids), _BASE, dtype=np.uint64))
+    prefix = np.zeros(len(ids) + 1, dtype=np.uint64)
+    np.cumsum(ids * powers[:-1], out=prefix[1:])
+
+    equal = {}
+    for n in range(2, min(max_n, len(ids) // 2) + 1):
+        first = prefix[n : len(ids) - n + 1] - prefix[: len(ids) - 2 * n + 1]
+        second = prefix[2 * n :] - prefix[n : len(ids) - n + 1]
+        equal[n] = first * powers[n] == second
+    return equal
+
+
+def find_repeats(tokens: Sequence[Hashable], max_n: int = 3) -> List[Run]:
+    """
+    Runs of consecutive repeated n-grams (n <= *max_n*) in *tokens*, scanned left to right.
+    At each position a repeated single token wins, then the longest repeated n-gram; the
+    run extends over every further copy and the scan continues after it. Comparisons use
+    rolling hashes over token ids, so the scan is linear in the number of tokens for a
+    fixed *max_n*; hash matches are verified, the result is exact.
+    """
+    tokens = list(tokens)
+    n_tokens = len(tokens)
+    if n_tokens < 2:
+        return []
+    equal = _equal_adjacent_blocks(_token_ids(tokens), max_n) if max_n > 1 else {}
+    # Longest candidate period per position (0 if none).
+    longest = np.zeros(n_tokens, dtype=np.int64)
+    for n, mask in equal.items():
+        longest[: len(mask)][mask] = n
+    longest = longest.tolist()
+
+    runs = []
+    i = 0
+    while i < n_tokens:
+        j = i + 1
+        while j < n_tokens and tokens[j] == tokens[i]:
+            j += 1
+        if j - i > 1:
+            runs.append(Run(i, 1, j - i))
+            i = j
+            continue
+
+        for n in range(longest[i], 1, -1):
+            if equal[n][i] and tokens[i : i + n] == tokens[i + n : i + 2 * n]:
+                k = i + 2 * n
+                while (
+                    k + n <= n_tokens
+                    and equal[n][k - n]
+                    and tokens[k : k + n] == tokens[i : i + n]
+                ):
+                    k += n
+                runs.append(Run(i, n, (k - i) // n))
+                i = k
+                break
+        else:
+            i += 1
+    return runs
+
+
+def collapse_repeats(tokens: Sequence[Hashable], max_n: int = 3) -> list:
+    """*tokens* with every run of `find_repeats` reduced to a single copy."""
+    tokens = list(tokens)
+    collapsed = []
+    position = 0
+    for run in find_repeats(tokens, max_n):
+        collapsed.extend(tokens[position : run.start + run.period])
+        position = run.end
+    collapsed.extend(tokens[position:])
+    return collapsed
+
+
+def repetition_score(tokens: Sequence[Hashable], max_n: int = 3) -> float:
+    """Share of *tokens* that are repeated copies, i.e. removed by `collapse_repeats`."""
+    tokens = list(tokens)
+    if not tokens:
+        return 0.0
+    repeated = sum(run.period * (run.repeats - 1) for run in find_repeats(tokens, max_n))
+    return repeated / len(tokens)
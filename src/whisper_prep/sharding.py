@@ -0,0 +1,113 @@
+import shutil
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+from datasets import DatasetDict, concatenate_datasets, load_from_disk
+
+from whisper_prep.dataset.webdataset import INDEX_FILE, merge_indexes
+
+SHARDS_DIR = "shards"
+
+
+def shard_spec(config: dict) -> Tuple[int, int]:
+    """Return `(num_shards, shard_index)` from the config, validating the pair."""
+    num_shards = int(config.get("num_shards") or 1)
+    shard_index = int(config.get("shard_index") or 0)
+    if num_shards < 1:
+        raise ValueError(f"num_shards must be >= 1, got {num_shards}")
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(
+            f"shard_index must be in [0, {num_shards}), got {shard_index}"
+        )
+    return num_shards, shard_index
+
+
+def shard_folder(
+    out_folder: Union[str, Path], num_shards: int, shard_index: int
+) -> Path:
+    """Output folder of one shard, e.g. `<out_folder>/shards/00003-of-00008`."""
+    return Path(out_folder, SHARDS_DIR, f"{shard_index:05d}-of-{num_shards:05d}")
+
+
+def in_shard(index: int, num_shards: int, shard_index: int) -> bool:
+    """Round-robin assignment of the *index*-th input unit to a shard."""
+    return index % num_shards == shard_index
+
+
+def _shard_folders(out_folder: Union[str, Path]) -> List[Path]:
+    shard_dirs = sorted(
+        path for path in Path(out_folder, SHARDS_DIR).glob("*-of-*") if path.is_dir()
+    )
+    if not shard_dirs:
+        raise FileNotFoundError(f"No shards found in {Path(out_folder, SHARDS_DIR)}")
+
+    num_shards = int(shard_dirs[0].name.split("-of-")[1])
+    expected = [shard_folder(out_folder, num_shards, i) for i in range(num_shards)]
+    missing = [path.name for path in expected if not _exported(path)]
+    if missing:
+        raise ValueError(
+            f"Shards not finished (no hf/ or webdataset/ export): {', '.join(missing)}"
+        )
+    return expected
+
+
+def _exported(shard_dir: Path) -> bool:
+    return (
+        Path(shard_dir, "hf").exists()
+        or Path(shard_dir, "webdataset", INDEX_FILE).exists()
+    )
+
+
+def _concat_files(parts: List[Path], target: Path, header: bool) -> None:
+    """Concatenate *parts* into *target*. With *header*, only the first part's header
+    line is kept."""
+    with open(target, "wb") as out:
+        first = True
+        for part in parts:
+            with open(part, "rb") as f:
+                if header and not first:
+                    f.readline()
+                shutil.copyfileobj(f, out)
+            first = False
+
+
+def merge_shards(
+    out_folder: Union[str, Path], split_name: str
+) -> Optional[DatasetDict]:
+    """
+    Combine the outputs of all shards below `<out_folder>/shards` into *out_folder*:
+    `created_dataset/data.ljson` and `accepted.ljson`, the rejection reports, the HF
+    dataset in `hf/` and an index over the shards' tar files in `webdataset/`. Every
+    shard must have finished (written its exports). Returns the HF dataset, None if the
+    shards were only exported as tar shards.
+    """
+    out_folder = Path(out_folder)
+    shard_dirs = _shard_folders(out_folder)
+
+    output_dir = Path(out_folder, "created_dataset")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for name in ["data.ljson", "accepted.ljson"]:
+        parts = [Path(d, "created_dataset", name) for d in shard_dirs]
+        _concat_files([p for p in parts if p.exists()], Path(output_dir, name), False)
+
+    report_names = sorted({p.name for d in shard_dirs for p in d.glob("*.csv")})
+    for name in report_names:
+        parts = [Path(d, name) for d in shard_dirs if Path(d, name).exists()]
+        _concat_files(parts, Path(out_folder, name), header=True)
+
+    webdataset_dirs = [Path(d, "webdataset") for d in shard_dirs]
+    if all(Path(d, INDEX_FILE).exists() for d in webdataset_dirs):
+        index = merge_indexes(webdataset_dirs, Path(out_folder, "webdataset"))
+        print(f"Indexed {len(index['shards'])} tar shards, {index['records']} samples")
+    if not all(Path(d, "hf").exists() for d in shard_dirs):
+        return None
+
+    dataset = DatasetDict()
+    dataset[split_name] = concatenate_datasets(
+        [load_from_disk(str(Path(d, "hf")))[split_name] for d in shard_dirs]
+    )
+    hf_folder = Path(out_folder, "hf")
+    hf_folder.mkdir(parents=True, exist_ok=True)
+    dataset.save_to_disk(str(hf_folder))
+    print(f"Merged {len(shard_dirs)} shards, {len(dataset[split_name])} samples")
+    return dataset
@@ -1,22 +1,86 @@
 import argparse
+import csv
+import hashlib
+import io
 import os
 import re
 import zlib
+from functools import partial
 from glob import glob
 from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
 
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
 import pysubs2
-from datasets import concatenate_datasets, load_dataset
+import soundfile as sf
+from datasets import Audio, concatenate_datasets, load_dataset
 from fastlid import fastlid
 from tqdm.auto import tqdm
 
+from whisper_prep.executor import Executor
+from whisper_prep.instrumentation import span
+from whisper_prep.metrics import flush_metrics, inc
+from whisper_prep.profiling import PROFILE_MODES
+from whisper_prep.sharding import in_shard, shard_spec
+
 NETFLIX_CHAR = 42
 NETFLIX_DUR = 7
 
+# Containers written unchanged by `hu_audio_passthrough`; all later stages read them via ffmpeg.
+PASSTHROUGH_FORMATS = ("wav", "mp3", "flac", "ogg")
+
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="run",
+        # `run` and the stages of whisper_prep.pipeline.
+        choices=[
+            "run",
+            "merge",
+            "download",
+            "generate",
+            "normalize",
+            "segment",
+            "filter",
+            "export",
+            "webdataset",
+        ],
+        help="`run` the pipeline (or one shard of it), `merge` finished shards, or run "
+        "one stage and the stages it needs. Up-to-date stages are skipped.",
+    )
     parser.add_argument("-c", "--config", type=config_path)
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rerun the requested stage even if it is up to date.",
+    )
+    parser.add_argument(
+        "--num-shards", type=int, default=None, help="Overrides `num_shards`."
+    )
+    parser.add_argument(
+        "--shard-index", type=int, default=None, help="Overrides `shard_index`."
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="cprofile",
+        default=None,
+        choices=PROFILE_MODES,
+        help="Profile the run into <out_folder>/profiles (default mode: cprofile). "
+        "Overrides `profile`.",
+    )
+    parser.add_argument(
+        "--profile-fraction",
+        type=float,
+        default=None,
+        help="Only profile this fraction of the source files (and generated sequences). "
+        "Overrides `profile_fraction`.",
+    )
     return parser.parse_args()
 
 
@@ -170,6 +234,7 @@ def fuse_until_limits(
     return changed
 
 
+@span("netflix_normalize")
 def netflix_normalize_file(path: str, skip_words: list = None) -> None:
     """Normalize SRT file using Netflix-style limits.
     
@@ -183,26 +248,266 @@ def netflix_normalize_file(path: str, skip_words: list = None) -> None:
         print(f"Updated {(path)}")
 
 
-def netflix_normalize_all_srts_in_folder(folder: str = ".", skip_words: list = None) -> None:
-    """One-liner helper: normalize all .srt files in *folder*."""
-    for file in glob(os.path.join(folder, "*.srt")):
-        netflix_normalize_file(file, skip_words=skip_words)
+def netflix_cache_key(path: str, skip_words: list = None) -> str:
+    """Hash of the transcript content and everything that changes its normalization."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    digest.update(f"|{NETFLIX_CHAR}|{NETFLIX_DUR}|".encode("utf-8"))
+    digest.update("\x1f".join(sorted(skip_words or [])).encode("utf-8"))
+    return digest.hexdigest()
 
 
-def save_hu_dataset_locally(config, audio_dir, transcript_dir):
-    """Save HuggingFace dataset examples locally as audio and SRT or collect sentences.
-    Returns list of TSV paths for sentence-based entries.
+@span("netflix_normalize")
+def netflix_normalize_cached(path: str, cache_dir: str, skip_words: list = None) -> str:
+    """Normalize *path* into *cache_dir* and return the transcript to read instead.
+
+    The source is never modified. Normalized cues are stored as `<key>.srt`, sources that
+    need no change get an empty `<key>.unchanged` marker and are returned as is. Reruns
+    with the same content, limits and skip words only hash the file.
     """
-    split_name = config.get("hu_input_split", config["split_name"])
-    out_folder = config["out_folder"]
+    key = netflix_cache_key(path, skip_words)
+    cached = Path(cache_dir, f"{key}.srt")
+    unchanged = Path(cache_dir, f"{key}.unchanged")
+    if cached.exists():
+        return str(cached)
+    if unchanged.exists():
+        return str(path)
+
+    subs = pysubs2.load(str(path))
+    if fuse_until_limits(
+        subs, max_chars=NETFLIX_CHAR, max_duration=NETFLIX_DUR, skip_words=skip_words
+    ):
+        tmp = Path(cache_dir, f"{key}.{os.getpid()}.tmp")
+        subs.save(str(tmp), format_="srt")
+        os.replace(tmp, cached)  # atomic, concurrent writers produce the same file
+        return str(cached)
+    unchanged.touch()
+    return str(path)
+
+
+def _netflix_normalize_one(path: str, cache_dir: Optional[str], skip_words: list):
+    if cache_dir is None:
+        netflix_normalize_file(path, skip_words=skip_words)
+        return path, path
+    return path, netflix_normalize_cached(path, cache_dir, skip_words=skip_words)
+
+
+def netflix_normalize_files(
+    paths: List[str],
+    cache_dir: Optional[str] = None,
+    skip_words: list = None,
+    n_jobs: int = 1,
+) -> Dict[str, str]:
+    """Netflix-normalize *paths* in a process pool.
+
+    With *cache_dir*, the sources stay untouched and the returned dict maps each source
+    (as `str(Path(source))`) to the transcript holding its normalized cues. Without it,
+    files are rewritten in place like `netflix_normalize_file`.
+    """
+    if cache_dir is not None:
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    paths = [str(p) for p in paths]
+    worker = partial(_netflix_normalize_one, cache_dir=cache_dir, skip_words=skip_words)
+
+    with Executor(n_jobs) as executor:
+        results = executor.map(
+            worker, paths, chunksize=16, desc="Netflix normalization"
+        )
+    return {str(Path(src)): str(Path(dst)) for src, dst in results}
+
+
+def netflix_normalize_all_srts_in_folder(
+    folder: str = ".",
+    skip_words: list = None,
+    cache_dir: Optional[str] = None,
+    n_jobs: int = 1,
+) -> Dict[str, str]:
+    """One-liner helper: normalize all .srt files in *folder*.
+    See `netflix_normalize_files` for *cache_dir* and *n_jobs*."""
+    return netflix_normalize_files(
+        glob(os.path.join(folder, "*.srt")),
+        cache_dir=cache_dir,
+        skip_words=skip_words,
+        n_jobs=n_jobs,
+    )
+
+
+def _decode_audio_field(audio_field) -> tuple:
+    """Return `(array, sampling_rate)` for a decoded HF `audio` value."""
+    if isinstance(audio_field, dict) and "array" in audio_field and "sampling_rate" in audio_field:
+        audio_array = audio_field["array"]
+        sampling_rate = audio_field["sampling_rate"]
+    elif hasattr(audio_field, "get_all_samples"):
+        # datasets>=4 may expose audio as an AudioDecoder object
+        samples = audio_field.get_all_samples()
+        audio_array = samples.data
+        sampling_rate = samples.sample_rate
+        if hasattr(audio_array, "detach"):
+            audio_array = audio_array.detach()
+        if hasattr(audio_array, "cpu"):
+            audio_array = audio_array.cpu()
+        if hasattr(audio_array, "numpy"):
+            audio_array = audio_array.numpy()
+    else:
+        raise ValueError(f"Could not handle audio field {audio_field}")
+    return audio_array, sampling_rate
+
+
+def _encoded_audio_format(audio_field: dict) -> Optional[str]:
+    """Container of an undecoded (`Audio(decode=False)`) value, from its path or magic bytes."""
+    path = audio_field.get("path")
+    if path and Path(path).suffix:
+        return Path(path).suffix[1:].lower()
+    data = audio_field.get("bytes") or b""
+    if data[:4] == b"RIFF":
+        return "wav"
+    if data[:4] == b"fLaC":
+        return "flac"
+    if data[:4] == b"OggS":
+        return "ogg"
+    if data[:3] == b"ID3" or (len(data) > 1 and data[0] == 0xFF and data[1] & 0xE0 == 0xE0):
+        return "mp3"
+    return None
+
+
+def _passthrough_audio(audio_field: dict, sampling_rate: Optional[int]) -> Optional[tuple]:
+    """Return `(bytes, format)` if the encoded audio can be written as is, else None.
+
+    The format must be readable by the later stages (pydub/ffmpeg, silero, whisper) and,
+    when a target *sampling_rate* is requested, the header must already match it and be
+    mono, like the decoded audio.
+    """
+    fmt = _encoded_audio_format(audio_field)
+    if fmt not in PASSTHROUGH_FORMATS:
+        return None
+    data = audio_field.get("bytes")
+    if data is None:
+        path = audio_field.get("path")
+        if not path or not os.path.isfile(path):
+            return None
+        with open(path, "rb") as f:
+            data = f.read()
+    if sampling_rate is not None:
+        try:
+            info = sf.info(io.BytesIO(data))
+        except Exception:  # header not understood by libsndfile, decode to be safe
+            return None
+        if info.samplerate != sampling_rate or info.channels != 1:
+            return None
+    return data, fmt
+
+
+def _export_example(
+    example: dict,
+    idx: int,
+    audio_dir: Path,
+    transcript_dir: Path,
+    passthrough: bool = False,
+    sampling_rate: Optional[int] = None,
+) -> Tuple[Path, Optional[dict]]:
+    """Write one HF example as audio (+ SRT). Returns the audio path and, for
+    sentence-based examples, the row for the sentence TSV.
+
+    With *passthrough*, `audio` holds the undecoded bytes; they are written with their own
+    extension and only decoded (and resampled) when `_passthrough_audio` refuses them.
+    Undecoded values are decoded here, so streamed examples can stay encoded until now.
+    """
+    audio_field = example.get("audio")
+    audio_id = sanitize_example_id(example.get("id", idx))
+
+    encoded = _passthrough_audio(audio_field, sampling_rate) if passthrough else None
+    if encoded is not None:
+        data, fmt = encoded
+        dest = audio_dir / f"{audio_id}.{fmt}"
+        with open(dest, "wb") as f:
+            f.write(data)
+    else:
+        if isinstance(audio_field, dict) and "bytes" in audio_field:
+            audio_field = Audio(sampling_rate=sampling_rate).decode_example(audio_field)
+        audio_array, sampling_rate = _decode_audio_field(audio_field)
+
+        dest = audio_dir / f"{audio_id}.wav"
+        audio_array = np.asarray(audio_array)
+        if audio_array.ndim == 2 and audio_array.shape[0] <= 8 and audio_array.shape[1] > audio_array.shape[0]:
+            # torchcodec may return channel-first tensors
+            audio_array = audio_array.T
+        if audio_array.dtype not in (np.float32, np.float64, np.int16, np.int32):
+            audio_array = audio_array.astype(np.float32)
+        sf.write(str(dest), audio_array, int(sampling_rate), format="WAV")
 
+    srt_text = example.get("srt")
+    if srt_text is not None:
+        srt_file = transcript_dir / f"{dest.stem}.srt"
+        with open(srt_file, "w", encoding="utf-8") as f:
+            f.write(srt_text)
+        return dest, None
+
+    text = example.get("sentence") or example.get("text")
+    if text is None:
+        raise ValueError(
+            "Sentence-based dataset entry missing 'sentence' or 'text' column"
+        )
+    client_id = example.get("client_id", example.get("speaker_id", "")) or ""
+    return dest, {"path": dest.name, "sentence": text, "client_id": str(client_id)}
+
+
+def _export_batch(
+    batch: dict,
+    indices: List[int],
+    audio_dir: str,
+    transcript_dir: str,
+    passthrough: bool = False,
+    sampling_rate: Optional[int] = None,
+) -> dict:
+    """`Dataset.map` worker: exports a batch and returns only the sentence rows."""
+    rows = {"path": [], "sentence": [], "client_id": []}
+    for row_idx, idx in enumerate(indices):
+        example = {key: values[row_idx] for key, values in batch.items()}
+        _, entry = _export_example(
+            example,
+            idx,
+            Path(audio_dir),
+            Path(transcript_dir),
+            passthrough=passthrough,
+            sampling_rate=sampling_rate,
+        )
+        if entry is not None:
+            for key, value in entry.items():
+                rows[key].append(value)
+    inc("hf_examples_exported_total", len(indices))
+    flush_metrics()
+    return rows
+
+
+def _column_names(ds) -> List[str]:
+    if ds.column_names is not None:
+        return ds.column_names
+    # Streamed datasets without declared features: look at the first example.
+    return list(next(iter(ds)).keys())
+
+
+def _load_hu_dataset(config, streaming: bool = False):
+    """Load, align (column intersection) and concatenate `hu_datasets`, then apply the
+    optional episode-ID filter. With *streaming*, nothing is downloaded up front and the
+    audio column stays encoded until an export worker needs it."""
+    split_name = config.get("hu_input_split", config["split_name"])
     hu_names = config["hu_datasets"]
 
-    datasets_list = [load_dataset(name, split=split_name) for name in hu_names]
-    overlapping_cols = set.intersection(*[set(ds.column_names) for ds in datasets_list])
+    datasets_list = [
+        load_dataset(name, split=split_name, streaming=streaming) for name in hu_names
+    ]
+    overlapping_cols = set.intersection(
+        *[set(_column_names(ds)) for ds in datasets_list]
+    )
     datasets_list = [
         ds.select_columns(sorted(overlapping_cols)) for ds in datasets_list
     ]
+    if streaming:
+        datasets_list = [
+            ds.cast_column("audio", Audio(decode=False)) for ds in datasets_list
+        ]
     ds = concatenate_datasets(datasets_list)
 
     # Optional filtering: keep only a predefined list of episode IDs.
@@ -213,75 +518,133 @@ def save_hu_dataset_locally(config, audio_dir, transcript_dir):
             raise FileNotFoundError(f"Episode IDs file not found: {ids_path}")
         with open(ids_path, "r", encoding="utf-8") as f:
             allowed_ids = {line.strip() for line in f if line.strip()}
-        if "id" not in ds.column_names:
+        if "id" not in overlapping_cols:
             raise ValueError(
                 "hu_episode_ids_file was provided, but source dataset has no 'id' column."
             )
-        ds = ds.filter(lambda example: str(example["id"]) in allowed_ids)
-
-    sentence_entries = []
-    for idx, example in tqdm(
-        enumerate(ds), total=len(ds), desc=f"Saving examples to {audio_dir}"
-    ):
-        audio_field = example.get("audio")
-        if isinstance(audio_field, dict) and "array" in audio_field and "sampling_rate" in audio_field:
-            audio_array = audio_field["array"]
-            sampling_rate = audio_field["sampling_rate"]
-        elif hasattr(audio_field, "get_all_samples"):
-            # datasets>=4 may expose audio as an AudioDecoder object
-            samples = audio_field.get_all_samples()
-            audio_array = samples.data
-            sampling_rate = samples.sample_rate
-            if hasattr(audio_array, "detach"):
-                audio_array = audio_array.detach()
-            if hasattr(audio_array, "cpu"):
-                audio_array = audio_array.cpu()
-            if hasattr(audio_array, "numpy"):
-                audio_array = audio_array.numpy()
+        if streaming:
+            ds = ds.filter(lambda id_: str(id_) in allowed_ids, input_columns=["id"])
+        else:
+            ds = ds.select(episode_id_indices(ds, allowed_ids))
+
+    # Static sharding: every node keeps the examples with index % num_shards == shard_index.
+    num_shards, shard_index = shard_spec(config)
+    if num_shards > 1:
+        if streaming:
+            ds = ds.filter(
+                lambda _, idx: in_shard(idx, num_shards, shard_index),
+                with_indices=True,
+            )
         else:
-            raise ValueError(f"Could not handle audio field {audio_field}")
+            ds = ds.shard(num_shards=num_shards, index=shard_index, contiguous=False)
+    return ds
 
-        import numpy as np
-        import soundfile as sf
 
-        audio_id = sanitize_example_id(example.get("id", idx))
-        dest = audio_dir / f"{audio_id}.wav"
-        audio_array = np.asarray(audio_array)
-        if audio_array.ndim == 2 and audio_array.shape[0] <= 8 and audio_array.shape[1] > audio_array.shape[0]:
-            # torchcodec may return channel-first tensors
-            audio_array = audio_array.T
-        if audio_array.dtype not in (np.float32, np.float64, np.int16, np.int32):
-            audio_array = audio_array.astype(np.float32)
-        sf.write(str(dest), audio_array, int(sampling_rate), format="WAV")
+def episode_id_indices(ds, allowed_ids, batch_size: int = 1_000_000) -> np.ndarray:
+    """Row positions of *ds* whose `id` (compared as string) is in *allowed_ids*.
 
-        srt_text = example.get("srt")
-        if srt_text is not None:
-            srt_file = transcript_dir / f"{dest.stem}.srt"
-            with open(srt_file, "w", encoding="utf-8") as f:
-                f.write(srt_text)
-        else:
-            text = example.get("sentence") or example.get("text")
-            if text is None:
-                raise ValueError(
-                    "Sentence-based dataset entry missing 'sentence' or 'text' column"
-                )
-            client_id = example.get("client_id", example.get("speaker_id", "")) or ""
-            sentence_entries.append(
-                {"path": dest.name, "sentence": text, "client_id": client_id}
-            )
-    tsv_paths = []
-    if sentence_entries:
-        import csv
-
-        tsv_file = Path(out_folder, "hf_sentences.tsv")
-        with open(tsv_file, "w", encoding="utf-8", newline="") as f:
-            writer = csv.DictWriter(
-                f, delimiter="\t", fieldnames=["path", "sentence", "client_id"]
-            )
-            writer.writeheader()
-            writer.writerows(sentence_entries)
-        tsv_paths.append(str(tsv_file))
-    return tsv_paths
+    Runs a vectorized Arrow `is_in` over the `id` column only, so no other column
+    (in particular no audio) is read or decoded.
+    """
+    value_set = pa.array(sorted(allowed_ids), type=pa.string())
+    ids_only = ds.select_columns(["id"]).with_format("arrow")
+    keep = []
+    offset = 0
+    for batch in ids_only.iter(batch_size=batch_size):
+        ids = pc.cast(batch.column("id").combine_chunks(), pa.string())
+        mask = pc.is_in(ids, value_set=value_set)
+        keep.append(np.flatnonzero(mask.to_numpy(zero_copy_only=False)) + offset)
+        offset += batch.num_rows
+    if not keep:
+        return np.array([], dtype=np.int64)
+    return np.concatenate(keep)
+
+
+def write_hu_sentences_tsv(out_folder, sentence_entries) -> List[str]:
+    """Write the sentence rows to `hf_sentences.tsv`. Returns `[path]`, or `[]` if empty."""
+    tsv_file = Path(out_folder, "hf_sentences.tsv")
+    n_rows = 0
+    with open(tsv_file, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(
+            f, delimiter="\t", fieldnames=["path", "sentence", "client_id"]
+        )
+        writer.writeheader()
+        for entry in sentence_entries:
+            writer.writerow(entry)
+            n_rows += 1
+    if n_rows == 0:
+        tsv_file.unlink()
+        return []
+    return [str(tsv_file)]
+
+
+def save_hu_dataset_locally(config, audio_dir, transcript_dir):
+    """Save HuggingFace dataset examples locally as audio and SRT or collect sentences.
+    Returns list of TSV paths for sentence-based entries.
+    """
+    ds = _load_hu_dataset(config)
+
+    # Passthrough keeps the encoded bytes (MP3/FLAC/OGG/WAV) instead of decoding to WAV.
+    passthrough = config.get("hu_audio_passthrough", False)
+    sampling_rate = config.get("hu_audio_sampling_rate")
+    if passthrough:
+        ds = ds.cast_column("audio", Audio(decode=False))
+    elif sampling_rate:
+        ds = ds.cast_column("audio", Audio(sampling_rate=sampling_rate))
+
+    # Workers write disjoint files (one per example id) and hand back the sentence rows.
+    n_jobs = config.get("n_jobs", 4)
+    exported = ds.map(
+        _export_batch,
+        batched=True,
+        batch_size=config.get("hu_export_batch_size", 64),
+        with_indices=True,
+        num_proc=n_jobs if n_jobs > 1 and len(ds) >= n_jobs else None,
+        remove_columns=ds.column_names,
+        fn_kwargs={
+            "audio_dir": str(audio_dir),
+            "transcript_dir": str(transcript_dir),
+            "passthrough": passthrough,
+            "sampling_rate": sampling_rate,
+        },
+        load_from_cache_file=False,
+        desc=f"Saving examples to {audio_dir}",
+    )
+    return write_hu_sentences_tsv(config["out_folder"], exported.to_list())
+
+
+def _export_indexed_example(indexed_example: tuple, **kwargs) -> Tuple[Path, Optional[dict]]:
+    idx, example = indexed_example
+    exported = _export_example(example, idx, **kwargs)
+    inc("hf_examples_exported_total")
+    flush_metrics()
+    return exported
+
+
+def _iter_exported(ds, config, audio_dir, transcript_dir) -> Iterator[Tuple[Path, Optional[dict]]]:
+    worker = partial(
+        _export_indexed_example,
+        audio_dir=Path(audio_dir),
+        transcript_dir=Path(transcript_dir),
+        passthrough=config.get("hu_audio_passthrough", False),
+        sampling_rate=config.get("hu_audio_sampling_rate"),
+    )
+    n_jobs = config.get("n_jobs", 4)
+    examples = tqdm(enumerate(ds), desc=f"Streaming examples to {audio_dir}")
+    with Executor(n_jobs) as executor:
+        yield from executor.imap(worker, examples, max_in_flight=4 * n_jobs)
+
+
+def stream_hu_dataset_locally(config, audio_dir, transcript_dir):
+    """Streaming counterpart of `save_hu_dataset_locally` (`streaming: true`).
+
+    Returns the dataset's column names and a lazy iterator of `(audio_path, sentence_row)`
+    for every exported example (`sentence_row` is None for SRT datasets). Examples are
+    exported by `n_jobs` workers while later shards are still being read, so callers can
+    start segmenting the first files right away.
+    """
+    ds = _load_hu_dataset(config, streaming=True)
+    return _column_names(ds), _iter_exported(ds, config, audio_dir, transcript_dir)
 
 
 if __name__ == "__main__":
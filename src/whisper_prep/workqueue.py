@@ -0,0 +1,259 @@
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional, Union
+
+TODO = "todo"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+RESULTS = "results"
+TMP = "tmp"
+READY = "READY"
+
+
+def _write_atomic(path: Path, data: dict, tmp_dir: Path) -> None:
+    """Write *data* as JSON to *path* via a rename, so readers never see partial files."""
+    tmp = Path(tmp_dir, f"{path.name}.{os.getpid()}.{uuid.uuid4().hex}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _touch_until(path: Path, interval: float, stop: threading.Event) -> None:
+    while not stop.wait(interval):
+        os.utime(path)
+
+
+class Lease:
+    """
+    A unit taken from a `WorkQueue`. While the lease is open (`with lease:`) a background
+    thread refreshes its heartbeat. `commit` stores the result and marks the unit done.
+    Leaving the block with an exception gives the unit back to the queue.
+    """
+
+    def __init__(self, queue: "WorkQueue", unit_id: str, payload: dict) -> None:
+        self.queue = queue
+        self.unit_id = unit_id
+        self.unit = payload["unit"]
+        self.attempts = payload.get("attempts", 0)
+        self.lost = False
+        self._stop = threading.Event()
+        self._heartbeat = threading.Thread(target=self._beat, daemon=True)
+
+    @property
+    def path(self) -> Path:
+        return Path(self.queue.queue_dir, LEASED, f"{self.unit_id}.json")
+
+    def _beat(self) -> None:
+        while not self._stop.wait(self.queue.heartbeat_interval):
+            try:
+                os.utime(self.path)
+            except FileNotFoundError:
+                # Reclaimed by another worker after a missed heartbeat. Results are
+                # committed by rename, so finishing the unit anyway is harmless.
+                self.lost = True
+                return
+
+    def __enter__(self) -> "Lease":
+        self._heartbeat.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._stop.set()
+        self._heartbeat.join()
+        if exc_type is not None:
+            self.queue._requeue(self.unit_id, self.path)
+
+    def commit(self, result: dict) -> None:
+        """Atomically store *result* for this unit, then move the unit to `done/`."""
+        _write_atomic(
+            Path(self.queue.queue_dir, RESULTS, f"{self.unit_id}.json"),
+            result,
+            Path(self.queue.queue_dir, TMP),
+        )
+        try:
+            os.replace(self.path, Path(self.queue.queue_dir, DONE, self.path.name))
+        except FileNotFoundError:
+            pass
+
+
+class WorkQueue:
+    """
+    A work queue that only needs a (local or NFS) directory shared by all workers.
+
+    Units are JSON files that move between `todo/`, `leased/`, `done/` and `failed/` by
+    `rename`, which is atomic, so exactly one worker wins each lease. Leased files are
+    touched every *heartbeat_interval* seconds. A lease whose file has not been touched
+    for *lease_timeout* seconds (crashed or stalled worker) is put back into `todo/`. After
+    *max_attempts* leases a unit is moved to `failed/` instead. Results are written to
+    `results/<unit_id>.json` by rename as well.
+    """
+
+    def __init__(
+        self,
+        queue_dir: Union[str, Path],
+        lease_timeout: float = 600.0,
+        heartbeat_interval: Optional[float] = None,
+        poll_interval: float = 5.0,
+        max_attempts: int = 3,
+    ) -> None:
+        self.queue_dir = Path(queue_dir)
+        self.lease_timeout = lease_timeout
+        self.heartbeat_interval = heartbeat_interval or lease_timeout / 10
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        for name in [TODO, LEASED, DONE, FAILED, RESULTS, TMP]:
+            Path(self.queue_dir, name).mkdir(parents=True, exist_ok=True)
+
+    def _dir(self, name: str) -> Path:
+        return Path(self.queue_dir, name)
+
+    def claim(self, name: str) -> bool:
+        """True for exactly one caller per *name* (`mkdir` is atomic)."""
+        try:
+            Path(self.queue_dir, f".{name}").mkdir()
+            return True
+        except FileExistsError:
+            return False
+
+    @property
+    def ready(self) -> bool:
+        return Path(self.queue_dir, READY).exists()
+
+    def populate(self, units: Callable[[], Iterable[dict]]) -> bool:
+        """
+        Fill the queue from *units* (called only by the worker that wins the population
+        claim). The other workers wait until the queue is marked ready. Returns True for
+        the populating worker.
+        """
+        if self.ready:
+            return False
+        claim = Path(self.queue_dir, ".populate")
+        if not self.claim("populate"):
+            while not self.ready:
+                if time.time() - claim.stat().st_mtime > self.lease_timeout:
+                    raise RuntimeError(
+                        f"Populating {self.queue_dir} stalled, remove {claim} to retry"
+                    )
+                time.sleep(self.poll_interval)
+            return False
+
+        # *units* may take long before it yields the first unit (e.g. probing every
+        # source), so the claim is kept fresh by a thread rather than per unit.
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=_touch_until, args=(claim, self.heartbeat_interval, stop), daemon=True
+        )
+        heartbeat.start()
+        n_units = 0
+        try:
+            for index, unit in enumerate(units()):
+                unit_id = f"{index:09d}"
+                _write_atomic(
+                    Path(self._dir(TODO), f"{unit_id}.json"),
+                    {"attempts": 0, "unit": unit},
+                    self._dir(TMP),
+                )
+                n_units += 1
+        finally:
+            stop.set()
+            heartbeat.join()
+        # The number of units tells `leases` when the queue is drained.
+        _write_atomic(Path(self.queue_dir, READY), {"units": n_units}, self._dir(TMP))
+        print(f"Queued {n_units} units in {self.queue_dir}")
+        return True
+
+    def _try_lease(self) -> Optional[Lease]:
+        for name in sorted(os.listdir(self._dir(TODO))):
+            todo_path = Path(self._dir(TODO), name)
+            leased_path = Path(self._dir(LEASED), name)
+            try:
+                # rename keeps the mtime, so refresh it on both sides of the rename
+                # to not look expired to other workers.
+                os.utime(todo_path)
+                os.rename(todo_path, leased_path)
+                os.utime(leased_path)
+                with open(leased_path, encoding="utf-8") as f:
+                    payload = json.load(f)
+            except FileNotFoundError:
+                continue
+            return Lease(self, Path(name).stem, payload)
+        return None
+
+    def _requeue(self, unit_id: str, leased_path: Path) -> None:
+        # Claim the expired lease by a rename within `leased/`, so only one worker
+        # requeues it and the unit never looks finished to `leases()` in between. Touched
+        # first, as the rename keeps the (expired) mtime.
+        claimed = Path(self._dir(LEASED), f"{unit_id}.{os.getpid()}.{uuid.uuid4().hex}")
+        try:
+            os.utime(leased_path)
+            os.rename(leased_path, claimed)
+            with open(claimed, encoding="utf-8") as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return
+        payload["attempts"] = payload.get("attempts", 0) + 1
+        target = TODO if payload["attempts"] < self.max_attempts else FAILED
+        _write_atomic(claimed, payload, self._dir(TMP))
+        os.rename(claimed, Path(self._dir(target), f"{unit_id}.json"))
+        if target == FAILED:
+            print(f"Unit {unit_id} failed {payload['attempts']} times, giving up")
+
+    def reclaim_expired(self) -> int:
+        """Put leases without a heartbeat for `lease_timeout` seconds back into the queue."""
+        now = time.time()
+        n_reclaimed = 0
+        for name in os.listdir(self._dir(LEASED)):
+            leased_path = Path(self._dir(LEASED), name)
+            try:
+                expired = now - leased_path.stat().st_mtime > self.lease_timeout
+            except FileNotFoundError:
+                continue
+            if expired:
+                # Also a claim left behind by a worker that crashed while requeueing.
+                self._requeue(name.split(".")[0], leased_path)
+                n_reclaimed += 1
+        return n_reclaimed
+
+    def _finished(self) -> int:
+        """Units in `done/` or `failed/` (a unit is counted once even if it is in both)."""
+        return len(set(os.listdir(self._dir(DONE))) | set(os.listdir(self._dir(FAILED))))
+
+    def leases(self) -> Iterator[Lease]:
+        """
+        Yield leases until every unit is done or failed. When nothing is left to lease but
+        other workers still hold leases, wait for them (or for their leases to expire).
+        The queue is drained once `done/` and `failed/` hold as many units as were queued;
+        listing `todo/` and `leased/` instead could miss a unit moving between them.
+        """
+        while not self.ready:
+            time.sleep(self.poll_interval)
+        with open(Path(self.queue_dir, READY), encoding="utf-8") as f:
+            n_units = json.load(f)["units"]
+        while True:
+            lease = self._try_lease()
+            if lease is not None:
+                yield lease
+                continue
+            if self.reclaim_expired():
+                continue
+            if self._finished() >= n_units:
+                return
+            time.sleep(self.poll_interval)
+
+    def results(self) -> Iterator[dict]:
+        """Committed results in unit order."""
+        for name in sorted(os.listdir(self._dir(RESULTS))):
+            with open(Path(self._dir(RESULTS), name), encoding="utf-8") as f:
+                yield json.load(f)
+
+    def failed(self) -> List[dict]:
+        units = []
+        for name in sorted(os.listdir(self._dir(FAILED))):
+            with open(Path(self._dir(FAILED), name), encoding="utf-8") as f:
+                units.append(json.load(f)["unit"])
+        return units
@@ -0,0 +1,32 @@
+"""Tests for the configurable segment codecs."""
+
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+from whisper_prep.audio.io import check_audio_format, write_audio
+
+
+class TestWriteAudio(unittest.TestCase):
+    def test_lossless_formats_round_trip_at_16_bit(self):
+        samples = (np.sin(np.arange(16000) / 10) * 0.5).astype(np.float32)
+        with tempfile.TemporaryDirectory() as tmp:
+            for audio_format in ["wav", "flac"]:
+                path = Path(tmp, f"0.{audio_format}")
+                write_audio(path, samples, 16000, audio_format)
+
+                decoded, sample_rate = sf.read(path, dtype="float32")
+
+                self.assertEqual(sample_rate, 16000)
+                np.testing.assert_allclose(decoded, samples, atol=1 / 32768)
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            check_audio_format("pcm")
+
+
+if __name__ == "__main__":
+    unittest.main()
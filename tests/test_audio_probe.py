@@ -0,0 +1,38 @@
+"""Tests for duration probing used to schedule source files."""
+
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+from whisper_prep.audio.io import DurationCache, probe_duration
+
+
+class TestDurationCache(unittest.TestCase):
+    def test_probe_and_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            short = Path(tmp, "short.wav")
+            long = Path(tmp, "long.wav")
+            sf.write(short, np.zeros(16000, dtype=np.float32), 16000)
+            sf.write(long, np.zeros(48000, dtype=np.float32), 16000)
+            cache_path = Path(tmp, "durations.json")
+
+            self.assertAlmostEqual(probe_duration(short), 1.0)
+            cache = DurationCache(cache_path)
+            self.assertEqual(
+                cache.durations([long, short, Path(tmp, "missing.wav")]),
+                [3.0, 1.0, None],
+            )
+
+            # Reloaded from disk; a rewritten file is probed again.
+            sf.write(short, np.zeros(32000, dtype=np.float32), 16000)
+            cache = DurationCache(cache_path)
+            self.assertIn(str(long), json.loads(cache_path.read_text()))
+            self.assertEqual(cache.durations([short, long]), [2.0, 3.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
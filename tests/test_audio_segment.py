@@ -0,0 +1,145 @@
+"""Tests for the single-process ffmpeg segment writer."""
+
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import soundfile as sf
+
+from whisper_prep.audio.segment import (
+    _ffmpeg_copy_command,
+    _ffmpeg_trim_command,
+    write_segments_ffmpeg,
+)
+from whisper_prep.generation.data_processor import DataProcessor
+from whisper_prep.generation.typing import Utterance
+
+
+class TestFfmpegSegmentCommands(unittest.TestCase):
+    def test_trim_graph_uses_sample_boundaries(self):
+        command = _ffmpeg_trim_command(
+            "in.mp3", [(0, 30000, "/d/0.mp3"), (31500, 45000, "/d/31500.mp3")], 16000
+        )
+        graph = command[command.index("-filter_complex") + 1]
+
+        self.assertIn("asplit=2[s0][s1]", graph)
+        self.assertIn("[s0]atrim=start_sample=0:end_sample=480000", graph)
+        self.assertIn("[s1]atrim=start_sample=504000:end_sample=720000", graph)
+        self.assertEqual(command[-3:], ["-map", "[o1]", "/d/31500.mp3"])
+        self.assertEqual(command.count("-map"), 2)
+
+    def test_copy_cuts_each_output(self):
+        command = _ffmpeg_copy_command("in.mp3", [(1500, 31500, "/d/1500.mp3")])
+
+        self.assertEqual(
+            command[-9:],
+            ["-map", "0:a", "-c", "copy", "-ss", "1.500", "-to", "31.500", "/d/1500.mp3"],
+        )
+
+
+class TestWriteSegments(unittest.TestCase):
+    def test_groups_of_outputs_cut_the_same_samples(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            rng = np.random.default_rng(0)
+            audio = rng.uniform(-0.5, 0.5, 16000 * 20).astype(np.float32)
+            sf.write(Path(tmp, "source.wav"), audio, 16000, subtype="PCM_16")
+            source, _ = sf.read(Path(tmp, "source.wav"), dtype="int16")
+            plan = [
+                (start, start + 3000, str(Path(tmp, f"{start}.wav")))
+                for start in [0, 1500, 4001, 7777, 12000, 17500]
+            ]
+            commands = []
+            run = subprocess.run
+
+            def record_command(command, **kwargs):
+                commands.append(command)
+                return run(command, **kwargs)
+
+            with mock.patch(
+                "whisper_prep.audio.segment.subprocess.run", record_command
+            ):
+                write_segments_ffmpeg(Path(tmp, "source.wav"), plan, max_outputs=2)
+
+            # One decode to a temporary WAV, then three groups of two outputs.
+            self.assertEqual(len(commands), 4)
+            self.assertEqual([c.count("-map") for c in commands[1:]], [2, 2, 2])
+            self.assertNotEqual(commands[0][commands[0].index("-threads") + 1], "0")
+            for start, end, path in plan:
+                segment, _ = sf.read(path, dtype="int16")
+                np.testing.assert_array_equal(segment, source[start * 16 : end * 16])
+            self.assertEqual(
+                sorted(p.name for p in Path(tmp).iterdir()),
+                sorted(["source.wav"] + [Path(path).name for _, _, path in plan]),
+            )
+
+
+class TestFfmpegBackendRecords(unittest.TestCase):
+    def test_every_planned_segment_becomes_a_record(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            processor = DataProcessor(
+                audio_dir=tmp,
+                transcript_dir=tmp,
+                output=str(Path(tmp, "data.ljson")),
+                dump_dir=str(Path(tmp, "dump")),
+                segment_backend="ffmpeg",
+            )
+            utterances = [
+                Utterance(f"Satz {i}.", start=i * 4000, end=i * 4000 + 3000)
+                for i in range(20)
+            ]
+            plans = []
+            with mock.patch(
+                "whisper_prep.generation.data_processor.probe_duration", lambda _: 80.0
+            ), mock.patch(
+                "whisper_prep.generation.data_processor.write_segments_ffmpeg",
+                lambda source, plan, stream_copy: plans.append(plan) or [],
+            ):
+                records = processor._create_records_with_timestamps(
+                    utterances, Path(tmp, "source.mp3"), "source"
+                )
+
+            self.assertGreater(len(records), 1)
+            self.assertEqual(
+                [record.audio_path for record in records],
+                [path for _, _, path in plans[0]],
+            )
+
+    def test_segments_past_the_real_end_are_dropped(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = Path(tmp, "source.wav")
+            sf.write(source, np.full(16000 * 40, 0.1, dtype=np.float32), 16000)
+            processor = DataProcessor(
+                audio_dir=tmp,
+                transcript_dir=tmp,
+                output=str(Path(tmp, "data.ljson")),
+                dump_dir=str(Path(tmp, "dump")),
+                segment_backend="ffmpeg",
+            )
+            utterances = [
+                Utterance(f"Satz {i}.", start=i * 4000, end=i * 4000 + 3000)
+                for i in range(30)
+            ]
+            # A header estimate three times the real length (VBR MP3 without Xing header).
+            with mock.patch(
+                "whisper_prep.generation.data_processor.probe_duration", lambda _: 120.0
+            ):
+                records = processor._create_records_with_timestamps(
+                    utterances, source, "source"
+                )
+
+            self.assertGreater(len(records), 0)
+            starts = [int(Path(record.audio_path).stem) for record in records]
+            self.assertLess(max(starts), 40000)
+            for record in records:
+                self.assertGreater(sf.info(record.audio_path).duration, 0)
+            self.assertEqual(
+                sorted(p.name for p in Path(tmp, "dump", "source").iterdir()),
+                sorted(Path(record.audio_path).name for record in records),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
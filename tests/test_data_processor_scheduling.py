@@ -0,0 +1,154 @@
+"""Tests for the order and prefetching of DataProcessor sources and their encodes."""
+
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import soundfile as sf
+
+from whisper_prep.generation.data_processor import DataProcessor
+from whisper_prep.generation.typing import Source, Utterance
+
+
+def _processor(**attrs) -> DataProcessor:
+    # Skips __init__ (tokenizer download, argument checks); only scheduling state is set.
+    processor = DataProcessor.__new__(DataProcessor)
+    defaults = {
+        "sources": None,
+        "transcripts_tsv": None,
+        "num_shards": 1,
+        "shard_index": 0,
+        "duration_cache": None,
+        "decode_memory_budget_mb": None,
+        "prefetch": 0,
+        "segment_backend": "torchaudio",
+    }
+    processor.__dict__.update({**defaults, **attrs})
+    return processor
+
+
+class TestScheduling(unittest.TestCase):
+    def test_folder_sources_are_ordered_longest_first(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            audio_dir, transcript_dir = Path(tmp, "audios"), Path(tmp, "transcripts")
+            audio_dir.mkdir()
+            transcript_dir.mkdir()
+            for name, seconds in [("a", 1), ("b", 3), ("c", 2)]:
+                sf.write(audio_dir / f"{name}.wav", np.zeros(16000 * seconds), 16000)
+                (transcript_dir / f"{name}.srt").touch()
+
+            processor = _processor(
+                audio_dir=audio_dir,
+                transcript_dir=transcript_dir,
+                transcript_formats=["{id}.srt"],
+            )
+            scheduled = [
+                (source.speech_id, duration)
+                for source, duration in processor._scheduled_sources()
+            ]
+
+            self.assertEqual(scheduled, [("b", 3.0), ("c", 2.0), ("a", 1.0)])
+
+    def test_prefetch_decodes_ahead_in_order(self):
+        sources = [Source(Path(f"/x/{i}.mp3"), Path(f"/x/{i}.srt"), str(i)) for i in range(5)]
+        started = []
+        lock = threading.Lock()
+
+        def fake_load_audio(path):
+            with lock:
+                started.append(Path(path).stem)
+            return np.zeros(10, dtype=np.float32)
+
+        processor = _processor(prefetch=2)
+        with mock.patch(
+            "whisper_prep.generation.data_processor.load_audio", fake_load_audio
+        ), mock.patch(
+            "whisper_prep.generation.data_processor.probe_duration", lambda _: 1.0
+        ):
+            prefetched = processor._prefetched(sources)
+            first, audio = next(prefetched)
+            # The first source plus two more have been submitted.
+            self.assertEqual(first.speech_id, "0")
+            self.assertEqual(len(audio.result()), 10)
+            rest = [source.speech_id for source, _ in prefetched]
+
+        self.assertEqual(rest, ["1", "2", "3", "4"])
+        self.assertEqual(sorted(started), ["0", "1", "2", "3", "4"])
+
+
+class TestEncodeWorkers(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.processor = DataProcessor(
+            audio_dir=self.tmp.name,
+            transcript_dir=self.tmp.name,
+            output=str(Path(self.tmp.name, "data.ljson")),
+            dump_dir=str(Path(self.tmp.name, "dump")),
+            encode_workers=2,
+        )
+        self.utterances = [
+            Utterance(f"Satz {i}.", start=i * 4000, end=i * 4000 + 3000)
+            for i in range(30)
+        ]
+        self.audio = np.zeros(16000 * 120, dtype=np.float32)
+        self.lock = threading.Lock()
+        self.encoded = []
+        self.running = 0
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _create_records(self):
+        return self.processor._create_records_with_timestamps(
+            self.utterances,
+            Path(self.tmp.name, "source.mp3"),
+            "source",
+            audio=self.audio,
+        )
+
+    def _fake_encode(self, fail_at=None):
+        def encode(audio, segment_start, segment_end, segment_audio_path):
+            with self.lock:
+                self.running += 1
+            try:
+                time.sleep(0.02)
+                if segment_start == fail_at:
+                    raise RuntimeError("encoder crashed")
+                with self.lock:
+                    self.encoded.append((segment_audio_path, threading.get_ident()))
+            finally:
+                with self.lock:
+                    self.running -= 1
+            return segment_audio_path
+
+        return mock.patch.object(
+            DataProcessor, "_save_segment_audio", staticmethod(encode)
+        )
+
+    def test_records_are_returned_after_every_encode(self):
+        with self._fake_encode():
+            records = self._create_records()
+
+        self.assertGreater(len(records), 2)
+        self.assertEqual(
+            sorted(path for path, _ in self.encoded),
+            sorted(record.audio_path for record in records),
+        )
+        self.assertNotIn(threading.get_ident(), {thread for _, thread in self.encoded})
+
+    def test_failing_encode_fails_the_source(self):
+        with self._fake_encode(fail_at=0), self.assertRaises(RuntimeError):
+            self._create_records()
+        # No encode of the failed source is left running (or starts later).
+        self.assertEqual(self.running, 0)
+        n_encoded = len(self.encoded)
+        time.sleep(0.1)
+        self.assertEqual(len(self.encoded), n_encoded)
+
+
+if __name__ == "__main__":
+    unittest.main()
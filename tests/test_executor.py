@@ -0,0 +1,92 @@
+"""Tests for the shared executor."""
+
+import os
+import unittest
+
+from whisper_prep.executor import (
+    THREAD_ENV_VARS,
+    Executor,
+    pin_threads,
+    resolve_workers,
+)
+
+_LOADED = []
+
+
+def _load_model(name):
+    _LOADED.append(name)
+
+
+def _worker_state(item):
+    return os.getpid(), len(_LOADED), os.environ.get("OMP_NUM_THREADS"), item
+
+
+def _square(item):
+    return item * item
+
+
+class TestExecutor(unittest.TestCase):
+    def test_process_workers_initialize_once(self):
+        _LOADED.clear()
+        with Executor(2, initializer=_load_model, initargs=("vad",)) as executor:
+            results = executor.map(_worker_state, range(20))
+            results += executor.map(_worker_state, range(20))
+        self.assertEqual(
+            sorted(item for *_, item in results), sorted(list(range(20)) * 2)
+        )
+        # One pool for both calls: two workers that loaded the model once each.
+        self.assertLessEqual(len({pid for pid, *_ in results}), 2)
+        self.assertNotIn(os.getpid(), {pid for pid, *_ in results})
+        self.assertEqual({loaded for _, loaded, _, _ in results}, {1})
+        self.assertEqual({threads for _, _, threads, _ in results}, {"1"})
+
+    def test_small_workloads_run_inline(self):
+        _LOADED.clear()
+        with Executor(4, initializer=_load_model, initargs=("vad",)) as executor:
+            results = executor.map(_worker_state, range(3))
+            self.assertIsNone(executor._pool)
+        self.assertEqual({pid for pid, *_ in results}, {os.getpid()})
+        self.assertEqual(_LOADED, ["vad"])
+
+    def test_imap_keeps_order_and_bounds_reads(self):
+        read = []
+
+        def stream():
+            for item in range(50):
+                read.append(item)
+                yield item
+
+        with Executor(2) as executor:
+            results = executor.imap(_square, stream(), max_in_flight=4)
+            self.assertEqual(next(results), 0)
+            self.assertLessEqual(len(read), 4)
+            self.assertEqual(list(results), [i * i for i in range(1, 50)])
+        with Executor(2, kind="thread") as executor:
+            self.assertEqual(list(executor.imap(_square, range(5))), [0, 1, 4, 9, 16])
+
+    def test_resolve_workers(self):
+        self.assertEqual(resolve_workers(3), 3)
+        self.assertGreaterEqual(resolve_workers("auto"), 1)
+        # Memory per worker caps the automatic size.
+        self.assertEqual(resolve_workers("auto", worker_memory_mb=2**40), 1)
+        with self.assertRaises(ValueError):
+            resolve_workers(0)
+        with self.assertRaises(ValueError):
+            Executor(2, kind="gpu")
+
+    def test_pin_threads_sets_library_limits(self):
+        saved = {name: os.environ.get(name) for name in THREAD_ENV_VARS}
+        try:
+            pin_threads(2)
+            self.assertEqual(os.environ["OMP_NUM_THREADS"], "2")
+            self.assertEqual(os.environ["MKL_NUM_THREADS"], "2")
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+
+if __name__ == "__main__":
+    unittest.main()
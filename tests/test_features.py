@@ -0,0 +1,53 @@
+"""Tests for the precomputed Whisper features."""
+
+import unittest
+
+import numpy as np
+from datasets import Audio, Dataset, DatasetDict
+
+from whisper_prep.dataset.features import (
+    _get_tokenizer,
+    add_whisper_features,
+    encode_with_timestamps,
+)
+
+
+class TestWhisperFeatures(unittest.TestCase):
+    def test_timestamp_tags_become_timestamp_tokens(self):
+        tokenizer = _get_tokenizer(True, "de")
+        ids = encode_with_timestamps(tokenizer, "<|0.00|> Hallo Welt<|2.40|>")
+
+        self.assertEqual(ids[0], tokenizer.timestamp_begin)
+        self.assertEqual(ids[-1], tokenizer.timestamp_begin + 120)
+        self.assertEqual(tokenizer.decode(ids[1:-1]), " Hallo Welt")
+
+    def test_features_and_labels(self):
+        dataset = DatasetDict(
+            {
+                "train": Dataset.from_dict(
+                    {
+                        "audio": [{"array": np.zeros(16000), "sampling_rate": 16000}],
+                        "text": ["<|0.00|> Hallo<|1.00|>"],
+                        "language": ["de"],
+                        "prompt": [""],
+                    }
+                ).cast_column("audio", Audio(sampling_rate=16000))
+            }
+        )
+
+        train = add_whisper_features(dataset, n_mels=80)["train"]
+        row = train.with_format("numpy")[0]
+
+        self.assertEqual(row["input_features"].shape, (80, 3000))
+        # Checked on the stored feature: some `datasets` versions format float16 as float32.
+        self.assertEqual(train.features["input_features"].dtype, "float16")
+        tokenizer = _get_tokenizer(True, "de")
+        self.assertEqual(
+            list(row["labels"][:3]), list(tokenizer.sot_sequence)
+        )
+        self.assertEqual(row["labels"][-1], tokenizer.eot)
+        self.assertEqual(len(row["prompt_ids"]), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
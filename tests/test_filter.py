@@ -0,0 +1,65 @@
+"""Tests for the chunked post-DataProcessor filter stage."""
+
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+from whisper_prep.dataset.filter import filter_records
+
+GOOD = "<|0.00|> Heute gehen wir alle zusammen an den schönen See baden.<|3.00|>"
+
+
+class TestFilterRecords(unittest.TestCase):
+    def _write_records(self, path, texts):
+        with open(path, "w", encoding="utf-8") as f:
+            for i, text in enumerate(texts):
+                record = {
+                    "audio_path": f"/dump/{i}.mp3",
+                    "text": text,
+                    "language": "de",
+                    "prompt": "",
+                }
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def test_chunks_split_rows_into_reports_and_output(self):
+        texts = [GOOD, "zu kurz", GOOD + " [MUSIC]", GOOD, "auch kurz", GOOD]
+        with tempfile.TemporaryDirectory() as tmp:
+            data = Path(tmp, "data.ljson")
+            accepted = Path(tmp, "accepted.ljson")
+            self._write_records(data, texts)
+
+            stats = filter_records(
+                data, tmp, accepted, filter_words=["[MUSIC]"], chunk_size=2
+            )
+
+            self.assertEqual(stats["loaded"], 6)
+            self.assertEqual(stats["accepted"], 3)
+            self.assertEqual(stats["bad_examples.csv"], 2)
+            self.assertEqual(stats["filtered_[MUSIC]_examples.csv"], 1)
+
+            bad = pd.read_csv(Path(tmp, "bad_examples.csv"), sep="\t", index_col=0)
+            # The index survives chunking, the header is written only once.
+            self.assertEqual(list(bad.index), [1, 4])
+
+            rows = [json.loads(line) for line in open(accepted, encoding="utf-8")]
+            self.assertEqual(len(rows), 3)
+            self.assertEqual(rows[0]["audio"], {"path": "/dump/0.mp3", "bytes": None})
+
+    def test_repetition_filter(self):
+        repetitive = "<|0.00|> Heute gehen wir an den See, an den See, an den See baden.<|3.00|>"
+        with tempfile.TemporaryDirectory() as tmp:
+            data = Path(tmp, "data.ljson")
+            accepted = Path(tmp, "accepted.ljson")
+            self._write_records(data, [GOOD, repetitive])
+
+            stats = filter_records(data, tmp, accepted, max_repetition_score=0.2)
+
+            self.assertEqual(stats["accepted"], 1)
+            self.assertEqual(stats["repetitive_examples.csv"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+"""Tests for exporting HuggingFace examples to local audio files."""
+
+import csv
+import io
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+from datasets import Audio, Dataset
+
+from whisper_prep.utils import (
+    _export_example,
+    episode_id_indices,
+    save_hu_dataset_locally,
+    stream_hu_dataset_locally,
+)
+
+
+def _wav_bytes(sampling_rate: int) -> bytes:
+    buffer = io.BytesIO()
+    sf.write(buffer, np.zeros(sampling_rate // 10, dtype=np.float32), sampling_rate, format="WAV")
+    return buffer.getvalue()
+
+
+class TestPassthroughExport(unittest.TestCase):
+    def test_encoded_bytes_are_written_unchanged(self):
+        data = _wav_bytes(16000)
+        example = {
+            "id": "ep/1",
+            "audio": {"bytes": data, "path": "clip.wav"},
+            "sentence": "Hallo Welt",
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            dest, row = _export_example(example, 0, Path(tmp), Path(tmp), passthrough=True)
+
+            self.assertEqual(dest, Path(tmp, "ep_1.wav"))
+            self.assertEqual(row, {"path": "ep_1.wav", "sentence": "Hallo Welt", "client_id": ""})
+            self.assertEqual(Path(tmp, "ep_1.wav").read_bytes(), data)
+
+    def test_format_is_sniffed_without_a_path(self):
+        data = b"ID3" + b"\x00" * 64
+        example = {"id": 7, "audio": {"bytes": data, "path": None}, "srt": "1\n"}
+        with tempfile.TemporaryDirectory() as tmp:
+            _, row = _export_example(example, 0, Path(tmp), Path(tmp), passthrough=True)
+
+            self.assertIsNone(row)
+            self.assertEqual(Path(tmp, "7.mp3").read_bytes(), data)
+            self.assertTrue(Path(tmp, "7.srt").exists())
+
+    def test_sampling_rate_mismatch_is_decoded(self):
+        example = {
+            "id": "a",
+            "audio": {"bytes": _wav_bytes(8000), "path": "a.wav"},
+            "sentence": "Hallo",
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            _export_example(
+                example, 0, Path(tmp), Path(tmp), passthrough=True, sampling_rate=16000
+            )
+
+            self.assertEqual(sf.info(str(Path(tmp, "a.wav"))).samplerate, 16000)
+
+    def test_stereo_is_decoded(self):
+        buffer = io.BytesIO()
+        sf.write(buffer, np.zeros((1600, 2), dtype=np.float32), 16000, format="WAV")
+        example = {
+            "id": "a",
+            "audio": {"bytes": buffer.getvalue(), "path": "a.wav"},
+            "sentence": "Hallo",
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            _export_example(
+                example, 0, Path(tmp), Path(tmp), passthrough=True, sampling_rate=16000
+            )
+
+            self.assertEqual(sf.info(str(Path(tmp, "a.wav"))).channels, 1)
+
+
+class TestEpisodeIdIndices(unittest.TestCase):
+    def test_ids_are_compared_as_strings(self):
+        ds = Dataset.from_dict({"id": [3, 1, 4, 1, 5], "audio": [b"x"] * 5})
+
+        indices = episode_id_indices(ds, {"1", "5"}, batch_size=2)
+
+        self.assertEqual(indices.tolist(), [1, 3, 4])
+
+
+class TestStreamingExport(unittest.TestCase):
+    def test_streams_a_local_dataset(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = Path(tmp, "source")
+            source.mkdir()
+            ds = Dataset.from_dict(
+                {
+                    "id": ["a", "b", "c"],
+                    "audio": [{"bytes": _wav_bytes(16000), "path": f"{i}.wav"} for i in "abc"],
+                    "sentence": ["eins", "zwei", "drei"],
+                }
+            ).cast_column("audio", Audio())
+            ds.to_parquet(str(source / "train.parquet"))
+            ids_file = Path(tmp, "ids.txt")
+            ids_file.write_text("a\nc\n", encoding="utf-8")
+            config = {
+                "hu_datasets": [str(source)],
+                "split_name": "train",
+                "hu_episode_ids_file": str(ids_file),
+                "hu_audio_passthrough": True,
+                "n_jobs": 1,
+            }
+
+            columns, exported = stream_hu_dataset_locally(config, Path(tmp), Path(tmp))
+            exported = list(exported)
+
+            self.assertEqual(sorted(columns), ["audio", "id", "sentence"])
+            self.assertEqual([row["sentence"] for _, row in exported], ["eins", "drei"])
+            self.assertTrue(all(path.exists() for path, _ in exported))
+
+
+class TestParallelExport(unittest.TestCase):
+    def _export(self, tmp, columns):
+        source = Path(tmp, "source")
+        source.mkdir()
+        Dataset.from_dict(columns).cast_column("audio", Audio()).to_parquet(
+            str(source / "train.parquet")
+        )
+        audio_dir, transcript_dir = Path(tmp, "audios"), Path(tmp, "transcripts")
+        audio_dir.mkdir()
+        transcript_dir.mkdir()
+        config = {
+            "hu_datasets": [str(source)],
+            "split_name": "train",
+            "out_folder": tmp,
+            "n_jobs": 2,
+            "hu_export_batch_size": 2,
+        }
+        return save_hu_dataset_locally(config, audio_dir, transcript_dir)
+
+    def test_sentence_rows_keep_the_dataset_order(self):
+        ids = [f"ep{i}" for i in range(6)]
+        sentences = [f"Satz {i}" for i in range(6)]
+        with tempfile.TemporaryDirectory() as tmp:
+            tsv_files = self._export(
+                tmp,
+                {
+                    "id": ids,
+                    "audio": [
+                        {"bytes": _wav_bytes(16000), "path": f"{i}.wav"} for i in ids
+                    ],
+                    "sentence": sentences,
+                },
+            )
+
+            self.assertEqual(tsv_files, [str(Path(tmp, "hf_sentences.tsv"))])
+            with open(tsv_files[0], encoding="utf-8") as f:
+                rows = list(csv.DictReader(f, delimiter="\t"))
+            self.assertEqual([row["path"] for row in rows], [f"{i}.wav" for i in ids])
+            self.assertEqual([row["sentence"] for row in rows], sentences)
+            for i in ids:
+                info = sf.info(str(Path(tmp, "audios", f"{i}.wav")))
+                self.assertEqual(info.frames, 1600)
+
+    def test_srt_examples_are_written(self):
+        ids = ["a", "b", "c", "d"]
+        with tempfile.TemporaryDirectory() as tmp:
+            tsv_files = self._export(
+                tmp,
+                {
+                    "id": ids,
+                    "audio": [
+                        {"bytes": _wav_bytes(16000), "path": f"{i}.wav"} for i in ids
+                    ],
+                    "srt": [f"1\n00:00:00,000 --> 00:00:00,100\n{i}\n" for i in ids],
+                },
+            )
+
+            self.assertEqual(tsv_files, [])
+            for i in ids:
+                self.assertTrue(Path(tmp, "audios", f"{i}.wav").exists())
+                srt = Path(tmp, "transcripts", f"{i}.srt").read_text(encoding="utf-8")
+                self.assertIn(f"\n{i}\n", srt)
+
+
+if __name__ == "__main__":
+    unittest.main()
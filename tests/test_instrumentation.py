@@ -0,0 +1,72 @@
+"""Tests for the per-stage instrumentation spans and the run report."""
+
+import json
+import os
+import tempfile
+import unittest
+from multiprocessing import Pool
+from pathlib import Path
+
+from whisper_prep.instrumentation import (
+    SPANS_DIR_ENV,
+    configure,
+    span,
+    write_run_report,
+)
+
+
+@span("test.work")
+def _work(n):
+    with span("test.write"):
+        with tempfile.TemporaryFile() as f:
+            f.write(b"x" * n)
+    return sum(i * i for i in range(n))
+
+
+class TestInstrumentation(unittest.TestCase):
+    def tearDown(self):
+        os.environ.pop(SPANS_DIR_ENV, None)
+
+    def test_aggregates_over_pool_workers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            spans_dir = configure(tmp)
+            with span("test.main"):
+                with Pool(2) as pool:
+                    pool.map(_work, [100_000] * 6)
+                _work(100_000)
+
+            report = write_run_report(Path(tmp, "run_report.json"), {"command": "run"})
+            with open(Path(tmp, "run_report.json"), encoding="utf-8") as f:
+                self.assertEqual(json.load(f), report)
+            self.assertFalse(spans_dir.exists())
+            self.assertEqual(report["command"], "run")
+
+            stages = report["stages"]
+            self.assertEqual(set(stages), {"test.main", "test.work", "test.write"})
+            self.assertEqual(stages["test.main"]["calls"], 1)
+            self.assertEqual(stages["test.work"]["calls"], 7)
+            self.assertEqual(stages["test.write"]["calls"], 7)
+            self.assertGreaterEqual(stages["test.work"]["processes"], 2)
+            work = stages["test.work"]
+            self.assertGreater(work["wall_seconds"], 0)
+            self.assertGreater(work["cpu_seconds"], 0)
+            self.assertGreater(work["peak_rss_mb"], 0)
+            # The outer span includes the inner one.
+            write = stages["test.write"]
+            self.assertGreaterEqual(work["wall_seconds"], write["wall_seconds"])
+            if os.path.exists("/proc/self/io"):
+                self.assertGreaterEqual(write["bytes_written"], 7 * 100_000)
+
+    def test_errors_are_accounted(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            configure(tmp)
+            with self.assertRaises(ValueError):
+                with span("test.failing"):
+                    raise ValueError("boom")
+            report = write_run_report(Path(tmp, "run_report.json"))
+            self.assertEqual(report["stages"]["test.failing"]["calls"], 1)
+            self.assertEqual(report["stages"]["test.failing"]["processes"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+"""Tests for the columnar TSV manifest readers."""
+
+import tempfile
+import unittest
+from pathlib import Path
+
+from whisper_prep.dataset.manifest import (
+    load_sentence_manifest,
+    load_transcripts_manifest,
+)
+
+
+class TestSentenceManifest(unittest.TestCase):
+    def test_clip_path_column_default_client_and_missing_clips(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            clips = Path(tmp, "clips")
+            clips.mkdir()
+            Path(clips, "a.mp3").touch()
+            Path(clips, "b.mp3").touch()
+            tsv = Path(tmp, "train.tsv")
+            tsv.write_text(
+                "clip_path\tsentence\textra\n"
+                "a.mp3\tErster Satz.\tx\n"
+                "missing.mp3\tFehlt.\ty\n"
+                "b.mp3\tZweiter Satz.\tz\n",
+                encoding="utf-8",
+            )
+
+            data = load_sentence_manifest([tsv], [clips], [1.0])
+
+            self.assertEqual(list(data.columns), ["sentence", "audio_file_path", "client_id"])
+            self.assertEqual(list(data["sentence"]), ["Erster Satz.", "Zweiter Satz."])
+            self.assertEqual(
+                list(data["audio_file_path"]),
+                [str(Path(clips, "a.mp3")), str(Path(clips, "b.mp3"))],
+            )
+            self.assertEqual(list(data["client_id"]), ["0", "0"])
+            self.assertEqual(list(data.index), [0, 1])
+
+    def test_rows_shorter_than_the_header(self):
+        # The last row of this export has 13 of the 17 columns.
+        tsv = Path(
+            __file__
+        ).parent / "assets/tsv-data-example/export_20211220_sample_10utterances.tsv"
+
+        data = load_sentence_manifest([tsv], ["/clips"], [1.0], validate=False)
+
+        self.assertEqual(len(data), 10)
+        self.assertTrue(data["sentence"].str.startswith("Davon gehörten").iloc[-1])
+        self.assertEqual(
+            data["client_id"].iloc[-1], "23e3d7c7-7980-4f73-9349-9f24891db4b5"
+        )
+        self.assertTrue(data["audio_file_path"].str.startswith("/clips/").all())
+
+
+class TestTranscriptsManifest(unittest.TestCase):
+    def test_id_and_language_defaults(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tsv = Path(tmp, "transcripts.tsv")
+            tsv.write_text(
+                "srt_path\taudio_path\tid\tlanguage\n"
+                "/x/a.srt\t/x/episode.one.mp3\t\t\n"
+                "/x/b.srt\t/x/b.wav\tcustom\tfr\n",
+                encoding="utf-8",
+            )
+
+            data = load_transcripts_manifest(tsv)
+
+            self.assertEqual(list(data["id"]), ["episode.one", "custom"])
+            self.assertEqual(list(data["language"]), [None, "fr"])
+            self.assertEqual(list(data["srt_path"]), ["/x/a.srt", "/x/b.srt"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""Tests for the live metrics writer."""
+
+import json
+import tempfile
+import unittest
+from multiprocessing import Pool
+from pathlib import Path
+
+from whisper_prep.metrics import (
+    flush_metrics,
+    inc,
+    set_gauge,
+    start_metrics,
+    stop_metrics,
+)
+
+
+def _unit(n):
+    inc("sources_done_total")
+    inc("segments_written_total", n)
+    set_gauge("encode_queue_depth", 2)
+    flush_metrics()
+    return n
+
+
+class TestMetrics(unittest.TestCase):
+    def tearDown(self):
+        stop_metrics()
+
+    def test_sums_workers_into_textfile_and_jsonl(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            start_metrics(tmp, interval=3600)
+            with Pool(2) as pool:
+                pool.map(_unit, range(10))
+            inc("records_rejected_total", 3, reason='bad "examples"')
+            stop_metrics()
+
+            prom = Path(tmp, "metrics.prom").read_text(encoding="utf-8").splitlines()
+            self.assertIn("whisper_prep_sources_done_total 10", prom)
+            self.assertIn("whisper_prep_segments_written_total 45", prom)
+            self.assertIn("# TYPE whisper_prep_sources_done_total counter", prom)
+            self.assertIn(
+                'whisper_prep_records_rejected_total{reason="bad \\"examples\\""} 3', prom
+            )
+            # The workers have exited with the pool, their gauges no longer count.
+            self.assertNotIn("whisper_prep_encode_queue_depth 4", prom)
+            rss = [line for line in prom if line.startswith("whisper_prep_rss_bytes ")]
+            self.assertGreater(float(rss[0].split()[1]), 0)
+            self.assertEqual(list(Path(tmp, ".metrics").iterdir()), [])
+
+            with open(Path(tmp, "metrics.jsonl"), encoding="utf-8") as f:
+                snapshots = [json.loads(line) for line in f]
+            self.assertEqual(len(snapshots), 1)
+            counters = {name: value for name, _, value in snapshots[0]["counters"]}
+            self.assertEqual(counters["sources_done_total"], 10)
+
+    def test_writes_periodically_and_tracks_progress(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            writer = start_metrics(tmp, interval=3600)
+            inc("sources_done_total")
+            writer.write()
+            first = writer.last_progress
+            writer.write()
+            self.assertEqual(writer.last_progress, first)
+            inc("sources_done_total")
+            writer.write()
+            self.assertGreaterEqual(writer.last_progress, first)
+            stop_metrics()
+            with open(Path(tmp, "metrics.jsonl"), encoding="utf-8") as f:
+                # Three explicit writes and the final one.
+                self.assertEqual(len(f.readlines()), 4)
+
+    def test_rejects_non_positive_interval(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with self.assertRaises(ValueError):
+                start_metrics(tmp, interval=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,21 @@
 """Tests for Netflix-style SRT normalization."""
 
+import tempfile
 import unittest
+from pathlib import Path
+
 import pysubs2
-from whisper_prep.utils import fuse_until_limits
+from whisper_prep.utils import fuse_until_limits, netflix_normalize_files
+
+SRT = """1
+00:00:01,000 --> 00:00:04,000
+Hello
+
+2
+00:00:04,000 --> 00:00:08,000
+World
+
+"""
 
 
 class TestFuseUntilLimits(unittest.TestCase):
@@ -144,5 +157,43 @@ class TestFuseUntilLimits(unittest.TestCase):
         self.assertEqual(len(subs), 1)
 
 
+class TestNetflixNormalizeCache(unittest.TestCase):
+    """Test the non-destructive, cached normalization stage."""
+
+    def test_source_untouched_and_rerun_hits_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = Path(tmp, "episode.srt")
+            source.write_text(SRT, encoding="utf-8")
+            cache_dir = Path(tmp, "cache")
+
+            mapping = netflix_normalize_files([source], cache_dir=cache_dir)
+
+            self.assertEqual(source.read_text(encoding="utf-8"), SRT)
+            cached = Path(mapping[str(source)])
+            self.assertEqual(cached.parent, cache_dir)
+            subs = pysubs2.load(str(cached))
+            self.assertEqual(len(subs), 1)
+            self.assertEqual(subs[0].end, 8000)
+
+            mtime = cached.stat().st_mtime_ns
+            self.assertEqual(netflix_normalize_files([source], cache_dir=cache_dir), mapping)
+            self.assertEqual(cached.stat().st_mtime_ns, mtime)
+
+    def test_skip_words_change_the_cache_key(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = Path(tmp, "episode.srt")
+            source.write_text(SRT, encoding="utf-8")
+            cache_dir = Path(tmp, "cache")
+
+            merged = netflix_normalize_files([source], cache_dir=cache_dir)
+            kept = netflix_normalize_files(
+                [source], cache_dir=cache_dir, skip_words=["world"]
+            )
+
+            self.assertNotEqual(merged[str(source)], str(source))
+            # Nothing to merge: the source itself is used, no copy is written.
+            self.assertEqual(kept[str(source)], str(source))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,91 @@
+"""Tests for the cached stage DAG."""
+
+import tempfile
+import unittest
+from dataclasses import replace
+from pathlib import Path
+
+from whisper_prep.pipeline import Stage, run_pipeline
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.out = Path(self.tmp.name)
+        self.runs = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _stage(self, name, deps, key, render):
+        """A stage that writes render(config) to `<name>.txt`."""
+
+        def run(ctx):
+            self.runs.append(name)
+            Path(ctx.out_folder, f"{name}.txt").write_text(render(ctx.config))
+            return {}
+
+        return Stage(
+            name,
+            deps,
+            run,
+            lambda ctx: {key: ctx.config.get(key)},
+            outputs=lambda ctx: [Path(ctx.out_folder, f"{name}.txt")],
+        )
+
+    def _stages(self):
+        return [
+            self._stage("segment", [], "backend", lambda c: "records"),
+            self._stage("filter", ["segment"], "threshold", lambda c: str(c["threshold"])),
+            self._stage("export", ["filter"], "n_mels", lambda c: "hf"),
+        ]
+
+    def _run(self, config, **kwargs):
+        self.runs = []
+        run_pipeline(config, self.out, stages=self._stages(), **kwargs)
+        return self.runs
+
+    def test_reruns_only_stale_stages(self):
+        config = {"backend": "ffmpeg", "threshold": 2.4, "n_mels": 80}
+        self.assertEqual(self._run(config), ["segment", "filter", "export"])
+        self.assertEqual(self._run(config), [])
+
+        # A late-stage parameter only reruns that stage and what depends on it.
+        self.assertEqual(self._run({**config, "threshold": 2.0}), ["filter", "export"])
+        # A stage whose output is unchanged keeps its dependents up to date.
+        self.assertEqual(self._run({**config, "threshold": 2.0, "backend": "sox"}), ["segment"])
+
+        Path(self.out, "export.txt").unlink()
+        self.assertEqual(self._run({**config, "threshold": 2.0, "backend": "sox"}), ["export"])
+
+    def test_target_and_force(self):
+        config = {"backend": "ffmpeg", "threshold": 2.4, "n_mels": 80}
+        self.assertEqual(self._run(config, target="filter"), ["segment", "filter"])
+        self.assertFalse(Path(self.out, "export.txt").exists())
+        self.assertEqual(self._run(config, target="filter", force=True), ["filter"])
+        self.assertEqual(self._run(config), ["export"])
+        with self.assertRaises(ValueError):
+            self._run(config, target="upload")
+
+    def test_force_without_target_reruns_last_enabled_stage(self):
+        config = {"backend": "ffmpeg", "threshold": 2.4, "n_mels": 80}
+        # Like the webdataset stage under the default export_formats.
+        disabled = replace(
+            self._stage("webdataset", ["filter"], "n_mels", lambda c: ""),
+            enabled=lambda ctx: False,
+        )
+        stages = self._stages() + [disabled]
+        run_pipeline(config, self.out, stages=stages)
+        self.runs = []
+        run_pipeline(config, self.out, stages=stages, force=True)
+        self.assertEqual(self.runs, ["export"])
+
+    def test_work_queue_disables_cache(self):
+        config = {"backend": "ffmpeg", "threshold": 2.4, "work_queue": "queue"}
+        self._run(config)
+        self.assertEqual(self._run(config), ["segment", "filter", "export"])
+        self.assertFalse(Path(self.out, ".stages").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+"""Tests for the opt-in profiler hooks."""
+
+import pstats
+import tempfile
+import time
+import unittest
+from multiprocessing import Pool
+from pathlib import Path
+
+from whisper_prep.profiling import (
+    finish_profiling,
+    is_sampled,
+    profiled,
+    start_profiling,
+)
+
+
+def _busy_unit(key):
+    with profiled(key):
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            sum(range(1000))
+    return key
+
+
+class TestProfiling(unittest.TestCase):
+    def tearDown(self):
+        finish_profiling()
+
+    def test_cprofile_per_worker_and_merged(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            profiles_dir = start_profiling(tmp, mode="cprofile")
+            with profiled():
+                with Pool(2) as pool:
+                    pool.map(_busy_unit, [f"source{i}.mp3" for i in range(6)])
+                _busy_unit("parent.mp3")
+
+            merged = finish_profiling()
+            self.assertEqual(merged, Path(profiles_dir, "all.pstats"))
+            per_process = [p for p in profiles_dir.glob("*.pstats") if p != merged]
+            # The parent and at least one worker.
+            self.assertGreaterEqual(len(per_process), 2)
+            functions = {name for _, _, name in pstats.Stats(str(merged)).stats}
+            self.assertIn("_busy_unit", functions)
+
+    def test_sampling_writes_collapsed_stacks(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            profiles_dir = start_profiling(tmp, mode="sampling")
+            _busy_unit("source.mp3")
+            merged = finish_profiling()
+            self.assertEqual(merged, Path(profiles_dir, "all.collapsed"))
+            lines = merged.read_text(encoding="utf-8").splitlines()
+            self.assertTrue(lines)
+            stack, count = lines[0].rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+            self.assertTrue(any("_busy_unit" in line for line in lines))
+
+    def test_fraction_samples_by_key(self):
+        keys = [f"source{i}.mp3" for i in range(2000)]
+        share = sum(is_sampled(key, 0.1) for key in keys) / len(keys)
+        self.assertAlmostEqual(share, 0.1, delta=0.03)
+        self.assertTrue(all(is_sampled(key, 1.0) for key in keys))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            profiles_dir = start_profiling(tmp, mode="cprofile", fraction=0.1)
+            # Without a key only profiled if every unit is.
+            with profiled():
+                pass
+            self.assertEqual(list(profiles_dir.iterdir()), [])
+            unsampled = next(key for key in keys if not is_sampled(key, 0.1))
+            _busy_unit(unsampled)
+            self.assertEqual(list(profiles_dir.iterdir()), [])
+            sampled = next(key for key in keys if is_sampled(key, 0.1))
+            _busy_unit(sampled)
+            self.assertEqual(len(list(profiles_dir.glob("*.pstats"))), 1)
+
+    def test_rejects_invalid_options(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with self.assertRaises(ValueError):
+                start_profiling(tmp, mode="perf")
+            with self.assertRaises(ValueError):
+                start_profiling(tmp, fraction=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
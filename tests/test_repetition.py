@@ -0,0 +1,71 @@
+"""Tests for the rolling-hash repetition detection."""
+
+import random
+import unittest
+
+from whisper_prep.repetition import (
+    Run,
+    collapse_repeats,
+    find_repeats,
+    repetition_score,
+)
+
+
+def collapse_by_slices(tokens, max_n):
+    """Reference: compare list slices at every position and n."""
+    out, i = [], 0
+    while i < len(tokens):
+        j = i + 1
+        while j < len(tokens) and tokens[j] == tokens[i]:
+            j += 1
+        if j - i > 1:
+            out.append(tokens[i])
+            i = j
+            continue
+        for n in range(max_n, 1, -1):
+            if i + 2 * n <= len(tokens) and tokens[i : i + n] == tokens[i + n : i + 2 * n]:
+                k = i + n
+                while k + n <= len(tokens) and tokens[i : i + n] == tokens[k : k + n]:
+                    k += n
+                out.extend(tokens[i : i + n])
+                i = k
+                break
+        else:
+            out.append(tokens[i])
+            i += 1
+    return out
+
+
+class TestRepetition(unittest.TestCase):
+    def test_runs(self):
+        tokens = "a a a b c b c b c d e f d e f".split()
+        self.assertEqual(
+            find_repeats(tokens, max_n=3),
+            [Run(0, 1, 3), Run(3, 2, 3), Run(9, 3, 2)],
+        )
+        self.assertEqual(find_repeats(tokens, max_n=2), [Run(0, 1, 3), Run(3, 2, 3)])
+
+    def test_matches_slice_comparison(self):
+        rng = random.Random(0)
+        for _ in range(5000):
+            tokens = [rng.randrange(rng.randint(1, 4)) for _ in range(rng.randint(0, 40))]
+            max_n = rng.randint(1, 10)
+            self.assertEqual(
+                collapse_repeats(tokens, max_n), collapse_by_slices(tokens, max_n)
+            )
+
+    def test_long_periods(self):
+        phrase = [f"w{i}" for i in range(40)]
+        tokens = ["start"] + phrase * 5 + ["end"]
+        self.assertEqual(find_repeats(tokens, max_n=50), [Run(1, 40, 5)])
+        self.assertEqual(collapse_repeats(tokens, max_n=50), ["start"] + phrase + ["end"])
+        self.assertEqual(find_repeats(tokens, max_n=39), [])
+
+    def test_score(self):
+        self.assertEqual(repetition_score([]), 0.0)
+        self.assertEqual(repetition_score("a b c".split()), 0.0)
+        self.assertAlmostEqual(repetition_score("ja ja ja ja".split()), 0.75)
+
+
+if __name__ == "__main__":
+    unittest.main()
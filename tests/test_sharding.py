@@ -0,0 +1,58 @@
+"""Tests for static sharding helpers."""
+
+import tempfile
+import unittest
+from pathlib import Path
+
+from whisper_prep.dataset.manifest import load_transcripts_manifest
+from whisper_prep.sharding import _concat_files, in_shard, shard_folder, shard_spec
+
+
+class TestShardSpec(unittest.TestCase):
+    def test_defaults_and_validation(self):
+        self.assertEqual(shard_spec({}), (1, 0))
+        self.assertEqual(shard_spec({"num_shards": 4, "shard_index": 3}), (4, 3))
+        with self.assertRaises(ValueError):
+            shard_spec({"num_shards": 4, "shard_index": 4})
+
+    def test_shard_folder_and_partition(self):
+        self.assertEqual(
+            shard_folder("/out", 8, 3), Path("/out/shards/00003-of-00008")
+        )
+        owners = [[i for i in range(3) if in_shard(n, 3, i)] for n in range(7)]
+        self.assertEqual(owners, [[0], [1], [2], [0], [1], [2], [0]])
+
+
+class TestShardOutputs(unittest.TestCase):
+    def test_transcripts_rows_are_partitioned(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tsv = Path(tmp, "transcripts.tsv")
+            rows = "".join(f"/x/{i}.srt\t/x/{i}.mp3\n" for i in range(5))
+            tsv.write_text("srt_path\taudio_path\n" + rows, encoding="utf-8")
+
+            shards = [
+                list(load_transcripts_manifest(tsv, num_shards=2, shard_index=i)["id"])
+                for i in range(2)
+            ]
+
+            self.assertEqual(shards, [["0", "2", "4"], ["1", "3"]])
+
+    def test_reports_keep_one_header(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            parts = []
+            for i in range(2):
+                part = Path(tmp, f"{i}.csv")
+                part.write_text(f"\ttext\n{i}\tsample {i}\n", encoding="utf-8")
+                parts.append(part)
+            merged = Path(tmp, "merged.csv")
+
+            _concat_files(parts, merged, header=True)
+
+            self.assertEqual(
+                merged.read_text(encoding="utf-8"),
+                "\ttext\n0\tsample 0\n1\tsample 1\n",
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+Tests that the compiled text normalizer matches the one-replacement-per-entry semantics
+of the abbreviation, character and currency tables.
+"""
+
+import random
+import re
+import unittest
+
+from whisper_prep.generation.text_normalizer import (
+    ABBREVIATIONS,
+    REPLACEMENTS,
+    SwissNumberConverter,
+    TextNormalizer,
+    normalize_abbrv,
+    normalize_many,
+    normalize_text,
+    standardize_text,
+)
+
+
+def sequential_abbrv(text):
+    for abbr, full in ABBREVIATIONS.items():
+        pattern = re.compile(rf"(^|\s)({re.escape(abbr)})(?=\s|$)", re.IGNORECASE)
+        text = pattern.sub(lambda m: m.group(1) + full, text)
+    return text
+
+
+def sequential_replace(text, replacements):
+    for original, replacement in replacements.items():
+        text = text.replace(original, replacement)
+    return text
+
+
+class TestCompiledNormalizer(unittest.TestCase):
+    def setUp(self):
+        self.converter = SwissNumberConverter()
+        self.atoms = (
+            list(ABBREVIATIONS)
+            + [abbr.upper() for abbr in ABBREVIATIONS]
+            + list(REPLACEMENTS)
+            + list(self.converter.currency_map)
+            + [" ", "  ", "\n", "1", "000", ",", "'", "a", "US", "SG", "CH", "CL", "-"]
+        )
+
+    def random_texts(self, n):
+        rng = random.Random(0)
+        for _ in range(n):
+            yield "".join(rng.choice(self.atoms) for _ in range(rng.randint(1, 10)))
+
+    def test_abbreviations_match_one_pass_per_entry(self):
+        for text in self.random_texts(5000):
+            self.assertEqual(normalize_abbrv(text), sequential_abbrv(text), text)
+
+    def test_replacements_match_one_replace_per_entry(self):
+        for text in self.random_texts(5000):
+            self.assertEqual(
+                standardize_text(text),
+                re.sub(
+                    r"[\u00A0\u202F\u200B\u200C\u200D\u2060]+",
+                    " ",
+                    sequential_replace(text, REPLACEMENTS),
+                ),
+                text,
+            )
+            self.assertEqual(
+                self.converter.replace_currencies(text),
+                sequential_replace(text, self.converter.currency_map),
+                text,
+            )
+
+    def test_cascading_replacements(self):
+        # Outputs that form keys of later entries are replaced again.
+        self.assertEqual(self.converter.replace_currencies("SGUSD"), "Dollarollar")
+        self.assertEqual(self.converter.replace_currencies("CH₣"), "Frankenranken")
+        self.assertEqual(standardize_text("•-"), "--")
+        self.assertEqual(standardize_text("–-"), "-")
+
+    def test_normalizer_object(self):
+        normalizer = TextNormalizer()
+        text = "Hallo [remove]Test z.B. 150 000 €"
+        self.assertEqual(normalizer(text), normalize_text(text))
+        self.assertEqual(normalizer(text), "Hallo Test zum Beispiel 150'000 Euro")
+
+
+class TestNormalizeMany(unittest.TestCase):
+    texts = ["z.B. 1000 €", "Hallo [x]Welt", "z.B. 1000 €", "ca. 3,5 %", "Hallo [x]Welt"]
+
+    def test_matches_normalize_text_in_order(self):
+        expected = [normalize_text(text) for text in self.texts]
+        self.assertEqual(normalize_many(self.texts), expected)
+        self.assertEqual(normalize_many(iter(self.texts), n_jobs=2, chunksize=1), expected)
+
+    def test_empty(self):
+        self.assertEqual(normalize_many([], n_jobs=2), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+"""Tests for the WebDataset tar shard export."""
+
+import json
+import tarfile
+import tempfile
+import unittest
+from pathlib import Path
+
+from whisper_prep.dataset.webdataset import export_webdataset, merge_indexes
+
+
+class TestWebDatasetExport(unittest.TestCase):
+    def _write_records(self, folder, n):
+        path = Path(folder, "accepted.ljson")
+        with open(path, "w", encoding="utf-8") as f:
+            for i in range(n):
+                audio = Path(folder, "dump", "speech", f"{i * 30000}.mp3")
+                audio.parent.mkdir(parents=True, exist_ok=True)
+                audio.write_bytes(bytes([i]) * 1000)
+                record = {
+                    "audio": {"path": str(audio), "bytes": None},
+                    "text": f"<|0.00|> Satz {i}.<|2.00|>",
+                    "language": "de",
+                    "prompt": "",
+                }
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return path
+
+    def test_packs_records_into_sequential_shards(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            records = self._write_records(tmp, 5)
+            out = Path(tmp, "webdataset")
+            index = export_webdataset(records, out, shard_max_records=2)
+
+            self.assertEqual(index["records"], 5)
+            names = [shard["name"] for shard in index["shards"]]
+            self.assertEqual(
+                names, ["shard-000000.tar", "shard-000001.tar", "shard-000002.tar"]
+            )
+            self.assertEqual([shard["records"] for shard in index["shards"]], [2, 2, 1])
+            with open(Path(out, "index.json"), encoding="utf-8") as f:
+                self.assertEqual(json.load(f), index)
+            self.assertEqual(
+                sorted(p.name for p in out.iterdir()), sorted(names + ["index.json"])
+            )
+
+            with tarfile.open(Path(out, "shard-000001.tar")) as tar:
+                self.assertEqual(
+                    tar.getnames(),
+                    ["000000002.mp3", "000000002.json", "000000003.mp3", "000000003.json"],
+                )
+                audio = tar.extractfile("000000002.mp3").read()
+                self.assertEqual(audio, bytes([2]) * 1000)
+                metadata = json.load(tar.extractfile("000000003.json"))
+            self.assertEqual(metadata["text"], "<|0.00|> Satz 3.<|2.00|>")
+            self.assertEqual(metadata["language"], "de")
+            self.assertTrue(metadata["audio_path"].endswith("90000.mp3"))
+
+    def test_size_limit_and_reexport(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            records = self._write_records(tmp, 4)
+            out = Path(tmp, "webdataset")
+            export_webdataset(records, out, shard_max_records=1)
+            # ~1 KB per record, so the size limit closes a shard after every record.
+            index = export_webdataset(records, out, shard_size_mb=0.0005)
+            self.assertEqual(len(index["shards"]), 4)
+            self.assertEqual(len(list(out.glob("*.tar"))), 4)
+
+            first = Path(tmp, "first")
+            export_webdataset(records, first, key_prefix="00000-")
+            merged = merge_indexes([first, out], Path(tmp, "merged"))
+            self.assertEqual(merged["records"], 8)
+            self.assertEqual(merged["shards"][0]["name"], "../first/shard-000000.tar")
+            self.assertEqual(merged["shards"][0]["first_key"], "00000-000000000")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+"""Tests for the file-system work queue."""
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from multiprocessing import Pool
+from pathlib import Path
+from unittest import mock
+
+from whisper_prep import workqueue
+from whisper_prep.workqueue import WorkQueue
+
+
+def _drain(queue_dir, lease_timeout=600.0):
+    queue = WorkQueue(queue_dir, lease_timeout=lease_timeout, poll_interval=0.01)
+    done = []
+    for lease in queue.leases():
+        with lease:
+            lease.commit({"square": lease.unit["n"] ** 2, "pid": os.getpid()})
+        done.append(lease.unit["n"])
+    return done
+
+
+class TestWorkQueue(unittest.TestCase):
+    def test_processes_share_units(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            queue = WorkQueue(tmp, poll_interval=0.01)
+            self.assertTrue(queue.populate(lambda: ({"n": n} for n in range(50))))
+            # A second populate (e.g. another node) does not enqueue again.
+            self.assertFalse(queue.populate(lambda: ({"n": n} for n in range(50))))
+
+            with Pool(4) as pool:
+                done = pool.map(_drain, [tmp] * 4)
+
+            self.assertEqual(sorted(n for part in done for n in part), list(range(50)))
+            squares = [result["square"] for result in queue.results()]
+            self.assertEqual(squares, [n**2 for n in range(50)])
+
+    def test_expired_lease_is_reclaimed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            queue = WorkQueue(tmp, lease_timeout=0.2, poll_interval=0.01)
+            queue.populate(lambda: [{"n": 1}])
+
+            # A worker leases the unit and dies without heartbeat or commit.
+            crashed = next(queue.leases())
+            self.assertTrue(crashed.path.exists())
+            time.sleep(0.3)
+
+            self.assertEqual(_drain(tmp, lease_timeout=0.2), [1])
+            self.assertEqual([r["square"] for r in queue.results()], [1])
+
+    def test_interrupted_requeue_is_reclaimed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            queue = WorkQueue(tmp, lease_timeout=0.2, poll_interval=0.01)
+            queue.populate(lambda: [{"n": 1}])
+
+            # A worker claimed the expired lease for requeueing and died: the unit stays
+            # in leased/ under the claim's name until that expires as well.
+            crashed = next(queue.leases())
+            os.rename(crashed.path, Path(tmp, "leased", "000000000.123.abc"))
+            time.sleep(0.3)
+
+            self.assertEqual(_drain(tmp, lease_timeout=0.2), [1])
+            self.assertFalse(list(Path(tmp, "leased").iterdir()))
+
+    def test_unit_requeued_during_the_drain_check_is_processed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            queue = WorkQueue(tmp, poll_interval=0.01)
+            queue.populate(lambda: [{"n": 1}])
+            # Another worker holds the unit as a claim for requeueing...
+            lease = queue._try_lease()
+            claimed = Path(tmp, "leased", "000000000.123.abc")
+            os.rename(lease.path, claimed)
+
+            listdir = os.listdir
+            todo_listings = []
+
+            def requeue_after_second_todo_listing(path):
+                names = listdir(path)
+                if Path(path).name == "todo":
+                    todo_listings.append(names)
+                    if len(todo_listings) == 2:
+                        # ...and moves it into todo/ right after this listing.
+                        os.rename(claimed, Path(tmp, "todo", "000000000.json"))
+                return names
+
+            with mock.patch.object(
+                workqueue.os, "listdir", requeue_after_second_todo_listing
+            ):
+                self.assertEqual(_drain(tmp), [1])
+            self.assertEqual([r["square"] for r in queue.results()], [1])
+
+    def test_slow_population_does_not_stall_waiting_workers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            waiting = []
+
+            def wait_for_queue():
+                queue = WorkQueue(tmp, lease_timeout=0.2, poll_interval=0.01)
+                waiting.append(queue.populate(lambda: []))
+
+            waiter = threading.Thread(target=wait_for_queue)
+
+            def slow_units():
+                waiter.start()
+                # Longer than the lease timeout before the first unit.
+                time.sleep(0.5)
+                yield {"n": 1}
+
+            queue = WorkQueue(tmp, lease_timeout=0.2, poll_interval=0.01)
+            self.assertTrue(queue.populate(slow_units))
+            waiter.join()
+            self.assertEqual(waiting, [False])
+
+    def test_failing_unit_gives_up_after_max_attempts(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            queue = WorkQueue(tmp, poll_interval=0.01, max_attempts=2)
+            queue.populate(lambda: [{"n": 1}])
+
+            for _ in range(2):
+                with self.assertRaises(RuntimeError):
+                    for lease in queue.leases():
+                        with lease:
+                            raise RuntimeError("worker crashed")
+
+            self.assertEqual(list(queue.leases()), [])
+            self.assertEqual(queue.failed(), [{"n": 1}])
+            self.assertFalse(list(Path(tmp, "todo").iterdir()))
+
+
+if __name__ == "__main__":
+    unittest.main()